@@ -0,0 +1,59 @@
+"""
+Compare two benchmark result files produced by benchmarks.run.
+
+    python -m benchmarks.compare baseline.json results.json
+"""
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Iterator
+
+
+def flattened(results: dict[str, Any], prefix: str = "") -> Iterator[tuple[str, float]]:
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flattened(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def compared(baseline: dict[str, Any], current: dict[str, Any]) -> list[str]:
+    before = dict(flattened({k: v for k, v in baseline.items() if k != "meta"}))
+    after = dict(flattened({k: v for k, v in current.items() if k != "meta"}))
+    width = max(map(len, before.keys() | after.keys()), default=0)
+    lines = []
+    for key in sorted(before.keys() | after.keys()):
+        old, new = before.get(key), after.get(key)
+        if old is None or new is None:
+            change = "n/a"
+        elif old == 0:
+            change = "same" if new == 0 else "new"
+        else:
+            change = f"{(new - old) / old:+.1%}"
+        lines.append(f"{key:<{width}}  {fmt(old):>12}  {fmt(new):>12}  {change:>8}")
+    return lines
+
+
+def fmt(value: float | None) -> str:
+    if value is None:
+        return "-"
+    return f"{value:.4g}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("current", type=Path)
+    args = parser.parse_args()
+    print(
+        "\n".join(
+            compared(
+                json.loads(args.baseline.read_text()),
+                json.loads(args.current.read_text()),
+            )
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import collections
+import dataclasses
+
+from aiohttp import web
+
+
+@dataclasses.dataclass
+class FakeIssue:
+    number: int
+    title: str
+    body: str
+    state: str = "open"
+    comments: list[str] = dataclasses.field(default_factory=list)
+
+
+class FakeForge:
+    """
+    In-process stand-in for the Gitea and GitHub issue APIs, as used
+    by GiteaVcs, GithubVcs and GithubGraphqlVcs. It keeps issues in memory
+    and counts every call, so benchmarks can report API calls per puzzle.
+    GraphQL requests are told apart by their ``operationName`` rather than
+    by parsing the query. While ``down`` is set every call gets a 503.
+    ``forks`` maps the full name of a fork to that of its parent, for the
+    GitHub repository API.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host: str = host
+        self.port: int = port
+        self.issues: dict[str, dict[int, FakeIssue]] = collections.defaultdict(dict)
+        self.calls: collections.Counter[str] = collections.Counter()
+        self.down: bool = False
+        self.forks: dict[str, str] = {}
+        self._runner: web.AppRunner | None = None
+
+    async def __aenter__(self) -> "FakeForge":
+        app = web.Application(middlewares=[self._outage])
+        app.add_routes(
+            [
+                web.get("/api/{owner}/{repo}/issues/{number}", self.issue),
+                web.post("/api/{owner}/{repo}/issues", self.create_issue),
+                web.patch("/api/{owner}/{repo}/issues/{number}", self.edit_issue),
+                web.post(
+                    "/api/{owner}/{repo}/issues/{number}/comments", self.add_comment
+                ),
+                web.post("/api/graphql", self.graphql),
+                web.get("/repos/{owner}/{repo}", self.repository),
+            ]
+        )
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._runner.cleanup()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    @web.middleware
+    async def _outage(self, request: web.Request, handler) -> web.StreamResponse:
+        if self.down:
+            self.calls["unavailable"] += 1
+            raise web.HTTPServiceUnavailable()
+        return await handler(request)
+
+    async def issue(self, request: web.Request) -> web.Response:
+        self.calls["issue"] += 1
+        issue = self._find(request)
+        return web.json_response(self._issue_json(issue))
+
+    async def create_issue(self, request: web.Request) -> web.Response:
+        self.calls["create_issue"] += 1
+        payload = await request.json()
+        issues = self.issues[self._repo(request)]
+        issue = FakeIssue(len(issues) + 1, payload["title"], payload["body"])
+        issues[issue.number] = issue
+        return web.json_response(self._issue_json(issue), status=201)
+
+    async def edit_issue(self, request: web.Request) -> web.Response:
+        self.calls["close_issue"] += 1
+        issue = self._find(request)
+        issue.state = (await request.json()).get("state", issue.state)
+        return web.json_response(self._issue_json(issue), status=201)
+
+    async def add_comment(self, request: web.Request) -> web.Response:
+        self.calls["add_comment"] += 1
+        issue = self._find(request)
+        issue.comments.append((await request.json())["body"])
+        return web.json_response({"id": len(issue.comments)}, status=201)
+
+    async def repository(self, request: web.Request) -> web.Response:
+        self.calls["repository"] += 1
+        repo = self._repo(request)
+        body: dict = {"full_name": repo, "fork": repo in self.forks}
+        if repo in self.forks:
+            parent = self.forks[repo]
+            body["parent"] = {
+                "full_name": parent,
+                "ssh_url": f"git@{self.host}:{parent}.git",
+            }
+        return web.json_response(body)
+
+    async def graphql(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        operation, variables = payload["operationName"], payload["variables"]
+        self.calls[f"graphql.{operation}"] += 1
+        if operation == "Repository":
+            repo = f"{variables['owner']}/{variables['name']}"
+            return web.json_response({"data": {"repository": {"id": f"R:{repo}"}}})
+        if operation == "Issues":
+            repo = f"{variables['owner']}/{variables['name']}"
+            found = {
+                alias: (
+                    self._node_json(repo, self.issues[repo][number])
+                    if number in self.issues[repo]
+                    else None
+                )
+                for alias, number in variables.items()
+                if alias not in ("owner", "name")
+            }
+            return web.json_response({"data": {"repository": found}})
+        if operation == "CreateIssue":
+            repo = variables["repository"].removeprefix("R:")
+            issues = self.issues[repo]
+            issue = FakeIssue(len(issues) + 1, variables["title"], variables["body"])
+            issues[issue.number] = issue
+            return web.json_response(
+                {"data": {"createIssue": {"issue": self._node_json(repo, issue)}}}
+            )
+        repo, _, number = variables["issue"].removeprefix("I:").rpartition("#")
+        issue = self.issues[repo].get(int(number))
+        if issue is None:
+            return web.json_response({"errors": [{"message": "Not found"}]})
+        if operation in ("CloseIssue", "CloseWithComment"):
+            issue.state = "closed"
+        if operation in ("AddComment", "CloseWithComment"):
+            issue.comments.append(variables["body"])
+        return web.json_response({"data": {}})
+
+    def _find(self, request: web.Request) -> FakeIssue:
+        try:
+            return self.issues[self._repo(request)][int(request.match_info["number"])]
+        except (KeyError, ValueError):
+            raise web.HTTPNotFound()
+
+    @staticmethod
+    def _repo(request: web.Request) -> str:
+        return f"{request.match_info['owner']}/{request.match_info['repo']}"
+
+    @staticmethod
+    def _issue_json(issue: FakeIssue) -> dict:
+        return {
+            "id": issue.number,
+            "number": issue.number,
+            "title": issue.title,
+            "body": issue.body,
+            "state": issue.state,
+            "user": {"id": 1, "login": "onepdd"},
+        }
+
+    def _node_json(self, repo: str, issue: FakeIssue) -> dict:
+        return {
+            "id": f"I:{repo}#{issue.number}",
+            "number": issue.number,
+            "url": f"{self.url}/{repo}/issues/{issue.number}",
+            "state": issue.state.upper(),
+            "author": {"login": "onepdd", "databaseId": 1},
+        }
@@ -0,0 +1,322 @@
+"""
+Load test of the webhook endpoints with a fake forge behind them.
+
+    python -m benchmarks.load --repos 10 --rate 20 --duration 30 --output load.json
+
+Fires signed Gitea and GitHub push payloads for synthetic repositories at
+``/hook/gitea`` and ``/hook/github`` at a fixed rate, whether or not the
+earlier ones have been answered, and reports throughput, latency
+percentiles and errors per hook. Latency counts from when a request was
+due, so a node that falls behind the rate shows it. Requests go straight
+to the ASGI app, without a server in between.
+
+By default a push names the commit the repository is at, so after the
+first deploy of a repository its pushes are skipped as unchanged; with
+``--new-commits`` every push names a new commit and is a full deploy.
+
+Requires ``git`` and ``gopdd`` on the PATH.
+"""
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import hashlib
+import hmac
+import json
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+from benchmarks.fake_forge import FakeForge
+from benchmarks.run import revision
+from benchmarks.synthetic import git, make_repo
+from onepdd.app import make_app
+from onepdd.config import Config, Tenant
+
+SECRET = "load-secret"
+HOOKS = ("gitea", "github")
+
+
+@dataclasses.dataclass
+class Push:
+    hook: str
+    name: str
+    uri: str
+    head: str
+
+
+@dataclasses.dataclass
+class Outcome:
+    hook: str
+    status: int
+    seconds: float
+
+
+def fixtures(
+    workdir: Path, hooks: list[str], repos: int, files: int, puzzles: int
+) -> list[Push]:
+    """
+    One synthetic repository per hook and index, each with its own seed.
+    """
+    pushes = []
+    for hook in hooks:
+        for i in range(repos):
+            path = make_repo(workdir / hook / str(i), files, puzzles, seed=i)
+            pushes.append(
+                Push(
+                    hook,
+                    f"load/{hook}-{i}",
+                    path.as_uri(),
+                    git(path, "rev-parse", "HEAD").strip(),
+                )
+            )
+    return pushes
+
+
+def payload(push: Push, forge: FakeForge, head: str) -> bytes:
+    return json.dumps(
+        {
+            "repository": {
+                "id": push.name,
+                "name": push.name.split("/")[1],
+                "full_name": push.name,
+                "html_url": f"{forge.url}/{push.name}",
+                "ssh_url": push.uri,
+                "clone_url": push.uri,
+                "default_branch": "master",
+            },
+            "ref": "refs/heads/master",
+            "after": head,
+        }
+    ).encode()
+
+
+def signed(hook: str, body: bytes, secret: str) -> tuple[bytes, bytes]:
+    """
+    The signature header the forge sends, lowercased as servers hand
+    headers to ASGI apps.
+    """
+    digest = hmac.new(secret.encode(), body, "sha256").hexdigest()
+    if hook == "github":
+        return b"x-hub-signature-256", f"sha256={digest}".encode()
+    return b"x-gitea-signature", digest.encode()
+
+
+async def post(app: Any, path: str, body: bytes, headers: list) -> int:
+    """
+    Send one POST request through the ASGI app and return its status.
+    """
+    sent, status = False, 0
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            await asyncio.Event().wait()
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message: dict):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), *headers],
+        "client": ("127.0.0.1", 0),
+        "server": ("127.0.0.1", 80),
+    }
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        return status or 500
+    return status
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Any) -> AsyncIterator[None]:
+    """
+    Run the startup and shutdown handlers of the app around the block.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    replies: asyncio.Queue = asyncio.Queue()
+    await events.put({"type": "lifespan.startup"})
+    task = asyncio.create_task(
+        app({"type": "lifespan", "asgi": {"version": "3.0"}}, events.get, replies.put)
+    )
+    await replies.get()
+    try:
+        yield
+    finally:
+        await events.put({"type": "lifespan.shutdown"})
+        await replies.get()
+        await task
+
+
+async def fire(
+    app: Any,
+    forge: FakeForge,
+    pushes: list[Push],
+    rate: float,
+    duration: float,
+    new_commits: bool,
+    secret: str,
+) -> tuple[list[Outcome], float]:
+    """
+    Send ``rate`` pushes a second for ``duration`` seconds, going round
+    the repositories, and wait for all of them to be answered.
+    """
+
+    async def one(push: Push, head: str, due: float) -> Outcome:
+        body = payload(push, forge, head)
+        status = await post(
+            app, f"/hook/{push.hook}", body, [signed(push.hook, body, secret)]
+        )
+        return Outcome(push.hook, status, time.perf_counter() - due)
+
+    tasks = []
+    start = time.perf_counter()
+    for n in range(round(rate * duration)):
+        due = start + n / rate
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        push = pushes[n % len(pushes)]
+        head = (
+            hashlib.sha1(f"{push.name}-{n}".encode()).hexdigest()
+            if new_commits
+            else push.head
+        )
+        tasks.append(asyncio.create_task(one(push, head, due)))
+    outcomes = await asyncio.gather(*tasks)
+    return list(outcomes), time.perf_counter() - start
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def at(q: float) -> float:
+        return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+    return {
+        "p50": at(0.5),
+        "p90": at(0.9),
+        "p99": at(0.99),
+        "max": ordered[-1],
+    }
+
+
+def report(outcomes: list[Outcome], elapsed: float) -> dict[str, Any]:
+    hooks = {}
+    for hook in sorted({o.hook for o in outcomes}):
+        mine = [o for o in outcomes if o.hook == hook]
+        ok = [o for o in mine if 200 <= o.status < 300]
+        hooks[hook] = {
+            "requests": len(mine),
+            "ok": len(ok),
+            "errors": dict(
+                Counter(str(o.status) for o in mine if not 200 <= o.status < 300)
+            ),
+            "error_rate": 1 - len(ok) / len(mine),
+            "per_second": len(ok) / elapsed,
+            "latency_seconds": percentiles([o.seconds for o in ok]),
+        }
+    return hooks
+
+
+def load_config(forge: FakeForge, storage: Path) -> Config:
+    return Config(
+        id_rsa="",
+        storage=storage,
+        gitea_token="load",
+        gitea_host=forge.url,
+        gitea_secret_key=SECRET,
+        tenants=[
+            Tenant(
+                name="github",
+                vcs="github",
+                host=forge.url,
+                token="load",
+                secret_key=SECRET,
+            )
+        ],
+    )
+
+
+async def run(
+    hooks: list[str],
+    repos: int,
+    files: int,
+    puzzles: int,
+    rate: float,
+    duration: float,
+    new_commits: bool = False,
+    secret: str = SECRET,
+) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        pushes = fixtures(workdir / "repos", hooks, repos, files, puzzles)
+        async with FakeForge() as forge:
+            app = make_app(load_config(forge, workdir / "storage"))
+            async with lifespan(app):
+                outcomes, elapsed = await fire(
+                    app, forge, pushes, rate, duration, new_commits, secret
+                )
+            return {
+                "meta": {
+                    "revision": revision(),
+                    "repos": repos,
+                    "files": files,
+                    "puzzles": puzzles,
+                    "rate": rate,
+                    "duration": duration,
+                    "new_commits": new_commits,
+                    "elapsed": elapsed,
+                },
+                "hooks": report(outcomes, elapsed),
+                "api_calls": dict(forge.calls),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--hooks", nargs="+", choices=HOOKS, default=list(HOOKS))
+    parser.add_argument("--repos", type=int, default=10, help="per hook")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--puzzles", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=10, help="pushes a second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--new-commits", action="store_true")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    results = json.dumps(
+        asyncio.run(
+            run(
+                args.hooks,
+                args.repos,
+                args.files,
+                args.puzzles,
+                args.rate,
+                args.duration,
+                args.new_commits,
+            )
+        ),
+        indent=2,
+    )
+    if args.output:
+        args.output.write_text(results)
+    print(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Replay captured webhooks offline through Puzzles.deploy.
+
+    python -m benchmarks.replay record --hook gitea --payload push.json \\
+        --checkout ~/src/repo >> capture.jsonl
+    python -m benchmarks.replay run capture.jsonl --output replay.json
+
+A capture is a JSON lines file, one push per line:
+
+    {"hook": "gitea", "payload": {...webhook body...}, "gopdd": [...]}
+
+where ``gopdd`` is the output of ``gopdd -v`` at the pushed commit. Every
+push is deployed against a dry-run forge, in order, with the state of each
+repository carried over from its previous pushes. Nothing is cloned and no
+request leaves the process. The report has the deploy timings, the
+throughput and the ticket operations that would have been performed.
+"""
+import argparse
+import asyncio
+import collections
+import dataclasses
+import json
+import shlex
+import time
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel, TypeAdapter
+from starlette.templating import Jinja2Templates
+
+from benchmarks.run import TEMPLATES, summary
+from onepdd.exc import OnePddError
+from onepdd.hooks.gitea import GiteaHookBody
+from onepdd.hooks.github import GithubHookBody
+from onepdd.puzzles import Puzzles
+from onepdd.repo import GitRepo, GopddPuzzle
+from onepdd.storage import MemoryStorage
+from onepdd.tickets import TicketsSimple
+from onepdd.util import exec_cmd_shell
+from onepdd.vcs import DryRunVcs, Issue, IssueAuthor, Operation, Vcs
+
+BODIES: dict[str, type[BaseModel]] = {
+    "gitea": GiteaHookBody,
+    "github": GithubHookBody,
+}
+
+
+class RecordedRepo(GitRepo):
+    """
+    A repository whose scan returns the recorded gopdd output.
+    """
+
+    def __init__(self, name: str, puzzles: list[GopddPuzzle], **kwargs):
+        super().__init__(uri=f"replay://{name}", name=name, **kwargs)
+        self.puzzles: list[GopddPuzzle] = puzzles
+
+    @property
+    def config(self) -> dict[str, Any]:
+        return {}
+
+    async def parsed(self) -> list[GopddPuzzle]:
+        return self.puzzles
+
+
+class OfflineWriteError(OnePddError):
+    pass
+
+
+class OfflineVcs(Vcs):
+    """
+    A forge on which every issue is still open. Only reads ever reach it,
+    DryRunVcs takes care of the rest; a write that gets here anyway fails
+    with OfflineWriteError.
+    """
+
+    def __init__(self, repo: GitRepo, name: str):
+        self.repo = repo
+        self.name = name
+        self.host = "https://replay.invalid"
+
+    async def issue(self, issue_id: str) -> Issue:
+        return Issue(
+            author=IssueAuthor(id="", username=""),
+            href=f"{self.host}/{self.repo.name}/issues/{issue_id}",
+            number=issue_id,
+            closed=False,
+        )
+
+    def puzzle_link_for_commit(self, sha: str, file: str, start: str, stop: str) -> str:
+        return f"{self.host}/{self.repo.name}/src/{sha}/{file}#L{start}-L{stop}"
+
+    async def add_comment(self, issue_id: str, msg: str):
+        self._refuse("add_comment")
+
+    async def create_issue(self, title: str, body: str) -> Issue | None:
+        self._refuse("create_issue")
+
+    async def close_issue(self, issue_id: str):
+        self._refuse("close_issue")
+
+    def _refuse(self, operation: str):
+        raise OfflineWriteError(
+            f"Replay of {self.repo.name} is offline: {operation} must go "
+            f"through DryRunVcs, not reach the forge"
+        )
+
+
+async def replay(records: list[dict[str, Any]]) -> dict[str, Any]:
+    templates = Jinja2Templates(TEMPLATES)
+    storages: dict[str, MemoryStorage] = {}
+    operations: list[Operation] = []
+    durations: list[float] = []
+    start = time.perf_counter()
+    for record in records:
+        body = BODIES[record["hook"]].model_validate(record["payload"])
+        repo = RecordedRepo(
+            body.repository.full_name,
+            TypeAdapter(list[GopddPuzzle]).validate_python(record["gopdd"]),
+            master=body.repository.default_branch,
+            head_commit_hash=body.head or body.repository.default_branch,
+        )
+        storage = storages.setdefault(repo.name, MemoryStorage())
+        began = time.perf_counter()
+        await Puzzles(repo, storage).deploy(
+            TicketsSimple(
+                DryRunVcs(OfflineVcs(repo, record["hook"]), operations), templates
+            )
+        )
+        durations.append(time.perf_counter() - began)
+    took = time.perf_counter() - start
+    return {
+        "pushes": len(records),
+        "repos": len(storages),
+        "seconds": took,
+        "pushes_per_second": len(records) / took if took else None,
+        "deploy_seconds": summary(durations) if durations else None,
+        "operations": dict(collections.Counter(op.method for op in operations)),
+        "log": [dataclasses.asdict(op) for op in operations],
+    }
+
+
+async def record(hook: str, payload: Path, checkout: Path) -> dict[str, Any]:
+    return {
+        "hook": hook,
+        "payload": json.loads(payload.read_text()),
+        "gopdd": json.loads(
+            await exec_cmd_shell(f"cd {shlex.quote(str(checkout))} && gopdd -v")
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    rec = commands.add_parser("record", help="print one capture line")
+    rec.add_argument("--hook", choices=sorted(BODIES), default="gitea")
+    rec.add_argument("--payload", type=Path, required=True)
+    rec.add_argument("--checkout", type=Path, required=True)
+    run = commands.add_parser("run", help="replay a capture file")
+    run.add_argument("capture", type=Path)
+    run.add_argument("--output", type=Path)
+    run.add_argument("--no-log", action="store_true", help="omit the operations")
+    args = parser.parse_args()
+    if args.command == "record":
+        print(json.dumps(asyncio.run(record(args.hook, args.payload, args.checkout))))
+        return
+    records = [
+        json.loads(line) for line in args.capture.read_text().splitlines() if line
+    ]
+    report = asyncio.run(replay(records))
+    if args.no_log:
+        del report["log"]
+    results = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(results)
+    print(results)
+
+
+if __name__ == "__main__":
+    main()
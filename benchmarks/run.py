@@ -0,0 +1,222 @@
+"""
+End-to-end benchmarks on synthetic repositories against a fake forge.
+
+    python -m benchmarks.run --files 200 --puzzles 100 --output results.json
+    python -m benchmarks.compare baseline.json results.json
+
+Requires ``git`` and ``gopdd`` on the PATH.
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from aiohttp import ClientSession
+from starlette.requests import Request
+from starlette.templating import Jinja2Templates
+
+from benchmarks.fake_forge import FakeForge
+from benchmarks.synthetic import make_repo
+from onepdd.config import Config
+from onepdd.deploy import Deployer
+from onepdd.hooks.gitea import GiteaHookBody, GiteaVcs, HookGitea
+from onepdd.puzzles import Puzzles
+from onepdd.repo import GitRepo
+from onepdd.storage import SimpleFsStorage, Storage
+from onepdd.tickets import TicketsSimple
+
+TEMPLATES = Path(__file__).parent.parent / "templates"
+REPO_NAME = "bench/synthetic"
+SECRET = "benchmark-secret"
+
+
+class CountingStorage(Storage):
+    def __init__(self, origin: SimpleFsStorage):
+        self.origin: SimpleFsStorage = origin
+        self.saves: int = 0
+        self.bytes_written: int = 0
+
+    async def save(self, data: list[dict[str, Any]]):
+        await self.origin.save(data)
+        self.saves += 1
+        self.bytes_written += self.origin.path.stat().st_size
+
+    async def load(self) -> list[dict[str, Any]]:
+        return await self.origin.load()
+
+
+def signed_request(body: bytes) -> tuple[Request, str]:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    request = Request(
+        {"type": "http", "method": "POST", "path": "/hook/gitea", "headers": []},
+        receive,
+    )
+    return request, hmac.new(SECRET.encode(), body, "sha256").hexdigest()
+
+
+def hook_body(uri: str, forge: FakeForge) -> GiteaHookBody:
+    return GiteaHookBody.model_validate(
+        {
+            "repository": {
+                "id": "1",
+                "name": "synthetic",
+                "full_name": REPO_NAME,
+                "html_url": f"{forge.url}/{REPO_NAME}",
+                "ssh_url": uri,
+                "clone_url": uri,
+                "default_branch": "master",
+            }
+        }
+    )
+
+
+def summary(samples: list[float]) -> dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "min": ordered[0],
+        "p50": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))],
+        "max": ordered[-1],
+    }
+
+
+async def bench_scan(uri: str, puzzles: int, files: int, iterations: int) -> dict:
+    durations = []
+    async with GitRepo(uri=uri, name=REPO_NAME) as repo:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            found = await repo.parsed()
+            durations.append(time.perf_counter() - start)
+    assert (
+        len(found) == puzzles
+    ), f"expected {puzzles} puzzles, gopdd found {len(found)}"
+    return {
+        "seconds": summary(durations),
+        "puzzles_per_second": puzzles / statistics.median(durations),
+        "files_per_second": files / statistics.median(durations),
+    }
+
+
+async def bench_deploy(uri: str, puzzles: int, workdir: Path) -> dict:
+    templates = Jinja2Templates(TEMPLATES)
+    async with FakeForge() as forge:
+        config = bench_config(forge, workdir)
+        storage = CountingStorage(SimpleFsStorage(workdir / "deploy.json"))
+        async with GitRepo(uri=uri, name=REPO_NAME) as repo, ClientSession() as cs:
+            start = time.perf_counter()
+            await Puzzles(repo, storage).deploy(
+                TicketsSimple(GiteaVcs(cs, repo, config.all_tenants[0]), templates)
+            )
+            took = time.perf_counter() - start
+        final = storage.origin.path.stat().st_size
+        return {
+            "seconds": took,
+            "storage_saves": storage.saves,
+            "storage_bytes_written": storage.bytes_written,
+            "storage_final_bytes": final,
+            "storage_write_amplification": storage.bytes_written / final,
+            "api_calls": dict(forge.calls),
+            "api_calls_per_puzzle": forge.total_calls / puzzles,
+        }
+
+
+async def bench_hook(uri: str, iterations: int, workdir: Path) -> dict:
+    templates = Jinja2Templates(TEMPLATES)
+    cold, warm = [], []
+    async with FakeForge() as forge:
+        body = hook_body(uri, forge)
+        raw = body.model_dump_json().encode()
+        for i in range(iterations):
+            hook = bench_hook_gitea(forge, workdir / f"cold-{i}", templates)
+            request, signature = signed_request(raw)
+            start = time.perf_counter()
+            await hook.handle(body, request, signature)
+            cold.append(time.perf_counter() - start)
+        hook = bench_hook_gitea(forge, workdir / "cold-0", templates)
+        for _ in range(iterations):
+            request, signature = signed_request(raw)
+            start = time.perf_counter()
+            await hook.handle(body, request, signature)
+            warm.append(time.perf_counter() - start)
+    return {"cold_seconds": summary(cold), "warm_seconds": summary(warm)}
+
+
+def bench_hook_gitea(
+    forge: FakeForge, storage: Path, templates: Jinja2Templates
+) -> HookGitea:
+    return HookGitea(
+        Deployer(bench_config(forge, storage), templates, {"gitea": GiteaVcs})
+    )
+
+
+def bench_config(forge: FakeForge, storage: Path) -> Config:
+    return Config(
+        id_rsa="",
+        storage=storage,
+        gitea_token="benchmark",
+        gitea_host=forge.url,
+        gitea_secret_key=SECRET,
+    )
+
+
+def revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(files: int, puzzles: int, iterations: int, seed: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        uri = (make_repo(workdir / "origin", files, puzzles, seed)).as_uri()
+        return {
+            "meta": {
+                "revision": revision(),
+                "python": platform.python_version(),
+                "files": files,
+                "puzzles": puzzles,
+                "iterations": iterations,
+                "seed": seed,
+            },
+            "scan": await bench_scan(uri, puzzles, files, iterations),
+            "deploy": await bench_deploy(uri, puzzles, workdir),
+            "hook": await bench_hook(uri, iterations, workdir),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--puzzles", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    results = json.dumps(
+        asyncio.run(run(args.files, args.puzzles, args.iterations, args.seed)),
+        indent=2,
+    )
+    if args.output:
+        args.output.write_text(results)
+    print(results)
+
+
+if __name__ == "__main__":
+    main()
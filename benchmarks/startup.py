@@ -0,0 +1,64 @@
+"""
+Measure worker cold start: interpreter launch, importing onepdd.app and
+building the app, each in a fresh process.
+
+    python -m benchmarks.startup --runs 10 --budget 2.0
+
+Exits with a non-zero status when the median cold start exceeds the budget.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import onepdd.app
+imported = time.perf_counter()
+from onepdd.config import Config
+onepdd.app.make_app(Config(
+    id_rsa="", storage={storage!r}, gitea_token="t", gitea_host="http://localhost",
+    gitea_secret_key="s",
+))
+built = time.perf_counter()
+print(json.dumps({{"import": imported - start, "make_app": built - imported}}))
+"""
+
+
+def measure(runs: int) -> dict:
+    samples = {"process": [], "import": [], "make_app": []}
+    with tempfile.TemporaryDirectory() as storage:
+        for _ in range(runs):
+            start = time.perf_counter()
+            out = subprocess.run(
+                [sys.executable, "-c", PROBE.format(storage=storage)],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            samples["process"].append(time.perf_counter() - start)
+            for key, value in json.loads(out).items():
+                samples[key].append(value)
+    return {
+        key: {"p50": statistics.median(values), "max": max(values)}
+        for key, values in samples.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget", type=float, default=2.0)
+    args = parser.parse_args()
+    results = measure(args.runs)
+    print(json.dumps(results, indent=2))
+    if results["process"]["p50"] > args.budget:
+        sys.exit(f"Median cold start is over the {args.budget}s budget")
+
+
+if __name__ == "__main__":
+    main()
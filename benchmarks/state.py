@@ -0,0 +1,101 @@
+"""
+Size and load time of the puzzle state, legacy JSON against the versioned
+format with each available compression.
+
+    python -m benchmarks.state --puzzles 10000 --output state.json
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from benchmarks.run import summary
+from onepdd import state
+
+WORDS = "refactor extract migrate replace cover test cache parser storage".split()
+
+
+def puzzles(count: int, seed: int) -> list[dict[str, Any]]:
+    rnd = random.Random(seed)
+    return [
+        {
+            "id": f"{n}-{rnd.getrandbits(28):07x}",
+            "ticket": str(rnd.randint(1, count // 10 + 1)),
+            "estimate": rnd.choice([15, 30, 60, 90]),
+            "role": rnd.choice(["DEV", "ARC", "QA"]),
+            "lines": f"{n % 500}-{n % 500 + 3}",
+            "body": " ".join(rnd.choices(WORDS, k=rnd.randint(8, 60))),
+            "file": f"src/pkg{n % 40}/module_{n % 400}.py",
+            "author": rnd.choice(["alice", "bob", "carol"]),
+            "email": "dev@example.com",
+            "time": "2024-01-01T00:00:00+00:00",
+            "alive": rnd.random() > 0.3,
+            "issue": (
+                {"href": f"https://git/{n}", "number": str(n), "closed": None}
+                if rnd.random() > 0.2
+                else None
+            ),
+        }
+        for n in range(count)
+    ]
+
+
+def measure(raw: bytes, iterations: int) -> dict[str, Any]:
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        state.loads(raw)
+        durations.append(time.perf_counter() - start)
+    return {"bytes": len(raw), "load_seconds": summary(durations)}
+
+
+def run(count: int, iterations: int, seed: int) -> dict[str, Any]:
+    data = puzzles(count, seed)
+    results = {"legacy": measure(json.dumps(data).encode(), iterations)}
+    for compression in ("none", "gzip", "zstd"):
+        try:
+            raw = state.dumps(data, compression)
+        except ImportError:
+            continue
+        results[f"v{state.VERSION}-{compression}"] = measure(raw, iterations)
+        header = raw.partition(b"\n")[0]
+        start = time.perf_counter()
+        for _ in range(iterations):
+            state.parsed_header(header)
+        results[f"v{state.VERSION}-{compression}"]["header_seconds"] = (
+            time.perf_counter() - start
+        ) / iterations
+    with tempfile.TemporaryDirectory() as tmp:
+        file = Path(tmp) / "state"
+        file.write_bytes(state.dumps(data))
+        start = time.perf_counter()
+        for _ in range(iterations):
+            with state.StateView(file) as view:
+                view.statuses()
+        results[f"v{state.VERSION}-none"]["statuses_seconds"] = (
+            time.perf_counter() - start
+        ) / iterations
+    legacy = results["legacy"]["bytes"]
+    for result in results.values():
+        result["size_ratio"] = result["bytes"] / legacy
+    return {"puzzles": count, "seed": seed, "formats": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--puzzles", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    results = json.dumps(run(args.puzzles, args.iterations, args.seed), indent=2)
+    if args.output:
+        args.output.write_text(results)
+    print(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import os
+import random
+import subprocess
+from pathlib import Path
+
+WORDS = (
+    "refactor cache parser storage ticket issue puzzle deploy scan clone "
+    "module handler config webhook token branch commit author estimate role"
+).split()
+
+
+def make_repo(path: Path, files: int, puzzles: int, seed: int = 42) -> Path:
+    """
+    Create a git repository with the given number of source files and
+    PDD puzzles spread evenly across them. The content and the commit are
+    fully determined by the seed, so the same parameters always produce the
+    same repository and the same puzzle ids.
+    """
+    rnd = random.Random(seed)
+    path.mkdir(parents=True, exist_ok=True)
+    per_file = [
+        puzzles // files + (1 if i < puzzles % files else 0) for i in range(files)
+    ]
+    ticket = 0
+    for i, count in enumerate(per_file):
+        lines = [f'"""Synthetic module {i}."""', ""]
+        for j in range(rnd.randint(5, 30)):
+            lines.append(f"def function_{j}():")
+            lines.append(f"    return {rnd.randint(0, 10**6)}")
+            lines.append("")
+        for _ in range(count):
+            ticket += 1
+            lines.append(
+                f"# @todo #{ticket}:{rnd.choice((15, 30, 60))}min "
+                + " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(5, 15)))
+                + "."
+            )
+            lines.append(
+                "#  " + " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(5, 15)))
+            )
+            lines.append("")
+        module = path / f"pkg{i % 10}" / f"module_{i}.py"
+        module.parent.mkdir(exist_ok=True)
+        module.write_text("\n".join(lines))
+    git(path, "init", "--quiet", "--initial-branch=master")
+    git(path, "add", ".")
+    git(path, "commit", "--quiet", "-m", f"{files} files, {puzzles} puzzles")
+    return path
+
+
+def git(path: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args],
+        cwd=path,
+        check=True,
+        capture_output=True,
+        text=True,
+        env={
+            **os.environ,
+            "GIT_AUTHOR_NAME": "synthetic",
+            "GIT_AUTHOR_EMAIL": "synthetic@example.com",
+            "GIT_AUTHOR_DATE": "2023-09-01T12:00:00+00:00",
+            "GIT_COMMITTER_NAME": "synthetic",
+            "GIT_COMMITTER_EMAIL": "synthetic@example.com",
+            "GIT_COMMITTER_DATE": "2023-09-01T12:00:00+00:00",
+        },
+    ).stdout
@@ -0,0 +1,168 @@
+import asyncio
+import base64
+import binascii
+import hmac
+from datetime import datetime
+from typing import Annotated, Literal
+
+from fastapi import Header, HTTPException, Query, Response
+from starlette import status
+from starlette.responses import PlainTextResponse
+
+from onepdd.deploy import Deployer
+from onepdd.offload import offloaded
+from onepdd.profiling import sampled
+from onepdd.tracing import span
+
+
+def encoded_cursor(pos: int) -> str:
+    return base64.urlsafe_b64encode(str(pos).encode()).decode()
+
+
+def decoded_cursor(cursor: str | None) -> int:
+    if not cursor:
+        return -1
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
+
+
+def check_bearer(token: str | None, authorization: str | None):
+    """
+    Let the request through only if it carries ``token`` as its bearer
+    token. Without a token configured nothing gets through.
+    """
+    if not (
+        token
+        and authorization
+        and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+    ):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+
+class PuzzlesApi:
+    """
+    Read-only view of the puzzles of a repository, served from the indexes
+    of the deployer, so that a dashboard polling it never re-reads the
+    whole state. Pages are chained with the opaque ``next`` cursor and
+    every response carries an ETag of the state it was built from. Needs
+    the ``api_token`` as a bearer token.
+    """
+
+    def __init__(self, deployer: Deployer, token: str | None):
+        self.deployer: Deployer = deployer
+        self.token: str | None = token
+
+    async def handle(
+        self,
+        tenant: str,
+        owner: str,
+        repo: str,
+        response: Response,
+        alive: bool | None = None,
+        closed: bool | None = None,
+        author: str | None = None,
+        role: str | None = None,
+        ticket: str | None = None,
+        file_prefix: str | None = None,
+        older_than: datetime | None = None,
+        newer_than: datetime | None = None,
+        cursor: str | None = None,
+        limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+        if_none_match: Annotated[str | None, Header()] = None,
+        authorization: Annotated[str | None, Header()] = None,
+    ):
+        check_bearer(self.token, authorization)
+        try:
+            t = self.deployer.tenant(tenant)
+        except KeyError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        name = f"{owner}/{repo}"
+        with span("api.puzzles", repo=name):
+            index = await self.deployer.indexes.index(
+                f"{t.name}/{name}", self.deployer.storage(t, name)
+            )
+            etag = f'"{index.etag}"'
+            if if_none_match == etag:
+                return Response(
+                    status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+                )
+            found = index.query(
+                alive=alive,
+                closed=closed,
+                author=author,
+                role=role,
+                ticket=ticket,
+                file_prefix=file_prefix,
+                older_than=older_than,
+                newer_than=newer_than,
+                after=decoded_cursor(cursor),
+                limit=limit + 1,
+            )
+            response.headers["ETag"] = etag
+            return {
+                "puzzles": [index.puzzles[pos] for pos in found[:limit]],
+                "next": encoded_cursor(found[limit - 1])
+                if len(found) > limit
+                else None,
+            }
+
+
+class RollupsApi:
+    """
+    Fleet-wide puzzle counts, estimates and closure latencies grouped by
+    author, role or repository, answered from the deployer's rollups.
+    Needs the ``api_token`` as a bearer token.
+    """
+
+    def __init__(self, deployer: Deployer, token: str | None):
+        self.deployer: Deployer = deployer
+        self.token: str | None = token
+
+    async def handle(
+        self,
+        by: Literal["author", "role", "repo"] = "repo",
+        authorization: Annotated[str | None, Header()] = None,
+    ):
+        check_bearer(self.token, authorization)
+        return self.deployer.rollups.by(by)
+
+
+class DiskUsageApi:
+    def __init__(self, deployer: Deployer, token: str | None):
+        self.deployer: Deployer = deployer
+        self.token: str | None = token
+
+    async def handle(self, authorization: Annotated[str | None, Header()] = None):
+        check_bearer(self.token, authorization)
+        return await self.deployer.disk.report()
+
+
+class ProfileApi:
+    """
+    Samples the running worker for a while and returns the stacks in the
+    folded format, ready for flamegraph.pl or speedscope. Needs the
+    ``admin_token`` as a bearer token; one profile at a time, taking one
+    thread of the I/O pool while it runs.
+    """
+
+    def __init__(self, token: str | None):
+        self.token: str | None = token
+        self._busy: asyncio.Lock = asyncio.Lock()
+
+    async def handle(
+        self,
+        seconds: Annotated[float, Query(gt=0, le=60)] = 10,
+        authorization: Annotated[str | None, Header()] = None,
+    ):
+        check_bearer(self.token, authorization)
+        if self._busy.locked():
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT)
+        async with self._busy:
+            with span("admin.profile", seconds=seconds):
+                folded = await offloaded(sampled, seconds)
+        return PlainTextResponse(
+            folded,
+            headers={"Content-Disposition": 'attachment; filename="onepdd.folded"'},
+        )
@@ -1,31 +1,151 @@
+"""
+ASGI entry point. Prefer the factory, which builds the app on demand:
+
+    uvicorn --factory onepdd.app:make_app
+
+``onepdd.app:app`` is still available and is built on first access.
+Importing this module is cheap: FastAPI, the hooks and the YAML config
+are only loaded by make_app().
+"""
+import asyncio
+import logging
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import yaml
-from fastapi import FastAPI
-from starlette.templating import Jinja2Templates
+from onepdd import executor, offload, tracing
+from onepdd.config import Config, load_config
+from onepdd.metrics import REGISTRY, STARTUP_SECONDS
 
-from onepdd.config import Config
-from onepdd.hooks.gitea import HookGitea
+if TYPE_CHECKING:
+    from fastapi import FastAPI
 
+    from onepdd.deploy import Deployer
+    from starlette.templating import Jinja2Templates
 
-def load_config() -> Config:
-    conf = yaml.safe_load("config.yaml")
-    return Config(
-        id_rsa=conf["id_rsa"],
-        storage=conf["storage_dir"],
-        gitea_token=conf["gitea"]["token"],
-        gitea_host=conf["gitea"]["host"],
-        gitea_secret_key=conf["gitea"]["secret_key"],
-    )
+IMPORTED_AT = time.perf_counter()
+TEMPLATES = (Path(__file__).parent.parent / "templates").resolve()
+
+logger = logging.getLogger(__name__)
+
+
+def make_app(config: Config | None = None) -> "FastAPI":
+    from fastapi import FastAPI
+    from starlette.responses import PlainTextResponse
+    from starlette.templating import Jinja2Templates
 
+    from onepdd.api import DiskUsageApi, ProfileApi, PuzzlesApi, RollupsApi
+    from onepdd.deploy import Deployer
+    from onepdd.hooks.gitea import GiteaVcs, HookGitea
+    from onepdd.hooks.github import HookGithub, github_vcs
 
-def make_app():
-    config = load_config()
-    templates = Jinja2Templates((Path(__file__).parent.parent / "templates").resolve())
+    config = config or load_config()
+    tracing.configure(config.trace_output)
+    offload.configure(config.io_threads)
+    executor.configure(
+        config.subprocess_max_running,
+        config.subprocess_max_load,
+        config.subprocess_min_free_disk,
+    )
+    templates = Jinja2Templates(TEMPLATES)
+    deployer = Deployer(config, templates, {"gitea": GiteaVcs, "github": github_vcs})
     api = FastAPI()
-    api.add_route("/hook/gitea", HookGitea(config=config, templates=templates).handle)
+    api.add_api_route("/hook/gitea", HookGitea(deployer).handle, methods=["POST"])
+    api.add_api_route("/hook/github", HookGithub(deployer).handle, methods=["POST"])
+    api.add_api_route(
+        "/repos/{tenant}/{owner}/{repo}/puzzles",
+        PuzzlesApi(deployer, config.api_token).handle,
+    )
+    api.add_api_route("/rollups", RollupsApi(deployer, config.api_token).handle)
+    api.add_api_route("/disk", DiskUsageApi(deployer, config.api_token).handle)
+    api.add_api_route("/admin/profile", ProfileApi(config.admin_token).handle)
+    api.add_api_route("/metrics", metrics, response_class=PlainTextResponse)
+    api.add_event_handler(
+        "startup", lambda: on_startup(api, config, templates, deployer)
+    )
 
+    async def shutdown():
+        await on_shutdown(api, deployer)
+
+    api.add_event_handler("shutdown", shutdown)
     return api
 
 
-app = make_app()
+def on_startup(
+    api: "FastAPI",
+    config: Config,
+    templates: "Jinja2Templates",
+    deployer: "Deployer",
+):
+    api.state.warmup = asyncio.ensure_future(
+        offload.offloaded(warm_templates, templates)
+    )
+    offload.reaper().purge()
+    if config.loop_lag_threshold:
+        from onepdd.profiling import LoopMonitor
+
+        api.state.loop_monitor = asyncio.create_task(
+            LoopMonitor(config.loop_lag_threshold).run()
+        )
+    if config.resync_interval:
+        from onepdd.scheduler import ResyncScheduler
+
+        api.state.resync = asyncio.create_task(
+            ResyncScheduler(
+                deployer, config.resync_interval, config.resync_max_in_flight
+            ).run()
+        )
+    api.state.backfill = asyncio.create_task(deployer.backfill())
+    if config.clone_cache or config.archive_after_days:
+        api.state.disk = asyncio.create_task(deployer.disk.run())
+    if not config.dry_run:
+        from onepdd.outbox import Drainer
+
+        api.state.outbox = asyncio.create_task(
+            Drainer(deployer.outbox, deployer.redeliver, config.outbox_interval).run()
+        )
+    took = time.perf_counter() - IMPORTED_AT
+    STARTUP_SECONDS.set(took)
+    if took > config.startup_budget:
+        logger.warning(
+            "Cold start took %.3fs, over the %.3fs budget",
+            took,
+            config.startup_budget,
+        )
+
+
+async def on_shutdown(api: "FastAPI", deployer: "Deployer"):
+    tasks = [
+        getattr(api.state, name)
+        for name in ("loop_monitor", "resync", "disk", "outbox", "backfill")
+        if hasattr(api.state, name)
+    ]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await deployer.pipeline.close()
+
+
+def warm_templates(templates: "Jinja2Templates"):
+    """
+    Compile every template up front, off the event loop, so the first
+    ticket of a fresh worker does not pay for it.
+    """
+    for template in TEMPLATES.glob("*.txt"):
+        templates.get_template(template.name)
+
+
+async def metrics():
+    from starlette.responses import PlainTextResponse
+
+    return PlainTextResponse(
+        REGISTRY.exposition(), media_type="text/plain; version=0.0.4"
+    )
+
+
+def __getattr__(name: str):
+    if name == "app":
+        global app
+        app = make_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
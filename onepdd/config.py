@@ -1,11 +1,215 @@
 import dataclasses
+import functools
+import os
 from pathlib import Path
+from typing import Any
+from urllib.parse import urlparse
+
+from onepdd.state import resolved
+
+ENV_PREFIX = "ONEPDD_"
+DEFAULT_TENANT = "default"
+CONFIG_ENV = "ONEPDD_CONFIG"
+
+
+@dataclasses.dataclass
+class Budget:
+    concurrency: int = 4
+    api_calls_per_minute: int = 600
+    disk_bytes: int | None = None
+
+
+@dataclasses.dataclass
+class Tenant:
+    """
+    Credentials and resource budget for a group of repositories: every
+    repository of the given orgs (or explicitly listed repos) on one host,
+    or the whole host when neither is given. GitHub tenants can set
+    ``api`` to ``graphql`` to batch their issue reads and updates, and
+    ``api_url`` where the API is not under the host, which github.com
+    does not need.
+    """
+
+    name: str
+    vcs: str
+    host: str
+    token: str
+    secret_key: str
+    orgs: list[str] = dataclasses.field(default_factory=list)
+    repos: list[str] = dataclasses.field(default_factory=list)
+    budget: Budget = dataclasses.field(default_factory=Budget)
+    api: str = "rest"
+    api_url: str = ""
+
+    @property
+    def rest_url(self) -> str:
+        if self.api_url:
+            return self.api_url.rstrip("/")
+        if urlparse(self.host).hostname == "github.com":
+            return "https://api.github.com"
+        return f"{self.host}/api/v3"
+
+    @property
+    def graphql_url(self) -> str:
+        if self.api_url:
+            return f"{self.api_url.rstrip('/')}/graphql"
+        if urlparse(self.host).hostname == "github.com":
+            return "https://api.github.com/graphql"
+        return f"{self.host}/api/graphql"
+
+    @property
+    def storage_prefix(self) -> str:
+        return self.vcs if self.name == DEFAULT_TENANT else f"{self.vcs}-{self.name}"
 
 
 @dataclasses.dataclass
 class Config:
     id_rsa: str
     storage: Path
-    gitea_token: str
-    gitea_host: str
-    gitea_secret_key: str
+    gitea_token: str = ""
+    gitea_host: str = ""
+    gitea_secret_key: str = ""
+    trace_output: str | None = None
+    redis_url: str | None = None
+    startup_budget: float = 2.0
+    resync_interval: float | None = None
+    resync_max_in_flight: int = 8
+    fetch_workers: int = 4
+    scan_workers: int = 2
+    reconcile_workers: int = 2
+    publish_workers: int = 8
+    stage_capacity: int = 16
+    deploy_aging: float = 1.0
+    dry_run: bool = False
+    state_compression: str = "none"
+    state_journal: bool = False
+    journal_snapshot_every: int = 500
+    io_threads: int = 4
+    loop_lag_threshold: float = 0.25
+    admin_token: str | None = None
+    api_token: str | None = None
+    index_cache_size: int = 256
+    outbox_interval: float = 30
+    breaker_failures: int = 5
+    breaker_cooldown: float = 60
+    subprocess_max_running: int | None = None
+    subprocess_max_load: float | None = 2.0
+    subprocess_min_free_disk: int = 256 * 1024 * 1024
+    clone_cache: Path | None = None
+    object_store: Path | None = None
+    clone_cache_bytes: int | None = None
+    clone_idle_seconds: float = 7 * 24 * 3600
+    disk_interval: float = 3600
+    archive_after_days: float | None = None
+    tenants: list[Tenant] = dataclasses.field(default_factory=list)
+
+    @property
+    def all_tenants(self) -> list[Tenant]:
+        """
+        The configured tenants, plus the single-host Gitea setup from the
+        top-level ``gitea`` section as the ``default`` tenant.
+        """
+        if not self.gitea_host:
+            return self.tenants
+        return [
+            *self.tenants,
+            Tenant(
+                name=DEFAULT_TENANT,
+                vcs="gitea",
+                host=self.gitea_host,
+                token=self.gitea_token,
+                secret_key=self.gitea_secret_key,
+            ),
+        ]
+
+
+@functools.cache
+def load_config(path: str | None = None) -> Config:
+    """
+    Read the YAML file (``$ONEPDD_CONFIG``, ``config.yaml`` by default)
+    and apply ``ONEPDD_*`` environment overrides on top of it, nested keys
+    separated by a double underscore: ``ONEPDD_GITEA__TOKEN``.
+    The result is cached, so every caller shares a single parse.
+    """
+    import yaml  # only needed once per process, keep it off the import path
+
+    file = Path(path or os.environ.get(CONFIG_ENV, "config.yaml"))
+    conf = yaml.safe_load(file.read_text()) if file.exists() else {}
+    conf = overridden(conf or {}, os.environ)
+    gitea = conf.get("gitea", {})
+    resolved(conf.get("state_compression", "none"))
+    return Config(
+        id_rsa=conf.get("id_rsa", ""),
+        storage=Path(conf["storage_dir"]),
+        gitea_token=gitea.get("token", ""),
+        gitea_host=gitea.get("host", ""),
+        gitea_secret_key=gitea.get("secret_key", ""),
+        trace_output=conf.get("trace_output"),
+        redis_url=conf.get("redis_url"),
+        startup_budget=float(conf.get("startup_budget", 2.0)),
+        resync_interval=(
+            float(conf["resync_interval"]) if conf.get("resync_interval") else None
+        ),
+        resync_max_in_flight=int(conf.get("resync_max_in_flight", 8)),
+        fetch_workers=int(conf.get("fetch_workers", 4)),
+        scan_workers=int(conf.get("scan_workers", 2)),
+        reconcile_workers=int(conf.get("reconcile_workers", 2)),
+        publish_workers=int(conf.get("publish_workers", 8)),
+        stage_capacity=int(conf.get("stage_capacity", 16)),
+        deploy_aging=float(conf.get("deploy_aging", 1.0)),
+        subprocess_max_running=(
+            int(conf["subprocess_max_running"])
+            if conf.get("subprocess_max_running")
+            else None
+        ),
+        subprocess_max_load=float(conf.get("subprocess_max_load", 2.0)) or None,
+        subprocess_min_free_disk=int(
+            conf.get("subprocess_min_free_disk", 256 * 1024 * 1024)
+        ),
+        clone_cache=Path(conf["clone_cache"]) if conf.get("clone_cache") else None,
+        object_store=Path(conf["object_store"]) if conf.get("object_store") else None,
+        clone_cache_bytes=(
+            int(conf["clone_cache_bytes"]) if conf.get("clone_cache_bytes") else None
+        ),
+        clone_idle_seconds=float(conf.get("clone_idle_seconds", 7 * 24 * 3600)),
+        disk_interval=float(conf.get("disk_interval", 3600)),
+        archive_after_days=(
+            float(conf["archive_after_days"])
+            if conf.get("archive_after_days")
+            else None
+        ),
+        io_threads=int(conf.get("io_threads", 4)),
+        loop_lag_threshold=float(conf.get("loop_lag_threshold", 0.25)),
+        admin_token=conf.get("admin_token"),
+        api_token=conf.get("api_token"),
+        index_cache_size=int(conf.get("index_cache_size", 256)),
+        outbox_interval=float(conf.get("outbox_interval", 30)),
+        breaker_failures=int(conf.get("breaker_failures", 5)),
+        breaker_cooldown=float(conf.get("breaker_cooldown", 60)),
+        state_compression=conf.get("state_compression", "none"),
+        state_journal=str(conf.get("state_journal", False)).lower()
+        in ("true", "1", "yes"),
+        journal_snapshot_every=int(conf.get("journal_snapshot_every", 500)),
+        dry_run=str(conf.get("dry_run", False)).lower() in ("true", "1", "yes"),
+        tenants=[
+            Tenant(
+                **{
+                    **tenant,
+                    "budget": Budget(**tenant.get("budget", {})),
+                }
+            )
+            for tenant in conf.get("tenants", [])
+        ],
+    )
+
+
+def overridden(conf: dict[str, Any], environ: dict[str, str]) -> dict[str, Any]:
+    for name, value in environ.items():
+        if not name.startswith(ENV_PREFIX) or name == CONFIG_ENV:
+            continue
+        *parents, key = name[len(ENV_PREFIX) :].lower().split("__")
+        node = conf
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[key] = value
+    return conf
@@ -0,0 +1,351 @@
+import asyncio
+import contextlib
+import dataclasses
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+from aiohttp import ClientSession
+from starlette.templating import Jinja2Templates
+
+from onepdd.config import Config, Tenant
+from onepdd.disk import DiskManager
+from onepdd.exc import OnePddError
+from onepdd.history import DeployHistory
+from onepdd.index import IndexCache, IndexedStorage
+from onepdd.metrics import DEPLOYS_SKIPPED, TENANT_DEPLOYS
+from onepdd.outbox import IsolatedTickets, Outbox, OutboxTickets, Pending
+from onepdd.pipeline import ItemCancelledError, Pipeline, Stage
+from onepdd.puzzles import Puzzles
+from onepdd.registry import KnownRepo, RepoRegistry
+from onepdd.repo import GitRepo, GopddPuzzle
+from onepdd.rollups import RolledUpStorage, Rollups
+from onepdd.storage import MemoryStorage, MeteredStorage, Storage, storage_for
+from onepdd.tenants import TenantIndex, TenantLimits
+from onepdd.tickets import Tickets, TicketsSimple
+from onepdd.tracing import span
+from onepdd.vcs import DryRunVcs, MeteredVcs, RateLimitedVcs, Vcs
+
+logger = logging.getLogger(__name__)
+
+VcsFactory = Callable[[ClientSession, GitRepo, Tenant], Vcs]
+
+
+@dataclasses.dataclass
+class DeployJob:
+    tenant: Tenant
+    uri: str
+    name: str
+    master: str = "master"
+    head: str = ""
+    upstream: str = ""
+
+
+@dataclasses.dataclass
+class Run:
+    """
+    A deploy on its way through the pipeline, with what each stage hands
+    on to the next. ``stack`` holds the clone and the HTTP session until
+    the deploy leaves the pipeline.
+    """
+
+    job: DeployJob
+    limits: TenantLimits
+    stack: contextlib.AsyncExitStack = dataclasses.field(
+        default_factory=contextlib.AsyncExitStack
+    )
+    repo: GitRepo | None = None
+    puzzles: Puzzles | None = None
+    tickets: Tickets | None = None
+    snapshot: list[GopddPuzzle] | None = None
+    superseded: bool = False
+    done: asyncio.Event = dataclasses.field(default_factory=asyncio.Event)
+
+    @property
+    def key(self) -> str:
+        return f"{self.job.tenant.name}/{self.job.name}"
+
+
+class Deployer:
+    """
+    Deploys a repository with the credentials and within the budget of the
+    tenant it belongs to. A deploy goes through the stages of a pipeline:
+    fetch (clone or pull), scan, reconcile (join and save) and publish
+    (expose), so different repositories can be in different stages.
+    Deploys expected to be cheap, going by the history of the repository,
+    are let in and through the stages first. In ``dry_run`` mode ticket
+    operations are only logged, and neither state nor registry is written.
+    Ticket operations the forge cannot take go to the outbox.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        templates: Jinja2Templates,
+        vcs: dict[str, VcsFactory],
+    ):
+        self.config: Config = config
+        self.templates: Jinja2Templates = templates
+        self.vcs: dict[str, VcsFactory] = vcs
+        self.tenants: TenantIndex = TenantIndex(config.all_tenants)
+        self.registry: RepoRegistry = RepoRegistry(config.storage / "repos.json")
+        self.indexes: IndexCache = IndexCache(config.index_cache_size)
+        self.rollups: Rollups = Rollups(config.storage / "rollups.json")
+        self.history: DeployHistory = DeployHistory(config.storage / "history.json")
+        self.disk: DiskManager = DiskManager(
+            config,
+            self.registry,
+            lambda repo: self.storage(self.tenant(repo.tenant), repo.name),
+        )
+        self.outbox: Outbox = Outbox(
+            config.storage / "outbox", config.breaker_failures, config.breaker_cooldown
+        )
+        self.pipeline: Pipeline[Run] = Pipeline(
+            [
+                Stage(
+                    "fetch",
+                    self.fetch,
+                    config.fetch_workers,
+                    config.stage_capacity,
+                    cancellable=True,
+                ),
+                Stage(
+                    "scan",
+                    self.scan,
+                    config.scan_workers,
+                    config.stage_capacity,
+                    cancellable=True,
+                ),
+                Stage(
+                    "reconcile",
+                    self.reconcile,
+                    config.reconcile_workers,
+                    config.stage_capacity,
+                ),
+                Stage(
+                    "publish",
+                    self.publish,
+                    config.publish_workers,
+                    config.stage_capacity,
+                ),
+            ],
+            finish=lambda run: run.stack.aclose(),
+            priority=lambda run: self.history.expected(run.key),
+            aging=config.deploy_aging,
+        )
+        self.in_flight: int = 0
+        self._runs: dict[str, Run] = {}
+        self._by_name: dict[str, Tenant] = {t.name: t for t in config.all_tenants}
+        self._limits: dict[str, TenantLimits] = {}
+
+    def tenant(self, name: str) -> Tenant:
+        return self._by_name[name]
+
+    def limits(self, tenant: Tenant) -> TenantLimits:
+        if tenant.name not in self._limits:
+            self._limits[tenant.name] = TenantLimits(tenant, self.config.deploy_aging)
+        return self._limits[tenant.name]
+
+    def storage(self, tenant: Tenant, name: str, sha: str = "") -> Storage:
+        key = f"{tenant.name}/{name}"
+        return RolledUpStorage(
+            IndexedStorage(
+                storage_for(self.config, tenant.storage_prefix, name, sha),
+                key,
+                self.indexes,
+            ),
+            key,
+            self.rollups,
+        )
+
+    async def deploy(self, job: DeployJob):
+        limits = self.limits(job.tenant)
+        self.in_flight += 1
+        try:
+            if await self.unchanged(job):
+                DEPLOYS_SKIPPED.inc(reason="unchanged")
+                return
+            previous = self._runs.get(f"{job.tenant.name}/{job.name}")
+            if previous is not None and job.head and job.head == previous.job.head:
+                DEPLOYS_SKIPPED.inc(reason="duplicate")
+                await previous.done.wait()
+                return
+            run = Run(job, limits)
+            self._supersede(run)
+            try:
+                async with limits.deploys.slot(self.history.expected(run.key)):
+                    if run.superseded:
+                        raise ItemCancelledError("Superseded before it started")
+                    TENANT_DEPLOYS.inc(tenant=job.tenant.name)
+                    try:
+                        await self.pipeline.run(run)
+                    finally:
+                        TENANT_DEPLOYS.dec(tenant=job.tenant.name)
+            except ItemCancelledError:
+                if not run.superseded:
+                    raise
+                DEPLOYS_SKIPPED.inc(reason="superseded")
+            finally:
+                run.done.set()
+                if self._runs.get(run.key) is run:
+                    del self._runs[run.key]
+        finally:
+            self.in_flight -= 1
+
+    def _supersede(self, run: "Run"):
+        """
+        Make ``run`` the deploy of its repository, cancelling the one in
+        flight. That one is only stopped while it clones or scans, so it
+        never leaves its puzzles half saved; past that it runs to the end
+        and ``run`` waits for it. A push of the commit already in flight
+        never gets here: deploy() has it wait for that run instead of
+        taking a worker of its own.
+        """
+        previous = self._runs.get(run.key)
+        self._runs[run.key] = run
+        if previous is None:
+            return
+        previous.superseded = True
+        self.pipeline.cancel(previous)
+
+    async def unchanged(self, job: DeployJob) -> bool:
+        """
+        Whether the default branch is still at the commit of the last
+        deploy, in which case there is nothing to clone, scan or expose.
+        The head comes from the webhook when it has one, otherwise from a
+        ``git ls-remote``, which is much cheaper than a clone.
+        """
+        known = self.registry.get(job.tenant.name, job.name)
+        if known is None or not known.sha:
+            return False
+        with span("deploy.probe", repo=job.name) as s:
+            if not job.head:
+                job.head = await GitRepo(
+                    uri=job.uri,
+                    name=job.name,
+                    master=job.master,
+                    id_rsa=self.config.id_rsa,
+                ).remote_head()
+            s.set_attribute("head", job.head)
+            return job.head == known.sha
+
+    async def fetch(self, run: "Run") -> bool:
+        start = time.perf_counter()
+        job = run.job
+        if job.tenant.budget.disk_bytes is not None:
+            run.limits.check_disk(await self.disk.usage(job.tenant))
+        await run.stack.enter_async_context(self.disk.using(job.uri))
+        repo = await run.stack.enter_async_context(
+            GitRepo(
+                uri=job.uri,
+                name=job.name,
+                master=job.master,
+                head_commit_hash=job.head,
+                id_rsa=self.config.id_rsa,
+                cache_dir=self.config.clone_cache,
+                object_store=self.config.object_store,
+                upstream=job.upstream,
+            )
+        )
+        cs = await run.stack.enter_async_context(ClientSession())
+        repo.head_commit_hash = await repo.revision()
+        vcs: Vcs = MeteredVcs(
+            RateLimitedVcs(
+                self.vcs[job.tenant.vcs](cs, repo, job.tenant), run.limits.api
+            )
+        )
+        storage = self.storage(job.tenant, job.name, repo.head_commit_hash)
+        if self.config.dry_run:
+            vcs, storage = DryRunVcs(vcs), MemoryStorage(storage)
+        run.tickets = IsolatedTickets(TicketsSimple(vcs, self.templates), repo)
+        if not self.config.dry_run:
+            run.tickets = OutboxTickets(run.tickets, self.outbox, job.tenant, repo)
+        run.repo, run.puzzles = repo, Puzzles(repo, MeteredStorage(storage))
+        self.history.record(run.key, fetch_seconds=time.perf_counter() - start)
+        return True
+
+    async def scan(self, run: "Run") -> bool:
+        start = time.perf_counter()
+        run.snapshot = await run.puzzles.scan()
+        self.history.record(run.key, scan_seconds=time.perf_counter() - start)
+        if run.snapshot is None:
+            await self._deployed(run)
+            return False
+        self.history.record(run.key, puzzles=len(run.snapshot))
+        return True
+
+    async def reconcile(self, run: "Run") -> bool:
+        await run.puzzles.reconcile(run.snapshot)
+        return True
+
+    async def publish(self, run: "Run") -> bool:
+        await run.puzzles.publish(run.tickets)
+        await self._deployed(run)
+        return True
+
+    async def _deployed(self, run: "Run"):
+        if self.config.dry_run:
+            return
+        self.registry.record(
+            KnownRepo(
+                tenant=run.job.tenant.name,
+                uri=run.job.uri,
+                name=run.job.name,
+                master=run.job.master,
+                sha=run.repo.head_commit_hash,
+                deployed=datetime.now(tz=timezone.utc).isoformat(),
+                upstream=run.job.upstream,
+            )
+        )
+        await asyncio.gather(
+            self.registry.flush(), self.rollups.flush(), self.history.flush()
+        )
+
+    async def backfill(self):
+        """
+        Feed the rollups the stored state of every known repository they
+        have not seen a save of, so that repositories which have not moved
+        since the rollups came in are counted too.
+        """
+        for known in self.registry.all():
+            if self.rollups.has(known.key):
+                continue
+            try:
+                puzzles = await self.storage(
+                    self.tenant(known.tenant), known.name
+                ).load()
+            except (KeyError, OnePddError, OSError):
+                logger.exception("Could not backfill the rollups of %s", known.key)
+                continue
+            self.rollups.update(known.key, puzzles)
+        await self.rollups.flush()
+
+    async def redeliver(self, pending: list[Pending]):
+        """
+        Expose the stored state of the repository of the ``pending``
+        operations again, without cloning it.
+        """
+        last = pending[-1]
+        tenant = self.tenant(last.tenant)
+        async with self.disk.using(last.uri), ClientSession() as cs:
+            repo = GitRepo(
+                uri=last.uri,
+                name=last.name,
+                master=last.master,
+                head_commit_hash=last.sha,
+                config=last.config,
+            )
+            vcs = MeteredVcs(
+                RateLimitedVcs(
+                    self.vcs[tenant.vcs](cs, repo, tenant), self.limits(tenant).api
+                )
+            )
+            puzzles = Puzzles(
+                repo, MeteredStorage(self.storage(tenant, last.name, last.sha))
+            )
+            await puzzles.expose(
+                await puzzles.load(),
+                IsolatedTickets(TicketsSimple(vcs, self.templates), repo),
+            )
+        await self.rollups.flush()
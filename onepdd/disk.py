@@ -0,0 +1,262 @@
+import asyncio
+import collections
+import contextlib
+import json
+import logging
+import os
+import shlex
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable
+
+from onepdd.config import Config, Tenant
+from onepdd.exc import OnePddError
+from onepdd.executor import executor
+from onepdd.metrics import CLONES_EVICTED, DISK_BYTES, PUZZLES_ARCHIVED
+from onepdd.offload import offloaded, reaper
+from onepdd.registry import KnownRepo, RepoRegistry
+from onepdd.repo import GitRepo
+from onepdd.storage import Storage
+from onepdd.util import exec_cmd_shell
+
+logger = logging.getLogger(__name__)
+
+
+class DiskManager:
+    """
+    Keeps the disk footprint of the worker in check. Clones live in the
+    ``clone_cache`` directory between deploys, so a push only costs a
+    fetch. Every ``disk_interval`` they get ``git maintenance``, the ones
+    not used for ``clone_idle_seconds`` are evicted, and so are the least
+    recently used ones while the cache is over ``clone_cache_bytes``.
+    Puzzles whose tickets were closed more than ``archive_after_days`` ago
+    are moved out of the state into an append-only archive. The size of
+    each clone is measured once, through the subprocess executor, and
+    again only after a deploy, maintenance or eviction has changed it.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        registry: RepoRegistry,
+        storage: Callable[[KnownRepo], Storage],
+    ):
+        self.config: Config = config
+        self.registry: RepoRegistry = registry
+        self.storage: Callable[[KnownRepo], Storage] = storage
+        self.archive: Path = config.storage / "archive"
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._sizes: dict[str, int] = {}
+        self._changes: collections.Counter[str] = collections.Counter()
+
+    @contextlib.asynccontextmanager
+    async def using(self, uri: str) -> AsyncIterator[None]:
+        """
+        Hold the clone of the repository, so maintenance and eviction
+        leave it alone, and mark it as recently used.
+        """
+        repo_id = GitRepo.repo_id(uri)
+        async with self._lock(repo_id):
+            try:
+                yield
+            finally:
+                self._changed(repo_id)
+                clone = self._clone(repo_id)
+                if clone is not None and clone.exists():
+                    os.utime(clone)
+
+    async def run(self):
+        while True:
+            try:
+                await self.maintain(time.time())
+            except Exception:
+                logger.exception("Disk maintenance failed")
+            await asyncio.sleep(self.config.disk_interval)
+
+    async def maintain(self, now: float):
+        if self.config.clone_cache is not None:
+            await self.collect(now)
+        if self.config.archive_after_days is not None:
+            for repo in self.registry.all():
+                await self.archived(repo, now)
+
+    async def collect(self, now: float):
+        clones = sorted(self._clones(), key=lambda c: c.stat().st_mtime)
+        for clone in clones:
+            if now - clone.stat().st_mtime > self.config.clone_idle_seconds:
+                await self._evict(clone, "idle")
+            else:
+                await self._gc(clone)
+        quota = self.config.clone_cache_bytes
+        if quota is None:
+            return
+        sizes = {clone: await self._size(clone) for clone in self._clones()}
+        used = sum(sizes.values())
+        for clone in sorted(sizes, key=lambda c: c.stat().st_mtime):
+            if used <= quota:
+                break
+            if await self._evict(clone, "quota"):
+                used -= sizes[clone]
+
+    async def archived(self, repo: KnownRepo, now: float) -> int:
+        """
+        Move the long-closed puzzles of the repository to its archive,
+        returning how many were moved.
+        """
+        cutoff = datetime.fromtimestamp(now, tz=timezone.utc) - timedelta(
+            days=self.config.archive_after_days
+        )
+        async with self._lock(GitRepo.repo_id(repo.uri)):
+            storage = self.storage(repo)
+            puzzles = await storage.load()
+            dead = [p for p in puzzles if long_closed(p, cutoff)]
+            if not dead:
+                return 0
+            await offloaded(appended, self.archive / f"{repo.key}.jsonl", dead)
+            await storage.save([p for p in puzzles if not long_closed(p, cutoff)])
+        PUZZLES_ARCHIVED.inc(len(dead))
+        return len(dead)
+
+    async def report(self) -> dict[str, Any]:
+        by_id = {GitRepo.repo_id(repo.uri): repo.key for repo in self.registry.all()}
+        clones = {
+            by_id.get(clone.name, clone.name): await self._size(clone)
+            for clone in self._clones()
+        }
+        state = await offloaded(
+            files_size, self.config.storage, self.config.clone_cache
+        )
+        archive = await offloaded(files_size, self.archive)
+        store = self.config.object_store
+        objects = 0
+        if store is not None and store.exists():
+            async with executor().slot(store.name, "du"):
+                objects = await du(store)
+        DISK_BYTES.set(sum(clones.values()), kind="clones")
+        DISK_BYTES.set(state - archive, kind="state")
+        DISK_BYTES.set(archive, kind="archive")
+        DISK_BYTES.set(objects, kind="objects")
+        return {
+            "clones": clones,
+            "clones_bytes": sum(clones.values()),
+            "clones_quota": self.config.clone_cache_bytes,
+            "objects_bytes": objects,
+            "state_bytes": state - archive,
+            "archive_bytes": archive,
+        }
+
+    async def usage(self, tenant: Tenant) -> int:
+        """
+        Bytes the tenant takes on disk: the cached clones and the state
+        files of every repository of it deployed so far.
+        """
+        repos = [repo for repo in self.registry.all() if repo.tenant == tenant.name]
+        clones = [
+            clone
+            for clone in (self._clone(GitRepo.repo_id(repo.uri)) for repo in repos)
+            if clone is not None and clone.exists()
+        ]
+        state = await offloaded(
+            paths_size,
+            [
+                self.config.storage / f"{tenant.storage_prefix}-{repo.name}{suffix}"
+                for repo in repos
+                for suffix in ("", ".journal")
+            ],
+        )
+        return state + sum([await self._size(clone) for clone in clones])
+
+    async def _size(self, clone: Path) -> int:
+        """
+        Bytes the clone takes, measured only if it changed since the last
+        time. A measurement that raced with a change is not kept.
+        """
+        if clone.name in self._sizes:
+            return self._sizes[clone.name]
+        changes = self._changes[clone.name]
+        async with executor().slot(clone.name, "du"):
+            size = await du(clone)
+        if self._changes[clone.name] == changes and not self._lock(clone.name).locked():
+            self._sizes[clone.name] = size
+        return size
+
+    def _changed(self, repo_id: str):
+        self._sizes.pop(repo_id, None)
+        self._changes[repo_id] += 1
+
+    def _lock(self, repo_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(repo_id, asyncio.Lock())
+
+    def _clone(self, repo_id: str) -> Path | None:
+        if self.config.clone_cache is None:
+            return None
+        return self.config.clone_cache / repo_id
+
+    def _clones(self) -> list[Path]:
+        cache = self.config.clone_cache
+        if cache is None or not cache.exists():
+            return []
+        return [p for p in cache.iterdir() if p.is_dir()]
+
+    async def _gc(self, clone: Path):
+        lock = self._lock(clone.name)
+        if lock.locked():
+            return
+        async with lock, executor().slot(clone.name, "gc"):
+            path = shlex.quote(str(clone))
+            try:
+                await exec_cmd_shell(
+                    f"git -C {path} maintenance run --auto"
+                    f" || git -C {path} gc --auto --quiet"
+                )
+            except OnePddError:
+                logger.exception("Maintenance of %s failed", clone)
+            finally:
+                self._changed(clone.name)
+
+    async def _evict(self, clone: Path, reason: str) -> bool:
+        lock = self._lock(clone.name)
+        if lock.locked():
+            return False
+        async with lock:
+            reaper().reap(clone)
+            self._changed(clone.name)
+        CLONES_EVICTED.inc(reason=reason)
+        return True
+
+
+def long_closed(puzzle: dict[str, Any], cutoff: datetime) -> bool:
+    issue = puzzle.get("issue")
+    return (
+        not puzzle["alive"]
+        and bool(issue and issue.get("closed"))
+        and datetime.fromisoformat(issue["closed"]) < cutoff
+    )
+
+
+async def du(path: Path) -> int:
+    out = await exec_cmd_shell(f"du -sk {shlex.quote(str(path))}")
+    return int(out.split()[0]) * 1024
+
+
+def appended(file: Path, puzzles: list[dict[str, Any]]):
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with file.open("a") as f:
+        f.writelines(json.dumps(p) + "\n" for p in puzzles)
+
+
+def files_size(root: Path, exclude: Path | None = None) -> int:
+    if not root.exists():
+        return 0
+    return sum(
+        f.stat().st_size
+        for f in root.rglob("*")
+        if f.is_file() and (exclude is None or exclude not in f.parents)
+    )
+
+
+def paths_size(paths: list[Path]) -> int:
+    return sum(
+        path.stat().st_size if path.is_file() else files_size(path) for path in paths
+    )
@@ -0,0 +1,116 @@
+import asyncio
+import collections
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+from typing import AsyncIterator
+
+from onepdd.metrics import (
+    SUBPROCESS_WAIT_SECONDS,
+    SUBPROCESSES_QUEUED,
+    SUBPROCESSES_RUNNING,
+    SUBPROCESSES_THROTTLED,
+)
+
+
+class SubprocessExecutor:
+    """
+    Admission control for the clones, pulls and scans of every repository
+    in the process. At most ``max_running`` run at once, fewer while the
+    load average per CPU is above ``max_load`` or the temporary directory
+    has less than ``min_free_disk`` bytes left. Waiters are admitted round
+    robin across repositories, so an org-wide push of hundreds of repos
+    does not starve the one repo that pushed right after it.
+    """
+
+    def __init__(
+        self,
+        max_running: int | None = None,
+        max_load: float | None = 2.0,
+        min_free_disk: int = 256 * 1024 * 1024,
+        disk_path: str | None = None,
+    ):
+        self.cpus: int = os.cpu_count() or 1
+        self.max_running: int = max_running or self.cpus
+        self.max_load: float | None = max_load
+        self.min_free_disk: int = min_free_disk
+        self.disk_path: str = disk_path or tempfile.gettempdir()
+        self.running: int = 0
+        self._waiting: collections.OrderedDict[
+            str, collections.deque[asyncio.Future]
+        ] = collections.OrderedDict()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, repo: str, kind: str) -> AsyncIterator[None]:
+        queued = time.perf_counter()
+        if self._waiting or not self.admitting():
+            await self._wait(repo, kind)
+        else:
+            self.running += 1
+        SUBPROCESS_WAIT_SECONDS.observe(time.perf_counter() - queued, kind=kind)
+        SUBPROCESSES_RUNNING.inc(kind=kind)
+        try:
+            yield
+        finally:
+            SUBPROCESSES_RUNNING.dec(kind=kind)
+            self._release()
+
+    def admitting(self) -> bool:
+        if self.running == 0:
+            return True
+        if self.running >= self.max_running:
+            return False
+        if self.max_load is not None and os.getloadavg()[0] / self.cpus > self.max_load:
+            SUBPROCESSES_THROTTLED.inc(reason="cpu")
+            return False
+        if (
+            self.min_free_disk
+            and shutil.disk_usage(self.disk_path).free < self.min_free_disk
+        ):
+            SUBPROCESSES_THROTTLED.inc(reason="disk")
+            return False
+        return True
+
+    async def _wait(self, repo: str, kind: str):
+        admitted = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(repo, collections.deque()).append(admitted)
+        SUBPROCESSES_QUEUED.inc(kind=kind)
+        try:
+            await admitted
+        except asyncio.CancelledError:
+            if admitted.done() and not admitted.cancelled():
+                self._release()
+            raise
+        finally:
+            SUBPROCESSES_QUEUED.dec(kind=kind)
+
+    def _release(self):
+        self.running -= 1
+        while self._waiting and self.admitting():
+            repo, waiters = next(iter(self._waiting.items()))
+            admitted = waiters.popleft()
+            if waiters:
+                self._waiting.move_to_end(repo)
+            else:
+                del self._waiting[repo]
+            if not admitted.cancelled():
+                self.running += 1
+                admitted.set_result(None)
+
+
+_executor: SubprocessExecutor = SubprocessExecutor()
+
+
+def configure(
+    max_running: int | None = None,
+    max_load: float | None = 2.0,
+    min_free_disk: int = 256 * 1024 * 1024,
+):
+    global _executor
+    _executor = SubprocessExecutor(max_running, max_load, min_free_disk)
+
+
+def executor() -> SubprocessExecutor:
+    return _executor
@@ -0,0 +1,76 @@
+import asyncio
+import dataclasses
+import json
+import statistics
+from pathlib import Path
+
+from onepdd.offload import offloaded, written
+
+
+@dataclasses.dataclass
+class RepoHistory:
+    """
+    Moving averages of how long fetching and scanning the repository took
+    and how many puzzles it had, over its recent deploys.
+    """
+
+    fetch_seconds: float = 0
+    scan_seconds: float = 0
+    puzzles: float = 0
+    deploys: int = 0
+
+    @property
+    def cost(self) -> float:
+        return self.fetch_seconds + self.scan_seconds
+
+
+class DeployHistory:
+    """
+    Per repository deploy history, used to guess how expensive the next
+    deploy will be. Kept in memory and mirrored to a JSON file on flush(),
+    which writes on the I/O pool. Each new
+    sample weighs ``weight`` in the averages, so they follow repositories
+    that grow or shrink.
+    """
+
+    def __init__(self, path: Path, weight: float = 0.3):
+        self.path: Path = path
+        self.weight: float = weight
+        self._repos: dict[str, RepoHistory] = (
+            {key: RepoHistory(**h) for key, h in json.loads(path.read_text()).items()}
+            if path.exists()
+            else {}
+        )
+        self._dirty: bool = False
+        self._flushing: asyncio.Lock = asyncio.Lock()
+
+    def get(self, key: str) -> RepoHistory | None:
+        return self._repos.get(key)
+
+    def record(self, key: str, **samples: float):
+        history = self._repos.setdefault(key, RepoHistory())
+        for name, value in samples.items():
+            old = getattr(history, name)
+            setattr(history, name, old + self.weight * (value - old) if old else value)
+        if "fetch_seconds" in samples:
+            history.deploys += 1
+        self._dirty = True
+
+    def expected(self, key: str) -> float:
+        """
+        Expected seconds to fetch and scan the repository. Repositories
+        never deployed are assumed to be typical: the median of the rest.
+        """
+        if key in self._repos:
+            return self._repos[key].cost
+        if not self._repos:
+            return 0
+        return statistics.median(h.cost for h in self._repos.values())
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        text = json.dumps({k: dataclasses.asdict(h) for k, h in self._repos.items()})
+        self._dirty = False
+        async with self._flushing:
+            await offloaded(written, self.path, text)
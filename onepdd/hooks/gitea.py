@@ -5,16 +5,19 @@ from aiohttp import ClientSession
 from fastapi import Header, HTTPException, Request
 from pydantic import BaseModel
 from starlette import status
-from starlette.templating import Jinja2Templates
 
-from onepdd.config import Config
-from onepdd.exc import OnePddError
-from onepdd.puzzles import Puzzles
+from onepdd.config import Tenant
+from onepdd.deploy import Deployer, DeployJob
 
 from onepdd.repo import GitRepo
-from onepdd.storage import SimpleFsStorage
-from onepdd.tickets import TicketsSimple, Issue
-from onepdd.vcs import Vcs, IssueAuthor
+from onepdd.tenants import UnknownTenantError
+from onepdd.tickets import Issue
+from onepdd.tracing import span
+from onepdd.vcs import ForgeError, Vcs, IssueAuthor, traced_request
+
+
+class GiteaParentInfo(BaseModel):
+    ssh_url: str
 
 
 class GiteaRepoInfo(BaseModel):
@@ -25,67 +28,100 @@ class GiteaRepoInfo(BaseModel):
     ssh_url: str
     clone_url: str
     default_branch: str
+    parent: GiteaParentInfo | None = None
 
 
 class GiteaHookBody(BaseModel):
     repository: GiteaRepoInfo
+    ref: str = ""
+    after: str = ""
+
+    @property
+    def head(self) -> str:
+        """
+        The new tip of the default branch, if this push moved it.
+        """
+        if self.ref == f"refs/heads/{self.repository.default_branch}":
+            return self.after
+        return ""
 
 
 class HookGitea:
-    def __init__(self, config: Config, templates: Jinja2Templates):
-        self.config: Config = config
-        self.templates: Jinja2Templates = templates
+    def __init__(self, deployer: Deployer):
+        self.deployer: Deployer = deployer
 
     async def handle(
         self,
         body: GiteaHookBody,
         request: Request,
-        http_x_gitea_signature: Annotated[str | None, Header()] = None,
+        http_x_gitea_signature: Annotated[
+            str | None, Header(alias="X-Gitea-Signature")
+        ] = None,
+        traceparent: Annotated[str | None, Header()] = None,
     ):
-        await self.check_signature(request, http_x_gitea_signature)
-        async with GitRepo(
-            uri=body.repository.ssh_url,
-            name=body.repository.full_name,
-            master=body.repository.default_branch,
-            head_commit_hash="",
-            id_rsa=self.config.id_rsa,
-        ) as repo, ClientSession() as cs:
-            await Puzzles(
-                repo,
-                SimpleFsStorage.from_vcs(
-                    self.config.storage, "gitea", body.repository.full_name
-                ),
-            ).deploy(TicketsSimple(GiteaVcs(cs, repo, self.config), self.templates))
+        with span("hook.gitea", traceparent, repo=body.repository.full_name):
+            try:
+                tenant = self.deployer.tenants.tenant(
+                    "gitea", body.repository.html_url, body.repository.full_name
+                )
+            except UnknownTenantError:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+            with span("hook.signature"):
+                await self.check_signature(request, http_x_gitea_signature, tenant)
+            await self.deployer.deploy(
+                DeployJob(
+                    tenant=tenant,
+                    uri=body.repository.ssh_url,
+                    name=body.repository.full_name,
+                    master=body.repository.default_branch,
+                    head=body.head,
+                    upstream=(
+                        body.repository.parent.ssh_url if body.repository.parent else ""
+                    ),
+                )
+            )
 
     async def check_signature(
-        self, request: Request, http_x_gitea_signature: str | None
+        self, request: Request, http_x_gitea_signature: str | None, tenant: Tenant
     ):
         if not http_x_gitea_signature:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
         if not hmac.compare_digest(
             hmac.new(
-                self.config.gitea_secret_key, await request.body(), "sha256"
+                tenant.secret_key.encode(), await request.body(), "sha256"
             ).hexdigest(),
             http_x_gitea_signature,
         ):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
 
-class GiteaError(OnePddError):
+class GiteaError(ForgeError):
     pass
 
 
 class GiteaVcs(Vcs):
-    def __init__(self, cs: ClientSession, repo: GitRepo, config: Config):
+    name = "gitea"
+
+    def __init__(self, cs: ClientSession, repo: GitRepo, tenant: Tenant):
         self._cs: ClientSession = cs
         self.repo = repo
-        self.gitea_host: str = config.gitea_host
-        self.token: str = config.gitea_token
+        self.gitea_host: str = tenant.host
+        self.host: str = tenant.host
+        self.token: str = tenant.token
 
     async def issue(self, issue_id: str) -> Issue:
-        async with self._cs.get(
-            f"{self.gitea_host}/api/{self.repo.name}/issues/{issue_id}?token={self.token}"
+        async with traced_request(
+            self._cs,
+            "gitea.issue",
+            "GET",
+            f"{self.gitea_host}/api/{self.repo.name}/issues/{issue_id}?token={self.token}",
         ) as resp:
+            if resp.status != 200:
+                raise GiteaError(
+                    f"Failed to get issue {issue_id}. "
+                    f"repo: {self.repo.name}. Code: {resp.status}",
+                    status=resp.status,
+                )
             body = await resp.json()
             return Issue(
                 author=IssueAuthor(
@@ -97,8 +133,11 @@ class GiteaVcs(Vcs):
             )
 
     async def create_issue(self, title: str, body: str) -> Issue | None:
-        async with self._cs.post(
-            f"{self.gitea_host}/api/{self.repo.name}/issues?token={self.token}?token={self.token}",
+        async with traced_request(
+            self._cs,
+            "gitea.create_issue",
+            "POST",
+            f"{self.gitea_host}/api/{self.repo.name}/issues?token={self.token}",
             json={
                 "title": title,
                 "body": body,
@@ -108,7 +147,8 @@ class GiteaVcs(Vcs):
                 raise GiteaError(
                     f"Failed to create issue. "
                     f"repo: {self.repo.name}. Code: {resp.status}. "
-                    f"Response: {await resp.content.read()!r}"
+                    f"Response: {await resp.content.read()!r}",
+                    status=resp.status,
                 )
             body = await resp.json()
             return Issue(
@@ -121,7 +161,10 @@ class GiteaVcs(Vcs):
             )
 
     async def close_issue(self, issue_id: str):
-        async with self._cs.patch(
+        async with traced_request(
+            self._cs,
+            "gitea.close_issue",
+            "PATCH",
             f"{self.gitea_host}/api/{self.repo.name}/issues/{issue_id}?token={self.token}",
             json={
                 "state": "closed",
@@ -131,14 +174,18 @@ class GiteaVcs(Vcs):
                 raise GiteaError(
                     f"Failed to close issue. Issue id: {issue_id}, "
                     f"repo: {self.repo.name}. Code: {resp.status} "
-                    f"Response: {await resp.content.read()!r}"
+                    f"Response: {await resp.content.read()!r}",
+                    status=resp.status,
                 )
 
     def puzzle_link_for_commit(self, sha: str, file: str, start: str, stop: str) -> str:
         return f"{self.gitea_host}/{self.repo.name}/blob/{sha}/{file}L{start}-L{stop}"
 
     async def add_comment(self, issue_id: str, msg: str):
-        async with self._cs.post(
+        async with traced_request(
+            self._cs,
+            "gitea.add_comment",
+            "POST",
             f"{self.gitea_host}/api/{self.repo.name}/issues/{issue_id}/comments?token={self.token}",
             json={
                 "body": msg,
@@ -149,5 +196,6 @@ class GiteaVcs(Vcs):
                     f"Failed to add comment. "
                     f"issue: {issue_id}. repo: {self.repo.name}. "
                     f"Code: {resp.status}. "
-                    f"Response: {await resp.content.read()!r}"
+                    f"Response: {await resp.content.read()!r}",
+                    status=resp.status,
                 )
@@ -1,70 +1,156 @@
-from typing import Any
+import asyncio
+import hmac
+import logging
+from typing import Annotated, Any
 
-from aiohttp import ClientSession
+from aiohttp import ClientError, ClientSession
+from fastapi import Header, HTTPException, Request
 from pydantic import BaseModel
-from starlette.templating import Jinja2Templates
+from starlette import status
 
-from onepdd.config import Config
-from onepdd.exc import OnePddError
-from onepdd.puzzles import Puzzles
+from onepdd.config import Tenant
+from onepdd.deploy import Deployer, DeployJob
 
 from onepdd.repo import GitRepo
-from onepdd.storage import SimpleFsStorage
-from onepdd.tickets import TicketsSimple, Issue
-from onepdd.vcs import Vcs, IssueAuthor
+from onepdd.tenants import UnknownTenantError
+from onepdd.tickets import Issue
+from onepdd.tracing import span
+from onepdd.vcs import ForgeError, Vcs, IssueAuthor, traced_request
+
+logger = logging.getLogger(__name__)
 
 
 class GithubRepoInfo(BaseModel):
-    id: str
+    id: int | str
     name: str
     full_name: str
     html_url: str
     ssh_url: str
     clone_url: str
     default_branch: str
+    fork: bool = False
 
 
 class GithubHookBody(BaseModel):
     repository: GithubRepoInfo
+    ref: str = ""
+    after: str = ""
+
+    @property
+    def head(self) -> str:
+        """
+        The new tip of the default branch, if this push moved it.
+        """
+        if self.ref == f"refs/heads/{self.repository.default_branch}":
+            return self.after
+        return ""
 
 
 class HookGithub:
-    def __init__(self, config: Config, templates: Jinja2Templates):
-        self.config: Config = config
-        self.templates: Jinja2Templates = templates
-
-    async def handle(self, body: GithubHookBody):
-        # todo: add hook verification
-        async with GitRepo(
-            uri=body.repository.ssh_url,
-            name=body.repository.full_name,
-            master=body.repository.default_branch,
-            head_commit_hash="",
-            id_rsa=self.config.id_rsa,
-        ) as repo, ClientSession() as cs:
-            await Puzzles(
-                repo,
-                SimpleFsStorage.from_vcs(
-                    self.config.storage, "github", body.repository.full_name
-                ),
-            ).deploy(TicketsSimple(GithubVcs(cs, repo, self.config), self.templates))
+    def __init__(self, deployer: Deployer):
+        self.deployer: Deployer = deployer
+        self._parents: dict[str, str] = {}
+
+    async def handle(
+        self,
+        body: GithubHookBody,
+        request: Request,
+        http_x_hub_signature_256: Annotated[
+            str | None, Header(alias="X-Hub-Signature-256")
+        ] = None,
+        traceparent: Annotated[str | None, Header()] = None,
+    ):
+        with span("hook.github", traceparent, repo=body.repository.full_name):
+            try:
+                tenant = self.deployer.tenants.tenant(
+                    "github", body.repository.html_url, body.repository.full_name
+                )
+            except UnknownTenantError:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+            with span("hook.signature"):
+                await self.check_signature(request, http_x_hub_signature_256, tenant)
+            await self.deployer.deploy(
+                DeployJob(
+                    tenant=tenant,
+                    uri=body.repository.ssh_url,
+                    name=body.repository.full_name,
+                    master=body.repository.default_branch,
+                    head=body.head,
+                    upstream=await self.upstream(body.repository, tenant),
+                )
+            )
 
+    async def upstream(self, repo: GithubRepoInfo, tenant: Tenant) -> str:
+        """
+        The SSH URL of the repository the fork was made from. Push payloads
+        only tell whether the repository is a fork, so the parent is looked
+        up through the API, once per fork. Without it the fork is cloned on
+        its own, which is slower but just as correct.
+        """
+        if not repo.fork:
+            return ""
+        key = f"{tenant.name}/{repo.full_name}"
+        if key not in self._parents:
+            try:
+                async with ClientSession() as cs, traced_request(
+                    cs,
+                    "github.repository",
+                    "GET",
+                    f"{tenant.rest_url}/repos/{repo.full_name}",
+                    headers={"Authorization": f"Bearer {tenant.token}"},
+                ) as resp:
+                    if resp.status != 200:
+                        raise GithubError(
+                            f"Failed to get repository {repo.full_name}. "
+                            f"Code: {resp.status}",
+                            status=resp.status,
+                        )
+                    parent = (await resp.json()).get("parent") or {}
+            except (GithubError, ClientError, asyncio.TimeoutError):
+                logger.warning("No parent for fork %s", repo.full_name, exc_info=True)
+                return ""
+            self._parents[key] = parent.get("ssh_url", "")
+        return self._parents[key]
 
-class GithubError(OnePddError):
+    async def check_signature(
+        self, request: Request, http_x_hub_signature_256: str | None, tenant: Tenant
+    ):
+        if not http_x_hub_signature_256:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        expected = hmac.new(
+            tenant.secret_key.encode(), await request.body(), "sha256"
+        ).hexdigest()
+        if not hmac.compare_digest(f"sha256={expected}", http_x_hub_signature_256):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+
+class GithubError(ForgeError):
     pass
 
 
 class GithubVcs(Vcs):
-    def __init__(self, cs: ClientSession, repo: GitRepo, config: dict[str, Any]):
+    name = "github"
+
+    def __init__(self, cs: ClientSession, repo: GitRepo, tenant: Tenant):
         self._cs: ClientSession = cs
         self.repo = repo
-        self.config = config
-        self.auth = config
+        self.host: str = tenant.host
+        self.headers: dict[str, str] = {"Authorization": f"Bearer {tenant.token}"}
 
     async def issue(self, issue_id: str) -> Issue:
-        async with self._cs.get(
-            f"https://github.com/api/{self.repo.name}/issues/{issue_id}"
+        async with traced_request(
+            self._cs,
+            "github.issue",
+            "GET",
+            f"{self.host}/api/{self.repo.name}/issues/{issue_id}",
+            headers=self.headers,
         ) as resp:
+            if resp.status != 200:
+                raise GithubError(
+                    f"Failed to get issue {issue_id}. "
+                    f"repo: {self.repo.name}. Code: {resp.status}",
+                    status=resp.status,
+                )
             body = await resp.json()
             return Issue(
                 author=IssueAuthor(
@@ -76,8 +162,12 @@ class GithubVcs(Vcs):
             )
 
     async def create_issue(self, title: str, body: str) -> Issue | None:
-        async with self._cs.post(
-            f"https://github.com/api/{self.repo.name}/issues",
+        async with traced_request(
+            self._cs,
+            "github.create_issue",
+            "POST",
+            f"{self.host}/api/{self.repo.name}/issues",
+            headers=self.headers,
             json={
                 "title": title,
                 "body": body,
@@ -87,7 +177,8 @@ class GithubVcs(Vcs):
                 raise GithubError(
                     f"Failed to create issue. "
                     f"repo: {self.repo.name}. Code: {resp.status}. "
-                    f"Response: {await resp.content.read()!r}"
+                    f"Response: {await resp.content.read()!r}",
+                    status=resp.status,
                 )
             body = await resp.json()
             return Issue(
@@ -100,8 +191,12 @@ class GithubVcs(Vcs):
             )
 
     async def close_issue(self, issue_id: str):
-        async with self._cs.patch(
-            f"https://github.com/api/{self.repo.name}/issues/{issue_id}",
+        async with traced_request(
+            self._cs,
+            "github.close_issue",
+            "PATCH",
+            f"{self.host}/api/{self.repo.name}/issues/{issue_id}",
+            headers=self.headers,
             json={
                 "state": "closed",
             },
@@ -110,15 +205,20 @@ class GithubVcs(Vcs):
                 raise GithubError(
                     f"Failed to close issue. Issue id: {issue_id}, "
                     f"repo: {self.repo.name}. Code: {resp.status} "
-                    f"Response: {await resp.content.read()!r}"
+                    f"Response: {await resp.content.read()!r}",
+                    status=resp.status,
                 )
 
     def puzzle_link_for_commit(self, sha: str, file: str, start: str, stop: str) -> str:
-        return f"https://github.com/{self.repo.name}/blob/{sha}/{file}L{start}-L{stop}"
+        return f"{self.host}/{self.repo.name}/blob/{sha}/{file}L{start}-L{stop}"
 
     async def add_comment(self, issue_id: str, msg: str):
-        async with self._cs.post(
-            f"https://github.com/api/{self.repo.name}/issues/{issue_id}/comments",
+        async with traced_request(
+            self._cs,
+            "github.add_comment",
+            "POST",
+            f"{self.host}/api/{self.repo.name}/issues/{issue_id}/comments",
+            headers=self.headers,
             json={
                 "body": msg,
             },
@@ -128,5 +228,187 @@ class GithubVcs(Vcs):
                     f"Failed to add comment. "
                     f"issue: {issue_id}. repo: {self.repo.name}. "
                     f"Code: {resp.status}. "
-                    f"Response: {await resp.content.read()!r}"
+                    f"Response: {await resp.content.read()!r}",
+                    status=resp.status,
                 )
+
+
+ISSUE_FIELDS = """
+fragment issue on Issue {
+  id
+  number
+  url
+  state
+  author { login ... on User { databaseId } }
+}
+"""
+
+
+class GithubGraphqlVcs(Vcs):
+    """
+    GitHub through its GraphQL API: the state of up to ``batch_size``
+    issues is read in one query and closing an issue with its comment is
+    one request. Node ids of the issues seen are kept, so the mutations
+    that need them do not look them up again.
+    """
+
+    name = "github"
+    batch_size = 100
+
+    def __init__(self, cs: ClientSession, repo: GitRepo, tenant: Tenant):
+        self._cs: ClientSession = cs
+        self.repo = repo
+        self.host: str = tenant.host
+        self.endpoint: str = tenant.graphql_url
+        self.headers: dict[str, str] = {"Authorization": f"Bearer {tenant.token}"}
+        self._nodes: dict[str, str] = {}
+        self._repository: str | None = None
+
+    async def issue(self, issue_id: str) -> Issue:
+        return (await self.issues([issue_id]))[issue_id]
+
+    async def issues(self, issue_ids: list[str]) -> dict[str, Issue]:
+        found = {}
+        for start in range(0, len(issue_ids), self.batch_size):
+            chunk = issue_ids[start : start + self.batch_size]
+            data = await self._request(
+                "Issues",
+                "query Issues($owner: String!, $name: String!, %s) {"
+                " repository(owner: $owner, name: $name) { %s } }%s"
+                % (
+                    ", ".join(f"$i{n}: Int!" for n in range(len(chunk))),
+                    " ".join(
+                        f"i{n}: issue(number: $i{n}) {{ ...issue }}"
+                        for n in range(len(chunk))
+                    ),
+                    ISSUE_FIELDS,
+                ),
+                **self._owner_and_name(),
+                **{f"i{n}": int(number) for n, number in enumerate(chunk)},
+            )
+            for n, number in enumerate(chunk):
+                node = data["repository"][f"i{n}"]
+                if node is None:
+                    raise GithubError(
+                        f"Issue {number} not found in repo {self.repo.name}",
+                        status=404,
+                    )
+                found[number] = self._issue(node)
+        return found
+
+    async def create_issue(self, title: str, body: str) -> Issue | None:
+        data = await self._request(
+            "CreateIssue",
+            "mutation CreateIssue($repository: ID!, $title: String!, $body: String!)"
+            " { createIssue(input: {repositoryId: $repository, title: $title,"
+            " body: $body}) { issue { ...issue } } }" + ISSUE_FIELDS,
+            repository=await self._repository_id(),
+            title=title,
+            body=body,
+        )
+        return self._issue(data["createIssue"]["issue"])
+
+    async def close_issue(self, issue_id: str):
+        await self._request(
+            "CloseIssue",
+            "mutation CloseIssue($issue: ID!)"
+            " { closeIssue(input: {issueId: $issue}) { clientMutationId } }",
+            issue=await self._node(issue_id),
+        )
+
+    async def add_comment(self, issue_id: str, msg: str):
+        await self._request(
+            "AddComment",
+            "mutation AddComment($issue: ID!, $body: String!)"
+            " { addComment(input: {subjectId: $issue, body: $body})"
+            " { clientMutationId } }",
+            issue=await self._node(issue_id),
+            body=msg,
+        )
+
+    async def close_with_comment(self, issue_id: str, msg: str):
+        await self._request(
+            "CloseWithComment",
+            "mutation CloseWithComment($issue: ID!, $body: String!) {"
+            " closeIssue(input: {issueId: $issue}) { clientMutationId }"
+            " addComment(input: {subjectId: $issue, body: $body})"
+            " { clientMutationId } }",
+            issue=await self._node(issue_id),
+            body=msg,
+        )
+
+    def puzzle_link_for_commit(self, sha: str, file: str, start: str, stop: str) -> str:
+        return f"{self.host}/{self.repo.name}/blob/{sha}/{file}L{start}-L{stop}"
+
+    async def _node(self, issue_id: str) -> str:
+        if issue_id not in self._nodes:
+            await self.issues([issue_id])
+        return self._nodes[issue_id]
+
+    async def _repository_id(self) -> str:
+        if self._repository is None:
+            data = await self._request(
+                "Repository",
+                "query Repository($owner: String!, $name: String!)"
+                " { repository(owner: $owner, name: $name) { id } }",
+                **self._owner_and_name(),
+            )
+            self._repository = data["repository"]["id"]
+        return self._repository
+
+    def _owner_and_name(self) -> dict[str, str]:
+        owner, _, name = self.repo.name.partition("/")
+        return {"owner": owner, "name": name}
+
+    def _issue(self, node: dict[str, Any]) -> Issue:
+        number = str(node["number"])
+        self._nodes[number] = node["id"]
+        author = node.get("author") or {}
+        return Issue(
+            author=IssueAuthor(
+                id=str(author.get("databaseId", "")),
+                username=author.get("login", ""),
+            ),
+            href=node["url"],
+            closed=node["state"] == "CLOSED",
+            number=number,
+        )
+
+    async def _request(self, operation: str, query: str, **variables) -> dict:
+        async with traced_request(
+            self._cs,
+            f"github.graphql.{operation}",
+            "POST",
+            self.endpoint,
+            headers=self.headers,
+            json={
+                "query": query,
+                "operationName": operation,
+                "variables": variables,
+            },
+        ) as resp:
+            if resp.status != 200:
+                raise GithubError(
+                    f"GraphQL {operation} failed. "
+                    f"repo: {self.repo.name}. Code: {resp.status}. "
+                    f"Response: {await resp.content.read()!r}",
+                    status=resp.status,
+                )
+            body = await resp.json()
+        if body.get("errors"):
+            raise GithubError(
+                f"GraphQL {operation} failed. repo: {self.repo.name}. "
+                f"Errors: {[e.get('message') for e in body['errors']]}",
+                status=(
+                    429
+                    if any(e.get("type") == "RATE_LIMITED" for e in body["errors"])
+                    else 422
+                ),
+            )
+        return body["data"]
+
+
+def github_vcs(cs: ClientSession, repo: GitRepo, tenant: Tenant) -> Vcs:
+    if tenant.api == "graphql":
+        return GithubGraphqlVcs(cs, repo, tenant)
+    return GithubVcs(cs, repo, tenant)
@@ -0,0 +1,157 @@
+import bisect
+import collections
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Any
+
+from onepdd.state import PuzzleStatus
+from onepdd.storage import Storage
+
+
+def aware(moment: datetime) -> datetime:
+    """
+    The moment itself, or the same wall time in UTC if it has no timezone,
+    so that naive and aware datetimes compare.
+    """
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+class PuzzleIndex:
+    """
+    Secondary indexes over the puzzles of one repository. Every query
+    returns positions in the stored order, which is what cursors point to.
+    """
+
+    def __init__(self, puzzles: list[dict[str, Any]]):
+        self.puzzles: list[dict[str, Any]] = puzzles
+        self.etag: str = hashlib.sha1(
+            json.dumps(puzzles, sort_keys=True).encode()
+        ).hexdigest()
+        self._by: dict[str, dict[Any, list[int]]] = {
+            field: collections.defaultdict(list)
+            for field in ("alive", "closed", "author", "role", "ticket")
+        }
+        self._files: list[tuple[str, int]] = []
+        self._times: list[tuple[datetime, int]] = []
+        for pos, puzzle in enumerate(puzzles):
+            issue = puzzle.get("issue")
+            self._by["alive"][puzzle["alive"]].append(pos)
+            self._by["closed"][bool(issue and issue.get("closed"))].append(pos)
+            self._by["author"][puzzle["author"]].append(pos)
+            self._by["role"][puzzle["role"]].append(pos)
+            self._by["ticket"][puzzle["ticket"]].append(pos)
+            self._files.append((puzzle["file"], pos))
+            self._times.append((aware(datetime.fromisoformat(puzzle["time"])), pos))
+        self._files.sort()
+        self._times.sort()
+
+    def query(
+        self,
+        alive: bool | None = None,
+        closed: bool | None = None,
+        author: str | None = None,
+        role: str | None = None,
+        ticket: str | None = None,
+        file_prefix: str | None = None,
+        older_than: datetime | None = None,
+        newer_than: datetime | None = None,
+        after: int = -1,
+        limit: int = 100,
+    ) -> list[int]:
+        matches: list[set[int]] = [
+            set(self._by[field].get(value, ()))
+            for field, value in (
+                ("alive", alive),
+                ("closed", closed),
+                ("author", author),
+                ("role", role),
+                ("ticket", ticket),
+            )
+            if value is not None
+        ]
+        if file_prefix is not None:
+            start = bisect.bisect_left(self._files, (file_prefix, -1))
+            end = bisect.bisect_left(self._files, (file_prefix + "\U0010ffff", -1))
+            matches.append({pos for _, pos in self._files[start:end]})
+        if older_than is not None or newer_than is not None:
+            older_than = aware(older_than) if older_than is not None else None
+            newer_than = aware(newer_than) if newer_than is not None else None
+            start = (
+                bisect.bisect_right(self._times, (newer_than, len(self.puzzles)))
+                if newer_than is not None
+                else 0
+            )
+            end = (
+                bisect.bisect_left(self._times, (older_than, -1))
+                if older_than is not None
+                else len(self._times)
+            )
+            matches.append({pos for _, pos in self._times[start:end]})
+        if matches:
+            matches.sort(key=len)
+            found = sorted(set.intersection(*matches))
+            begin = bisect.bisect_right(found, after)
+            return found[begin : begin + limit]
+        return list(range(after + 1, min(after + 1 + limit, len(self.puzzles))))
+
+
+class IndexCache:
+    """
+    Latest puzzles of the ``size`` most recently used repositories, indexed
+    on first query. Each entry remembers the storage version it was read
+    at and is read again once the storage moves past it, which is how
+    saves of other nodes show up. IndexedStorage refreshes it on every
+    load and save of this process.
+    """
+
+    def __init__(self, size: int = 256):
+        self.size: int = size
+        self._puzzles: collections.OrderedDict[
+            str, tuple[str | None, list[dict[str, Any]]]
+        ] = collections.OrderedDict()
+        self._indexes: dict[str, PuzzleIndex] = {}
+
+    def update(
+        self, key: str, puzzles: list[dict[str, Any]], version: str | None = None
+    ):
+        self._puzzles[key] = (version, puzzles)
+        self._puzzles.move_to_end(key)
+        self._indexes.pop(key, None)
+        while len(self._puzzles) > self.size:
+            evicted, _ = self._puzzles.popitem(last=False)
+            self._indexes.pop(evicted, None)
+
+    async def index(self, key: str, storage: Storage) -> PuzzleIndex:
+        version = await storage.version()
+        cached = self._puzzles.get(key)
+        if cached is None or version is None or cached[0] != version:
+            self.update(key, await storage.load(), version)
+        else:
+            self._puzzles.move_to_end(key)
+        if key not in self._indexes:
+            self._indexes[key] = PuzzleIndex(self._puzzles[key][1])
+        return self._indexes[key]
+
+
+class IndexedStorage(Storage):
+    def __init__(self, origin: Storage, key: str, cache: IndexCache):
+        self.origin: Storage = origin
+        self.key: str = key
+        self.cache: IndexCache = cache
+
+    async def save(self, data: list[dict[str, Any]]):
+        await self.origin.save(data)
+        self.cache.update(self.key, data)
+
+    async def load(self) -> list[dict[str, Any]]:
+        version = await self.origin.version()
+        data = await self.origin.load()
+        self.cache.update(self.key, data, version)
+        return data
+
+    async def statuses(self) -> dict[str, PuzzleStatus]:
+        return await self.origin.statuses()
+
+    async def version(self) -> str | None:
+        return await self.origin.version()
@@ -0,0 +1,358 @@
+import bisect
+import contextlib
+import math
+import time
+from abc import ABC, abstractmethod
+from typing import Iterator, TypeVar
+
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+LabelValues = tuple[str, ...]
+M = TypeVar("M", bound="Metric")
+
+
+class Metric(ABC):
+    kind: str
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labelnames: tuple[str, ...] = labelnames
+
+    def key(self, labels: dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        pass
+
+    def exposition(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *(
+                f"{name}{formatted_labels(labels)} {formatted_value(value)}"
+                for name, labels, value in self.samples()
+            ),
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        if amount < 0:
+            raise ValueError("Counters can only be incremented by non-negative amounts")
+        key = self.key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self.key(labels), 0)
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}_total", dict(zip(self.labelnames, key)), value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str):
+        self._values[self.key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self.key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self.key(labels), 0)
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        for key, value in sorted(self._values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets: tuple[float, ...] = tuple(sorted(buckets))
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self.key(labels)
+        counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] = self._sums.get(key, 0) + value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[dict[str, str]]:
+        """
+        Observe the duration of the block. The yielded dict holds the labels
+        and may be updated inside the block, e.g. to record the outcome.
+        """
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        return sum(self._counts.get(self.key(labels), []))
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        for key, counts in sorted(self._counts.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip([*self.buckets, math.inf], counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {
+                    **labels,
+                    "le": formatted_value(bound),
+                }, cumulative
+            yield f"{self.name}_sum", labels, self._sums[key]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: M) -> M:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def exposition(self) -> str:
+        return "".join(
+            line + "\n"
+            for metric in self._metrics.values()
+            for line in metric.exposition()
+        )
+
+
+def formatted_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{escaped(value)}"' for name, value in labels.items())
+        + "}"
+    )
+
+
+def escaped(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def formatted_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+GIT_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "onepdd_git_seconds",
+        "Time spent cloning or pulling repositories.",
+        ("operation",),
+    )
+)
+SCAN_SECONDS: Histogram = REGISTRY.register(
+    Histogram("onepdd_scan_seconds", "Time spent running gopdd on a repository.")
+)
+STORAGE_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "onepdd_storage_seconds",
+        "Time spent loading or saving puzzle state.",
+        ("operation",),
+    )
+)
+VCS_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "onepdd_vcs_seconds",
+        "Time spent in forge API calls.",
+        ("host", "method", "status"),
+    )
+)
+PUZZLES_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "onepdd_puzzles_seconds",
+        "Time spent joining and exposing puzzles.",
+        ("operation",),
+    )
+)
+PUZZLES_ADDED: Counter = REGISTRY.register(
+    Counter(
+        "onepdd_puzzles_added",
+        "Puzzles found in the code for the first time.",
+        ("repo",),
+    )
+)
+TICKETS_OPENED: Counter = REGISTRY.register(
+    Counter("onepdd_tickets_opened", "Tickets submitted for puzzles.", ("repo",))
+)
+TICKETS_CLOSED: Counter = REGISTRY.register(
+    Counter("onepdd_tickets_closed", "Tickets closed for gone puzzles.", ("repo",))
+)
+STARTUP_SECONDS: Gauge = REGISTRY.register(
+    Gauge(
+        "onepdd_startup_seconds",
+        "Time from importing onepdd.app until the worker was ready.",
+    )
+)
+TENANT_DEPLOYS: Gauge = REGISTRY.register(
+    Gauge(
+        "onepdd_tenant_deploys_in_flight",
+        "Deploys currently running per tenant.",
+        ("tenant",),
+    )
+)
+RESYNC_RUNS: Counter = REGISTRY.register(
+    Counter(
+        "onepdd_resync_runs",
+        "Scheduled resync decisions by outcome.",
+        ("outcome",),
+    )
+)
+DEPLOYS_SKIPPED: Counter = REGISTRY.register(
+    Counter(
+        "onepdd_deploys_skipped",
+        "Deploys skipped before cloning, by reason.",
+        ("reason",),
+    )
+)
+SUBPROCESSES_QUEUED: Gauge = REGISTRY.register(
+    Gauge(
+        "onepdd_subprocesses_queued",
+        "Git and scan subprocesses waiting for admission.",
+        ("kind",),
+    )
+)
+SUBPROCESSES_RUNNING: Gauge = REGISTRY.register(
+    Gauge(
+        "onepdd_subprocesses_running",
+        "Git and scan subprocesses currently admitted.",
+        ("kind",),
+    )
+)
+SUBPROCESS_WAIT_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "onepdd_subprocess_wait_seconds",
+        "Time git and scan subprocesses waited for admission.",
+        ("kind",),
+    )
+)
+SUBPROCESSES_THROTTLED: Counter = REGISTRY.register(
+    Counter(
+        "onepdd_subprocesses_throttled",
+        "Admissions held back by host pressure, by reason.",
+        ("reason",),
+    )
+)
+DISK_BYTES: Gauge = REGISTRY.register(
+    Gauge(
+        "onepdd_disk_bytes",
+        "Disk used by cached clones, puzzle state and the archive.",
+        ("kind",),
+    )
+)
+CLONES_EVICTED: Counter = REGISTRY.register(
+    Counter("onepdd_clones_evicted", "Cached clones removed, by reason.", ("reason",))
+)
+PUZZLES_ARCHIVED: Counter = REGISTRY.register(
+    Counter(
+        "onepdd_puzzles_archived",
+        "Long-closed puzzles moved out of the state into the archive.",
+    )
+)
+LOOP_LAG_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "onepdd_loop_lag_seconds",
+        "How late the event loop woke up from a short sleep.",
+    )
+)
+LOOP_STALLS: Counter = REGISTRY.register(
+    Counter(
+        "onepdd_loop_stalls",
+        "Times the event loop was blocked for longer than the threshold.",
+    )
+)
+OUTBOX_PENDING: Gauge = REGISTRY.register(
+    Gauge(
+        "onepdd_outbox_pending",
+        "Ticket operations waiting in the outbox for their forge.",
+    )
+)
+OUTBOX_DEFERRED: Counter = REGISTRY.register(
+    Counter(
+        "onepdd_outbox_deferred",
+        "Ticket operations put in the outbox, by reason.",
+        ("reason",),
+    )
+)
+TICKETS_FAILED: Counter = REGISTRY.register(
+    Counter(
+        "onepdd_tickets_failed",
+        "Ticket operations the forge refused for good, by operation.",
+        ("operation",),
+    )
+)
+STAGE_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "onepdd_stage_seconds",
+        "Time deploys spent in each pipeline stage.",
+        ("stage",),
+    )
+)
+STAGE_QUEUED: Gauge = REGISTRY.register(
+    Gauge(
+        "onepdd_stage_queued",
+        "Deploys waiting for a worker of each pipeline stage.",
+        ("stage",),
+    )
+)
@@ -0,0 +1,85 @@
+"""
+Blocking file system work, run on a bounded thread pool instead of the
+event loop, so a slow disk does not stall every other webhook.
+"""
+import asyncio
+import functools
+import os
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+_pool: ThreadPoolExecutor = ThreadPoolExecutor(4, thread_name_prefix="onepdd-io")
+
+
+def configure(max_workers: int):
+    global _pool
+    _pool.shutdown(wait=False)
+    _pool = ThreadPoolExecutor(max_workers, thread_name_prefix="onepdd-io")
+
+
+async def offloaded(fn: Callable[..., T], *args, **kwargs) -> T:
+    return await asyncio.get_running_loop().run_in_executor(
+        _pool, functools.partial(fn, *args, **kwargs)
+    )
+
+
+def written(path: Path, text: str, durable: bool = False):
+    """
+    Write the file through a temporary sibling, so that neither a reader
+    nor a crash in the middle ever sees half of it. A ``durable`` write is
+    synced to disk before it replaces the file, so it survives a power
+    loss too.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with tmp.open("w") as f:
+        f.write(text)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    tmp.replace(path)
+
+
+class Reaper:
+    """
+    Deletes directories in the background. The directory is first renamed
+    into ``trash``, which is instant on the same file system, so for the
+    caller it is gone right away; the recursive delete of a possibly huge
+    clone then runs on the pool. Directories on another file system are
+    renamed next to where they are instead.
+    """
+
+    def __init__(self, trash: Path):
+        self.trash: Path = trash
+
+    def reap(self, path: Path):
+        self.trash.mkdir(parents=True, exist_ok=True)
+        name = f"{path.name}-{uuid.uuid4().hex}"
+        target = self.trash / name
+        try:
+            path.rename(target)
+        except OSError:
+            target = path.with_name(f".{name}.reaped")
+            path.rename(target)
+        _pool.submit(shutil.rmtree, target, True)
+
+    def purge(self):
+        """
+        Delete whatever a previous process left in the trash.
+        """
+        if self.trash.exists():
+            for leftover in self.trash.iterdir():
+                _pool.submit(shutil.rmtree, leftover, True)
+
+
+_reaper: Reaper = Reaper(Path(tempfile.gettempdir()) / "onepdd-trash")
+
+
+def reaper() -> Reaper:
+    return _reaper
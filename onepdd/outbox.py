@@ -0,0 +1,334 @@
+"""
+Ticket work that could not reach the forge, kept on disk until it can.
+
+When the forge of a repository is down, or has failed often enough for
+its circuit breaker to open, the tickets a deploy wants to open or close
+are written to the outbox instead of failing the deploy. A drainer
+retries them in the background by exposing the stored state again, so a
+forge outage never costs another clone and scan.
+
+Only outages count: a forge that cannot be reached, fails with a server
+error or rate limits. A request it refuses for good, say for a deleted
+repository, fails just that ticket operation, and is tried again by the
+next deploy that needs it.
+"""
+import asyncio
+import dataclasses
+import json
+import logging
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from aiohttp import ClientError, ClientResponseError
+
+from onepdd.config import Tenant
+from onepdd.metrics import OUTBOX_DEFERRED, OUTBOX_PENDING, TICKETS_FAILED
+from onepdd.offload import offloaded, written
+from onepdd.repo import GitRepo
+from onepdd.storage import StoredPuzzle
+from onepdd.tickets import Tickets
+from onepdd.vcs import ForgeError, Issue
+
+logger = logging.getLogger(__name__)
+
+FORGE_ERRORS = (ForgeError, ClientError, asyncio.TimeoutError)
+
+
+def outage(error: BaseException) -> bool:
+    """
+    Whether the error means the forge is down or overloaded, rather than
+    refusing the one request.
+    """
+    if isinstance(error, ForgeError):
+        return error.transient
+    if isinstance(error, ClientResponseError):
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, FORGE_ERRORS)
+
+
+@dataclasses.dataclass
+class Pending:
+    """
+    A ticket to open or close, with what is needed to do it without the
+    clone: the repository, its ``.0nepdd.yml`` and the deployed commit.
+    """
+
+    tenant: str
+    host: str
+    uri: str
+    name: str
+    master: str
+    sha: str
+    config: dict[str, Any]
+    operation: str
+    puzzle: str
+    id: str = ""
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failures`` consecutive failures and stays open for
+    ``cooldown`` seconds. After that a call is let through again; another
+    failure opens it right away, a success closes it.
+    """
+
+    def __init__(self, failures: int = 5, cooldown: float = 60):
+        self.failures: int = failures
+        self.cooldown: float = cooldown
+        self._failed: int = 0
+        self._opened: float | None = None
+
+    @property
+    def open(self) -> bool:
+        return self._opened is not None
+
+    def allows(self, now: float | None = None) -> bool:
+        if self._opened is None:
+            return True
+        return (
+            time.monotonic() if now is None else now
+        ) - self._opened >= self.cooldown
+
+    def succeeded(self):
+        self._failed = 0
+        self._opened = None
+
+    def failed(self, now: float | None = None):
+        self._failed += 1
+        if self._opened is not None or self._failed >= self.failures:
+            self._opened = time.monotonic() if now is None else now
+
+
+class Outbox:
+    """
+    Pending ticket operations, one JSON file each in ``path``, plus a
+    circuit breaker per forge host.
+    """
+
+    def __init__(self, path: Path, failures: int = 5, cooldown: float = 60):
+        self.path: Path = path
+        self.failures: int = failures
+        self.cooldown: float = cooldown
+        self._pending: dict[str, Pending] = (
+            {
+                file.stem: Pending(**json.loads(file.read_text()))
+                for file in sorted(path.glob("*.json"))
+            }
+            if path.exists()
+            else {}
+        )
+        self._breakers: dict[str, CircuitBreaker] = {}
+        OUTBOX_PENDING.set(len(self._pending))
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(self.failures, self.cooldown)
+        return self._breakers[host]
+
+    def pending(self) -> list[Pending]:
+        return list(self._pending.values())
+
+    def waiting(self, tenant: str, name: str) -> set[str]:
+        """
+        Ids of the puzzles of the repository with an operation pending.
+        """
+        return {
+            p.puzzle
+            for p in self._pending.values()
+            if p.tenant == tenant and p.name == name
+        }
+
+    async def add(self, pending: Pending):
+        pending.id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        await offloaded(
+            written,
+            self.path / f"{pending.id}.json",
+            json.dumps(dataclasses.asdict(pending)),
+            durable=True,
+        )
+        self._pending[pending.id] = pending
+        OUTBOX_PENDING.set(len(self._pending))
+
+    async def remove(self, done: list[Pending]):
+        for pending in done:
+            if self._pending.pop(pending.id, None) is not None:
+                await offloaded(
+                    (self.path / f"{pending.id}.json").unlink, missing_ok=True
+                )
+        OUTBOX_PENDING.set(len(self._pending))
+
+
+class OutboxTickets(Tickets):
+    """
+    Hands ticket operations to the forge while its breaker is closed, and
+    to the outbox when it is open or the forge fails. Puzzles that already
+    wait in the outbox are left alone, so they are not submitted twice.
+    """
+
+    def __init__(self, origin: Tickets, outbox: Outbox, tenant: Tenant, repo: GitRepo):
+        self.origin: Tickets = origin
+        self.outbox: Outbox = outbox
+        self.tenant: Tenant = tenant
+        self.repo: GitRepo = repo
+
+    async def submit(self, puzzle: StoredPuzzle) -> Issue | None:
+        return await self._deliver("submit", puzzle, self.origin.submit)
+
+    async def close(self, puzzle: StoredPuzzle) -> bool:
+        return bool(await self._deliver("close", puzzle, self.origin.close))
+
+    async def notify(self, issue: Issue, message: str):
+        await self.origin.notify(issue, message)
+
+    async def prefetch(self, puzzles: list[StoredPuzzle]):
+        if not self.outbox.breaker(self.tenant.host).allows():
+            return
+        try:
+            await self.origin.prefetch(puzzles)
+        except FORGE_ERRORS as e:
+            if not outage(e):
+                raise
+            logger.warning("Prefetch from %s failed", self.tenant.host, exc_info=True)
+
+    async def _deliver(
+        self,
+        operation: str,
+        puzzle: StoredPuzzle,
+        send: Callable[[StoredPuzzle], Awaitable[Any]],
+    ) -> Any:
+        if puzzle.id in self.outbox.waiting(self.tenant.name, self.repo.name):
+            return None
+        breaker = self.outbox.breaker(self.tenant.host)
+        if not breaker.allows():
+            await self._defer(operation, puzzle, "open")
+            return None
+        try:
+            result = await send(puzzle)
+        except FORGE_ERRORS as e:
+            if not outage(e):
+                raise
+            logger.warning(
+                "Deferring %s of %s in %s",
+                operation,
+                puzzle.id,
+                self.repo.name,
+                exc_info=True,
+            )
+            breaker.failed()
+            await self._defer(operation, puzzle, "error")
+            return None
+        breaker.succeeded()
+        return result
+
+    async def _defer(self, operation: str, puzzle: StoredPuzzle, reason: str):
+        OUTBOX_DEFERRED.inc(reason=reason)
+        await self.outbox.add(
+            Pending(
+                tenant=self.tenant.name,
+                host=self.tenant.host,
+                uri=self.repo.uri,
+                name=self.repo.name,
+                master=self.repo.master,
+                sha=self.repo.head_commit_hash,
+                config=self.repo.config,
+                operation=operation,
+                puzzle=puzzle.id,
+            )
+        )
+
+
+class IsolatedTickets(Tickets):
+    """
+    Fails a ticket operation the forge refuses for good on its own, logged
+    and counted, so one bad puzzle does not stop the tickets of the rest.
+    Outages still raise.
+    """
+
+    def __init__(self, origin: Tickets, repo: GitRepo):
+        self.origin: Tickets = origin
+        self.repo: GitRepo = repo
+
+    async def submit(self, puzzle: StoredPuzzle) -> Issue | None:
+        return await self._isolated("submit", puzzle.id, self.origin.submit(puzzle))
+
+    async def close(self, puzzle: StoredPuzzle) -> bool:
+        return bool(await self._isolated("close", puzzle.id, self.origin.close(puzzle)))
+
+    async def notify(self, issue: Issue, message: str):
+        await self._isolated("notify", issue.number, self.origin.notify(issue, message))
+
+    async def prefetch(self, puzzles: list[StoredPuzzle]):
+        await self._isolated("prefetch", self.repo.name, self.origin.prefetch(puzzles))
+
+    async def _isolated(self, operation: str, subject: str, call: Awaitable) -> Any:
+        try:
+            return await call
+        except FORGE_ERRORS as e:
+            if outage(e):
+                raise
+            logger.error(
+                "Forge refused %s of %s in %s",
+                operation,
+                subject,
+                self.repo.name,
+                exc_info=True,
+            )
+            TICKETS_FAILED.inc(operation=operation)
+            return None
+
+
+class Drainer:
+    """
+    Every ``interval`` hands the pending operations of each repository
+    whose forge breaker lets calls through to ``redeliver``, and drops
+    them from the outbox once it returns.
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        redeliver: Callable[[list[Pending]], Awaitable[None]],
+        interval: float = 30,
+    ):
+        self.outbox: Outbox = outbox
+        self.redeliver: Callable[[list[Pending]], Awaitable[None]] = redeliver
+        self.interval: float = interval
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.drain()
+            except Exception:
+                logger.exception("Draining the outbox failed")
+
+    async def drain(self) -> int:
+        """
+        Redeliver what can be, returning how many operations went out.
+        """
+        repos: dict[tuple[str, str], list[Pending]] = {}
+        for pending in self.outbox.pending():
+            repos.setdefault((pending.tenant, pending.name), []).append(pending)
+        delivered = 0
+        for batch in repos.values():
+            breaker = self.outbox.breaker(batch[0].host)
+            if not breaker.allows():
+                continue
+            try:
+                await self.redeliver(batch)
+            except FORGE_ERRORS as e:
+                if not outage(e):
+                    logger.exception("Redelivery to %s failed", batch[0].name)
+                    continue
+                logger.warning("Forge %s still failing", batch[0].host, exc_info=True)
+                breaker.failed()
+                continue
+            except Exception:
+                logger.exception("Redelivery to %s failed", batch[0].name)
+                continue
+            breaker.succeeded()
+            await self.outbox.remove(batch)
+            delivered += len(batch)
+        return delivered
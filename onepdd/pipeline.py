@@ -0,0 +1,183 @@
+"""
+A fixed chain of stages, each with its own bounded queue and workers.
+
+An item goes through the stages in order, but different items can be in
+different stages at once: while one repository waits on the forge, the
+next one is scanned and a third one is cloned. A full queue holds the
+stage before it back, so a slow stage cannot pile up work it will only
+get to much later.
+
+Each queue hands out the cheapest item first, by the ``priority`` of the
+pipeline, aged by ``aging`` seconds of cost per second of waiting so an
+expensive item is never starved. Without a priority it is first in,
+first out.
+
+Items can be cancelled while they are queued for or running in a stage
+marked ``cancellable``; once they are past those, they run to the end.
+
+Every stage works on an item in the context ``run`` was called in, so
+context variables such as the current trace span follow the item rather
+than whichever item happened to start the workers.
+"""
+import asyncio
+import contextvars
+import dataclasses
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Generic, TypeVar
+
+from onepdd.exc import OnePddError
+from onepdd.metrics import STAGE_QUEUED, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ItemCancelledError(OnePddError):
+    pass
+
+
+@dataclasses.dataclass
+class Stage(Generic[T]):
+    """
+    ``handle`` does the stage's work on an item and returns whether the
+    item goes on to the next stage.
+    """
+
+    name: str
+    handle: Callable[[T], Awaitable[bool]]
+    workers: int = 1
+    capacity: int = 16
+    cancellable: bool = False
+
+
+class Pipeline(Generic[T]):
+    """
+    ``finish`` is called for every item once it leaves the pipeline,
+    whether it went through every stage, stopped early or failed.
+    """
+
+    def __init__(
+        self,
+        stages: list[Stage[T]],
+        finish: Callable[[T], Awaitable[None]] | None = None,
+        priority: Callable[[T], float] | None = None,
+        aging: float = 1.0,
+    ):
+        self.stages: list[Stage[T]] = stages
+        self.finish: Callable[[T], Awaitable[None]] | None = finish
+        self.priority: Callable[[T], float] | None = priority
+        self.aging: float = aging
+        self._queues: list[asyncio.PriorityQueue] = []
+        self._workers: list[asyncio.Task] = []
+        self._order: itertools.count = itertools.count()
+        self._stage: dict[int, int] = {}
+        self._running: dict[int, asyncio.Task] = {}
+        self._cancelled: set[int] = set()
+        self._contexts: dict[int, contextvars.Context] = {}
+
+    async def run(self, item: T):
+        """
+        Put the item through the stages and wait until it leaves them,
+        raising what the stage it failed in raised.
+        """
+        if not self._workers:
+            self._start()
+        done = asyncio.get_running_loop().create_future()
+        self._contexts[id(item)] = contextvars.copy_context()
+        await self._put(0, item, done)
+        await asyncio.shield(done)
+
+    def cancel(self, item: T) -> bool:
+        """
+        Cancel the item if it is in a cancellable stage, killing the work
+        the stage is doing on it. Its ``run`` raises ItemCancelledError.
+        """
+        n = self._stage.get(id(item))
+        if n is None or not self.stages[n].cancellable:
+            return False
+        self._cancelled.add(id(item))
+        if id(item) in self._running:
+            self._running[id(item)].cancel()
+        return True
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _start(self):
+        self._queues = [asyncio.PriorityQueue(stage.capacity) for stage in self.stages]
+        self._workers = [
+            asyncio.create_task(
+                self._work(n),
+                name=f"stage-{stage.name}-{w}",
+                context=contextvars.Context(),
+            )
+            for n, stage in enumerate(self.stages)
+            for w in range(stage.workers)
+        ]
+
+    async def _work(self, n: int):
+        stage, queue = self.stages[n], self._queues[n]
+        while True:
+            *_, item, done = await queue.get()
+            STAGE_QUEUED.dec(stage=stage.name)
+            try:
+                if id(item) in self._cancelled:
+                    raise ItemCancelledError(f"Cancelled before {stage.name}")
+                with STAGE_SECONDS.time(stage=stage.name):
+                    more = await self._handle(stage, item)
+                if more and n + 1 < len(self.stages):
+                    await self._put(n + 1, item, done)
+                    continue
+            except Exception as e:
+                await self._finish(item)
+                if not done.done():
+                    done.set_exception(e)
+                continue
+            await self._finish(item)
+            if not done.done():
+                done.set_result(None)
+
+    async def _handle(self, stage: Stage[T], item: T) -> bool:
+        task = asyncio.create_task(stage.handle(item), context=self._contexts[id(item)])
+        if not stage.cancellable:
+            return await task
+        self._running[id(item)] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if id(item) not in self._cancelled:
+                task.cancel()
+                raise
+            raise ItemCancelledError(f"Cancelled in {stage.name}")
+        finally:
+            del self._running[id(item)]
+
+    async def _put(self, n: int, item: T, done: asyncio.Future):
+        """
+        Queue the item for stage ``n``. Waiting lowers the cost of an item
+        by ``aging`` per second, the same for everyone, so the order by
+        cost minus aging times waited equals the order by cost plus aging
+        times the time it was queued at, which does not change.
+        """
+        cost = self.priority(item) if self.priority is not None else 0
+        key = cost + self.aging * time.monotonic()
+        self._stage[id(item)] = n
+        await self._queues[n].put((key, next(self._order), item, done))
+        STAGE_QUEUED.inc(stage=self.stages[n].name)
+
+    async def _finish(self, item: T):
+        self._stage.pop(id(item), None)
+        self._cancelled.discard(id(item))
+        context = self._contexts.pop(id(item))
+        if self.finish is None:
+            return
+        try:
+            await asyncio.create_task(self.finish(item), context=context)
+        except Exception:
+            logger.exception("Finishing a pipeline item failed")
@@ -0,0 +1,87 @@
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from types import FrameType
+
+from onepdd.metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """
+    Measures how late the event loop wakes up from a short sleep. A
+    watchdog thread notices when the loop has not come back for longer than
+    ``threshold`` and logs the stack of whatever is blocking it, once per
+    stall, while it is still blocking.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.1):
+        self.threshold: float = threshold
+        self.interval: float = interval
+        self._beat: float = time.monotonic()
+        self._loop_thread: int | None = None
+        self._running: bool = False
+
+    async def run(self):
+        self._loop_thread = threading.get_ident()
+        self._running = True
+        threading.Thread(
+            target=self._watch, name="onepdd-loop-watchdog", daemon=True
+        ).start()
+        try:
+            while True:
+                self._beat = time.monotonic()
+                await asyncio.sleep(self.interval)
+                LOOP_LAG_SECONDS.observe(
+                    max(time.monotonic() - self._beat - self.interval, 0)
+                )
+        finally:
+            self._running = False
+
+    def _watch(self):
+        reported = None
+        while self._running:
+            time.sleep(self.threshold / 2)
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked > self.threshold and reported != beat:
+                reported = beat
+                LOOP_STALLS.inc()
+                frame = sys._current_frames().get(self._loop_thread)
+                logger.warning(
+                    "Event loop blocked for %.3fs in:\n%s",
+                    blocked,
+                    "".join(traceback.format_stack(frame)) if frame else "?",
+                )
+
+
+def sampled(seconds: float, interval: float = 0.005) -> str:
+    """
+    Sample the stacks of every other thread for ``seconds`` and return them
+    in the folded format of flamegraph.pl and speedscope: one line per
+    distinct stack, root first, frames separated by ``;``, then the count.
+    """
+    me = threading.get_ident()
+    counts: collections.Counter[str] = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread, frame in sys._current_frames().items():
+            if thread != me:
+                counts[folded(frame)] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+
+def folded(frame: FrameType | None) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{Path(code.co_filename).stem}.{code.co_qualname}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
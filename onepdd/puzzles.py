@@ -1,9 +1,16 @@
 from copy import deepcopy
 from datetime import datetime, timezone
 
+from onepdd.metrics import (
+    PUZZLES_ADDED,
+    PUZZLES_SECONDS,
+    TICKETS_CLOSED,
+    TICKETS_OPENED,
+)
 from onepdd.repo import GopddPuzzle, GitRepo
 from onepdd.storage import Storage, StoredIssue, StoredPuzzle
 from onepdd.tickets import Tickets
+from onepdd.tracing import span
 
 
 class Puzzles:
@@ -17,13 +24,35 @@ class Puzzles:
         them to the repository (GitHub, for example). Also, find out which
         puzzles are no longer active and remove them from GitHub
         """
-        await self.save(
-            self.join(
-                before=await self.storage.load(),
-                snapshot=await self.repo.parsed(),
-            )
-        )
-        await self.expose(await self.storage.load(), tickets)
+        snapshot = await self.scan()
+        if snapshot is None:
+            return
+        await self.reconcile(snapshot)
+        await self.publish(tickets)
+
+    async def scan(self) -> list[GopddPuzzle] | None:
+        """
+        The puzzles in the code, or None when neither they nor the stored
+        tickets leave anything to do.
+        """
+        known = await self.storage.statuses()
+        snapshot = await self.repo.parsed()
+        if all(p.id in known for p in snapshot) and not any(
+            s.to_be_closed or s.to_be_opened for s in known.values()
+        ):
+            return None
+        return snapshot
+
+    async def reconcile(self, snapshot: list[GopddPuzzle]):
+        before = await self.load()
+        with PUZZLES_SECONDS.time(operation="join"), span("puzzles.join") as s:
+            joined = self.join(before=before, snapshot=snapshot)
+            s.set_attribute("added", len(joined) - len(before))
+        PUZZLES_ADDED.inc(len(joined) - len(before), repo=self.repo.name)
+        await self.save(joined)
+
+    async def publish(self, tickets: Tickets):
+        await self.expose(await self.load(), tickets)
 
     @staticmethod
     def join(
@@ -51,10 +80,17 @@ class Puzzles:
         ]
 
     async def expose(self, puzzles: list[StoredPuzzle], tickets: Tickets):
-        puzzles = deepcopy(puzzles)
+        with PUZZLES_SECONDS.time(operation="expose"), span("puzzles.expose"):
+            await self._expose(deepcopy(puzzles), tickets)
+
+    async def _expose(self, puzzles: list[StoredPuzzle], tickets: Tickets):
+        closing = [p for p in puzzles if ticket_to_be_closed(p)]
+        if closing:
+            await tickets.prefetch(closing)
         for puzzle in puzzles:
             if ticket_to_be_closed(puzzle) and await tickets.close(puzzle):
                 puzzle.issue.closed = datetime.now(tz=timezone.utc).isoformat()
+                TICKETS_CLOSED.inc(repo=self.repo.name)
                 await self.save(puzzles)
             elif ticket_to_be_opened(puzzle) and (
                 issue := await tickets.submit(puzzle)
@@ -66,10 +102,16 @@ class Puzzles:
                         "closed": None,
                     }
                 )
+                TICKETS_OPENED.inc(repo=self.repo.name)
                 await self.save(puzzles)
 
+    async def load(self) -> list[StoredPuzzle]:
+        with span("storage.load"):
+            return [StoredPuzzle.model_validate(p) for p in await self.storage.load()]
+
     async def save(self, puzzles: list[StoredPuzzle]):
-        await self.storage.save([p.model_dump() for p in puzzles])
+        with span("storage.save", puzzles=len(puzzles)):
+            await self.storage.save([p.model_dump() for p in puzzles])
 
 
 def ticket_to_be_closed(puzzle: StoredPuzzle) -> bool:
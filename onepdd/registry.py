@@ -0,0 +1,60 @@
+import asyncio
+import dataclasses
+import json
+from pathlib import Path
+
+from onepdd.offload import offloaded, written
+
+
+@dataclasses.dataclass
+class KnownRepo:
+    tenant: str
+    uri: str
+    name: str
+    master: str = "master"
+    sha: str = ""
+    deployed: str | None = None
+    upstream: str = ""
+
+    @property
+    def key(self) -> str:
+        return f"{self.tenant}/{self.name}"
+
+
+class RepoRegistry:
+    """
+    Every repository deployed at least once, with the commit it was last
+    deployed at. Kept in memory and mirrored to a JSON file on flush(),
+    which writes on the I/O pool.
+    """
+
+    def __init__(self, path: Path):
+        self.path: Path = path
+        self._repos: dict[str, KnownRepo] = (
+            {
+                repo.key: repo
+                for repo in (KnownRepo(**r) for r in json.loads(path.read_text()))
+            }
+            if path.exists()
+            else {}
+        )
+        self._dirty: bool = False
+        self._flushing: asyncio.Lock = asyncio.Lock()
+
+    def all(self) -> list[KnownRepo]:
+        return list(self._repos.values())
+
+    def get(self, tenant: str, name: str) -> KnownRepo | None:
+        return self._repos.get(f"{tenant}/{name}")
+
+    def record(self, repo: KnownRepo):
+        self._repos[repo.key] = repo
+        self._dirty = True
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        text = json.dumps([dataclasses.asdict(r) for r in self._repos.values()])
+        self._dirty = False
+        async with self._flushing:
+            await offloaded(written, self.path, text)
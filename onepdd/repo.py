@@ -1,15 +1,27 @@
+import asyncio
 import base64
+import logging
 import re
 import shlex
 import tempfile
+import uuid
 from pathlib import Path
 from typing import Any
 
 import yaml
 from pydantic import BaseModel, TypeAdapter
 
+from onepdd.exc import OnePddError
+from onepdd.executor import executor
+from onepdd.metrics import GIT_SECONDS, SCAN_SECONDS
+from onepdd.offload import offloaded, reaper
+from onepdd.tracing import span
 from onepdd.util import exec_cmd_shell
 
+logger = logging.getLogger(__name__)
+
+_stores: dict[Path, asyncio.Lock] = {}
+
 
 class GopddPuzzle(BaseModel):
     id: str
@@ -24,6 +36,13 @@ class GopddPuzzle(BaseModel):
     time: str
 
 
+def read_config(file: Path) -> dict[str, Any]:
+    if not file.exists():
+        return {}
+    with file.open() as f:
+        return yaml.safe_load(f) or {}
+
+
 class GitRepo:
     def __init__(
         self,
@@ -39,21 +58,39 @@ class GitRepo:
         self.id_rsa: str = options.get("id_rsa") or ""
         self.master: str = master
         self.head_commit_hash: str = head_commit_hash
+        self.cache_dir: Path | None = options.get("cache_dir")
+        self.upstream: str = options.get("upstream") or ""
+        self.store: Path | None = (
+            options["object_store"] / self.repo_id(self.upstream)
+            if options.get("object_store") and self.upstream not in ("", uri)
+            else None
+        )
         self._dir: Path | None = None
-        self._tempdir: tempfile.TemporaryDirectory | None = None
+        self._tempdir: Path | None = None
+        self._config: dict[str, Any] = options.get("config") or {}
 
     async def __aenter__(self) -> "GitRepo":
-        self._tempdir = tempfile.TemporaryDirectory()
-        self._tempdir.__enter__()
-        self._dir = Path(self._tempdir.name)
-        if self.path.exists():
-            await self.pull()
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._dir = self.cache_dir
         else:
-            await self.clone()
+            self._tempdir = Path(await offloaded(tempfile.mkdtemp))
+            self._dir = self._tempdir
+        try:
+            if self.path.exists():
+                await self.pull()
+            else:
+                await self.clone()
+            self._config = await offloaded(read_config, self.path / ".0nepdd.yml")
+        except BaseException:
+            await self.__aexit__(None, None, None)
+            raise
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        self._tempdir.__exit__(exc_type, exc_val, exc_tb)
+        if self._tempdir is not None:
+            reaper().reap(self._tempdir)
+            self._tempdir = None
 
     @property
     def dir(self) -> Path:
@@ -66,8 +103,10 @@ class GitRepo:
 
     @property
     def config(self) -> dict[str, Any]:
-        f = self.path / ".0nepdd.yml"
-        return yaml.safe_load(f.open()) if f.exists() else {}
+        """
+        The ``.0nepdd.yml`` of the repository, read once after the checkout.
+        """
+        return self._config
 
     @property
     def gopdd_cmd(self) -> str:
@@ -78,34 +117,118 @@ class GitRepo:
         return re.sub(r"[\s=/+]", "", base64.b64encode(uri.encode()).decode())
 
     async def parsed(self) -> list[GopddPuzzle]:
-        json = await exec_cmd_shell(self.gopdd_cmd)
-        return TypeAdapter(list[GopddPuzzle]).validate_json(json)
+        async with executor().slot(self.name, "scan"):
+            with SCAN_SECONDS.time(), span("gopdd.scan", repo=self.name) as s:
+                json = await exec_cmd_shell(self.gopdd_cmd)
+                puzzles = TypeAdapter(list[GopddPuzzle]).validate_json(json)
+                s.set_attribute("puzzles", len(puzzles))
+        return puzzles
+
+    async def revision(self) -> str:
+        return (
+            await exec_cmd_shell(f"git -C {shlex.quote(str(self.path))} rev-parse HEAD")
+        ).strip()
+
+    async def remote_head(self) -> str:
+        """
+        The commit at the tip of the default branch on the remote, found
+        without cloning anything.
+        """
+        async with executor().slot(self.name, "probe"):
+            await self.prepare_key()
+            out = await exec_cmd_shell(
+                f"git ls-remote {shlex.quote(self.uri)} {shlex.quote('refs/heads/' + self.master)}"
+            )
+        return out.split()[0] if out.strip() else ""
+
+    async def disk_usage(self) -> int:
+        out = await exec_cmd_shell(f"du -sk {shlex.quote(str(self.path))}")
+        return int(out.split()[0]) * 1024
 
     async def clone(self):
-        await self.prepare_key()
-        await self.prepare_git()
-        await exec_cmd_shell(
-            f"git clone --depth=1 --quiet {shlex.quote(self.uri)} {shlex.quote(str(self.path))}"
-        )
+        async with executor().slot(self.name, "clone"):
+            await self._clone()
+
+    async def _clone(self):
+        """
+        Clone next to the final path and rename into it once done, so a
+        clone that fails or is cancelled halfway is never taken for a
+        complete one and pulled the next time.
+        """
+        with GIT_SECONDS.time(operation="clone"), span("git.clone", repo=self.name):
+            await self.prepare_key()
+            await self.prepare_git()
+            reference = await self.shared_objects()
+            partial = self.dir / f".{self.id}.{uuid.uuid4().hex}.partial"
+            try:
+                await exec_cmd_shell(
+                    f"git clone --depth=1 --quiet{reference} {shlex.quote(self.uri)} {shlex.quote(str(partial))}"
+                )
+                partial.rename(self.path)
+            except BaseException:
+                if partial.exists():
+                    reaper().reap(partial)
+                raise
+
+    async def shared_objects(self) -> str:
+        """
+        Fetch the upstream of a fork into the object store shared by all
+        its forks, and return the ``git clone`` option that borrows objects
+        from there, so the clone only fetches what the fork adds. The store
+        keeps full history, since git cannot borrow from a shallow one, and
+        never prunes, since the clones depend on its objects.
+        """
+        if self.store is None:
+            return ""
+        store = shlex.quote(str(self.store))
+        async with _stores.setdefault(self.store, asyncio.Lock()):
+            with GIT_SECONDS.time(operation="store"), span(
+                "git.store", repo=self.name, upstream=self.upstream
+            ):
+                try:
+                    await exec_cmd_shell(
+                        " && ".join(
+                            [
+                                f"git init --bare --quiet {store}",
+                                f"git --git-dir={store} config gc.pruneExpire never",
+                                f"git --git-dir={store} fetch --quiet"
+                                f" {shlex.quote(self.upstream)} '+refs/heads/*:refs/heads/*'",
+                            ]
+                        )
+                    )
+                except OnePddError:
+                    logger.warning(
+                        "Could not update the object store of %s, cloning %s alone",
+                        self.upstream,
+                        self.name,
+                        exc_info=True,
+                    )
+                    return ""
+        return f" --reference-if-able {store}"
 
     async def pull(self):
-        await self.prepare_key()
-        await self.prepare_git()
-        await exec_cmd_shell(
-            " && ".join(
-                [
-                    f"cd {self.path}",
-                    f"master={shlex.quote(self.master)}",
-                    "git config --local core.autocrlf false",
-                    "git reset origin/${master} --hard --quiet",
-                    "git clean --force -d",
-                    "git fetch --quiet",
-                    "git checkout origin/${master}",
-                    "git rebase --abort || true",
-                    "git rebase --autostash --strategy-option=theirs origin/${master}",
-                ]
+        async with executor().slot(self.name, "pull"):
+            await self._pull()
+
+    async def _pull(self):
+        with GIT_SECONDS.time(operation="pull"), span("git.pull", repo=self.name):
+            await self.prepare_key()
+            await self.prepare_git()
+            await exec_cmd_shell(
+                " && ".join(
+                    [
+                        f"cd {self.path}",
+                        f"master={shlex.quote(self.master)}",
+                        "git config --local core.autocrlf false",
+                        "git reset origin/${master} --hard --quiet",
+                        "git clean --force -d",
+                        "git fetch --quiet",
+                        "git checkout origin/${master}",
+                        "git rebase --abort || true",
+                        "git rebase --autostash --strategy-option=theirs origin/${master}",
+                    ]
+                )
             )
-        )
 
     async def prepare_key(self):
         directory = Path.home() / ".ssh"
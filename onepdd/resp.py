@@ -0,0 +1,122 @@
+import asyncio
+import contextlib
+from typing import Any, AsyncIterator
+from urllib.parse import urlparse
+
+from onepdd.exc import OnePddError
+
+
+class RespError(OnePddError):
+    pass
+
+
+class RespConnection:
+    """
+    Minimal client for the Redis serialization protocol (RESP2), enough
+    to talk to Redis, Valkey, KeyDB and other compatible servers.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader: asyncio.StreamReader = reader
+        self._writer: asyncio.StreamWriter = writer
+
+    @classmethod
+    async def connect(cls, url: str) -> "RespConnection":
+        parsed = urlparse(url)
+        reader, writer = await asyncio.open_connection(
+            parsed.hostname or "localhost", parsed.port or 6379
+        )
+        connection = cls(reader, writer)
+        if parsed.password:
+            await connection.execute(
+                "AUTH", *filter(None, [parsed.username, parsed.password])
+            )
+        if parsed.path.strip("/"):
+            await connection.execute("SELECT", parsed.path.strip("/"))
+        return connection
+
+    async def execute(self, *args: Any) -> Any:
+        return (await self.pipeline([args]))[0]
+
+    async def pipeline(self, commands: list[tuple[Any, ...]]) -> list[Any]:
+        """
+        Send all commands in one write and read the replies in order.
+        Error replies are returned in place as RespError instances, so one
+        failed command does not hide the results of the others.
+        """
+        self._writer.write(b"".join(encoded(command) for command in commands))
+        await self._writer.drain()
+        return [await self._reply() for _ in commands]
+
+    async def close(self):
+        self._writer.close()
+        with contextlib.suppress(ConnectionError):
+            await self._writer.wait_closed()
+
+    async def _reply(self) -> Any:
+        line = await self._reader.readline()
+        if not line:
+            raise RespError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2].decode()
+        if kind == b"*":
+            length = int(rest)
+            if length == -1:
+                return None
+            return [await self._reply() for _ in range(length)]
+        raise RespError(f"Unexpected reply: {line!r}")
+
+
+class RespPool:
+    def __init__(self, url: str, size: int = 8):
+        self.url: str = url
+        self.size: int = size
+        self._idle: list[RespConnection] = []
+        self._slots: asyncio.Semaphore = asyncio.Semaphore(size)
+
+    @contextlib.asynccontextmanager
+    async def connection(self) -> AsyncIterator[RespConnection]:
+        """
+        Borrow a connection for exclusive use, which WATCH/MULTI/EXEC
+        transactions rely on. A connection that failed mid-use is dropped.
+        """
+        async with self._slots:
+            connection = (
+                self._idle.pop()
+                if self._idle
+                else await RespConnection.connect(self.url)
+            )
+            try:
+                yield connection
+            except BaseException:
+                await connection.close()
+                raise
+            self._idle.append(connection)
+
+    async def close(self):
+        while self._idle:
+            await self._idle.pop().close()
+
+
+def encoded(command: tuple[Any, ...]) -> bytes:
+    parts = [f"*{len(command)}\r\n".encode()]
+    for arg in command:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b"".join(parts)
+
+
+def raised(reply: Any) -> Any:
+    if isinstance(reply, RespError):
+        raise reply
+    return reply
@@ -0,0 +1,192 @@
+import asyncio
+import dataclasses
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from onepdd.index import aware
+from onepdd.offload import offloaded, written
+from onepdd.state import PuzzleStatus
+from onepdd.storage import Storage
+
+DIMENSIONS = ("author", "role", "repo")
+LATENCY_BUCKETS = tuple(3600 * 2**k for k in range(15))
+
+
+@dataclasses.dataclass
+class Stats:
+    """
+    Additive summary of a group of puzzles. Closure latencies are kept as a
+    histogram over LATENCY_BUCKETS, so stats of different repositories can
+    be added and subtracted without keeping every single puzzle around.
+    """
+
+    puzzles: int = 0
+    alive: int = 0
+    closed: int = 0
+    estimate: int = 0
+    alive_estimate: int = 0
+    latency: list[int] = dataclasses.field(
+        default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1)
+    )
+
+    def add(self, other: "Stats", sign: int = 1):
+        self.puzzles += sign * other.puzzles
+        self.alive += sign * other.alive
+        self.closed += sign * other.closed
+        self.estimate += sign * other.estimate
+        self.alive_estimate += sign * other.alive_estimate
+        self.latency = [a + sign * b for a, b in zip(self.latency, other.latency)]
+
+    def observe(self, puzzle: dict[str, Any]):
+        self.puzzles += 1
+        self.estimate += puzzle["estimate"]
+        if puzzle["alive"]:
+            self.alive += 1
+            self.alive_estimate += puzzle["estimate"]
+        issue = puzzle.get("issue")
+        if issue and issue.get("closed"):
+            self.closed += 1
+            took = (
+                aware(datetime.fromisoformat(issue["closed"]))
+                - aware(datetime.fromisoformat(puzzle["time"]))
+            ).total_seconds()
+            self.latency[bucket(took)] += 1
+
+    def percentile(self, q: float) -> int | None:
+        """
+        Upper bound of the bucket holding the q-th closure latency, seconds.
+        """
+        if not self.closed:
+            return None
+        rank = q * self.closed
+        seen = 0
+        for i, n in enumerate(self.latency):
+            seen += n
+            if seen >= rank:
+                return LATENCY_BUCKETS[min(i, len(LATENCY_BUCKETS) - 1)]
+        return LATENCY_BUCKETS[-1]
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "puzzles": self.puzzles,
+            "alive": self.alive,
+            "closed": self.closed,
+            "estimate": self.estimate,
+            "alive_estimate": self.alive_estimate,
+            "latency": {
+                "p50": self.percentile(0.5),
+                "p90": self.percentile(0.9),
+                "p99": self.percentile(0.99),
+            },
+        }
+
+
+def bucket(seconds: float) -> int:
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            return i
+    return len(LATENCY_BUCKETS)
+
+
+Contribution = dict[str, dict[str, Stats]]
+
+
+def contribution(repo: str, puzzles: list[dict[str, Any]]) -> Contribution:
+    groups: Contribution = {dim: {} for dim in DIMENSIONS}
+    for puzzle in puzzles:
+        for dim, value in (
+            ("author", puzzle["author"]),
+            ("role", puzzle["role"]),
+            ("repo", repo),
+        ):
+            groups[dim].setdefault(value, Stats()).observe(puzzle)
+    return groups
+
+
+class Rollups:
+    """
+    Fleet-wide puzzle stats by author, role and repository. Every save of
+    a repository replaces its previous contribution to the totals, so a
+    query never has to read any puzzle file. Contributions are mirrored to
+    a JSON file on flush(), written on the I/O pool, which rebuilds the
+    totals after a restart. Repositories saved before the rollups existed
+    are only counted once Deployer.backfill() has read their state.
+    """
+
+    def __init__(self, path: Path):
+        self.path: Path = path
+        self._repos: dict[str, Contribution] = (
+            {
+                repo: {
+                    dim: {value: Stats(**s) for value, s in groups.items()}
+                    for dim, groups in contrib.items()
+                }
+                for repo, contrib in json.loads(path.read_text()).items()
+            }
+            if path.exists()
+            else {}
+        )
+        self._totals: Contribution = {dim: {} for dim in DIMENSIONS}
+        self._dirty: bool = False
+        self._flushing: asyncio.Lock = asyncio.Lock()
+        for contrib in self._repos.values():
+            self._apply(contrib, 1)
+
+    def update(self, repo: str, puzzles: list[dict[str, Any]]):
+        if repo in self._repos:
+            self._apply(self._repos[repo], -1)
+        self._repos[repo] = contribution(repo, puzzles)
+        self._apply(self._repos[repo], 1)
+        self._dirty = True
+
+    def has(self, repo: str) -> bool:
+        return repo in self._repos
+
+    def by(self, dim: str) -> dict[str, dict[str, Any]]:
+        return {value: stats.report() for value, stats in self._totals[dim].items()}
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        text = json.dumps(
+            {
+                repo: {
+                    dim: {v: dataclasses.asdict(s) for v, s in groups.items()}
+                    for dim, groups in contrib.items()
+                }
+                for repo, contrib in self._repos.items()
+            }
+        )
+        self._dirty = False
+        async with self._flushing:
+            await offloaded(written, self.path, text)
+
+    def _apply(self, contrib: Contribution, sign: int):
+        for dim, groups in contrib.items():
+            totals = self._totals[dim]
+            for value, stats in groups.items():
+                totals.setdefault(value, Stats()).add(stats, sign)
+                if not totals[value].puzzles:
+                    del totals[value]
+
+
+class RolledUpStorage(Storage):
+    def __init__(self, origin: Storage, repo: str, rollups: Rollups):
+        self.origin: Storage = origin
+        self.repo: str = repo
+        self.rollups: Rollups = rollups
+
+    async def save(self, data: list[dict[str, Any]]):
+        await self.origin.save(data)
+        self.rollups.update(self.repo, data)
+
+    async def load(self) -> list[dict[str, Any]]:
+        return await self.origin.load()
+
+    async def statuses(self) -> dict[str, PuzzleStatus]:
+        return await self.origin.statuses()
+
+    async def version(self) -> str | None:
+        return await self.origin.version()
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+import zlib
+from typing import Awaitable, Callable
+
+from onepdd.deploy import Deployer, DeployJob
+from onepdd.exc import OnePddError
+from onepdd.metrics import RESYNC_RUNS
+from onepdd.registry import KnownRepo
+from onepdd.repo import GitRepo
+
+logger = logging.getLogger(__name__)
+
+Probe = Callable[[KnownRepo], Awaitable[str]]
+
+
+async def ls_remote(repo: KnownRepo, id_rsa: str = "") -> str:
+    return await GitRepo(
+        uri=repo.uri, name=repo.name, master=repo.master, id_rsa=id_rsa
+    ).remote_head()
+
+
+class ResyncScheduler:
+    """
+    Re-deploys every known repository once per interval, so puzzles catch
+    up after missed webhooks. Each repository gets its own slot in the
+    interval derived from a hash of its key, which spreads the work evenly
+    instead of hitting every forge at once. Repositories whose remote head
+    has not moved since the last deploy are skipped, and while the deployer
+    is busier than ``max_in_flight`` the scheduler backs off.
+    """
+
+    def __init__(
+        self,
+        deployer: Deployer,
+        interval: float,
+        max_in_flight: int = 8,
+        tick: float = 1.0,
+        probe: Probe | None = None,
+    ):
+        self.deployer: Deployer = deployer
+        self.interval: float = interval
+        self.max_in_flight: int = max_in_flight
+        self.tick: float = tick
+        self.probe: Probe = probe or (
+            lambda repo: ls_remote(repo, deployer.config.id_rsa)
+        )
+        self._started: float = time.time()
+        self._checked: dict[str, float] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def run(self):
+        delay = self.tick
+        while True:
+            delay = (
+                self.tick
+                if await self.cycle(time.time())
+                else min(delay * 2, self.interval)
+            )
+            await asyncio.sleep(delay)
+
+    async def cycle(self, now: float) -> bool:
+        """
+        Start deploys for the repositories whose slot has come. Returns
+        False if it had to stop early because of the deployer load.
+        """
+        for repo in self.due(now):
+            if self.deployer.in_flight >= self.max_in_flight:
+                RESYNC_RUNS.inc(outcome="deferred")
+                return False
+            self._checked[repo.key] = now
+            try:
+                head = await self.probe(repo)
+            except OnePddError:
+                logger.exception("Failed to probe %s", repo.key)
+                RESYNC_RUNS.inc(outcome="failed")
+                continue
+            if head and head == repo.sha:
+                RESYNC_RUNS.inc(outcome="unchanged")
+                continue
+            RESYNC_RUNS.inc(outcome="deployed")
+            task = asyncio.create_task(self._deploy(repo, head))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return True
+
+    def due(self, now: float) -> list[KnownRepo]:
+        return [
+            repo
+            for repo in self.deployer.registry.all()
+            if self._checked.get(repo.key, self._started) < self.slot(repo, now)
+        ]
+
+    def slot(self, repo: KnownRepo, now: float) -> float:
+        """
+        The latest start of the repository's slot at or before ``now``.
+        """
+        offset = zlib.crc32(repo.key.encode()) % int(self.interval * 1000) / 1000
+        return now - (now - offset) % self.interval
+
+    async def _deploy(self, repo: KnownRepo, head: str):
+        try:
+            await self.deployer.deploy(
+                DeployJob(
+                    tenant=self.deployer.tenant(repo.tenant),
+                    uri=repo.uri,
+                    name=repo.name,
+                    master=repo.master,
+                    head=head,
+                    upstream=repo.upstream,
+                )
+            )
+        except Exception:
+            logger.exception("Scheduled deploy of %s failed", repo.key)
@@ -0,0 +1,240 @@
+"""
+On-disk format of the puzzle state.
+
+Every versioned file starts with a single header line, so metadata can be
+read without touching the body:
+
+    ONEPDD/2 {"compression": "gzip", "layout": "columns", "count": 42, ...}
+
+Compressed state uses the ``columns`` layout: a JSON body, gzip or zstd
+compressed, with the keys stored once and one row of values per puzzle.
+Uncompressed state uses the ``indexed`` layout instead, which can be
+memory-mapped: an index line mapping every puzzle id to the offset and
+length of its row and to its ticket status, followed by one row per line.
+Files without the header are the plain JSON list that earlier versions
+wrote, and are still read as such.
+"""
+import dataclasses
+import gzip
+import json
+import mmap
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from onepdd.exc import OnePddError
+
+MAGIC = b"ONEPDD/"
+VERSION = 2
+COMPRESSIONS = ("none", "gzip", "zstd", "auto")
+
+ALIVE, ISSUE, CLOSED = 1, 2, 4
+
+
+class StateFormatError(OnePddError):
+    pass
+
+
+@dataclasses.dataclass(frozen=True)
+class PuzzleStatus:
+    """
+    What the join and the expose need to know about a stored puzzle.
+    """
+
+    alive: bool
+    issue: bool
+    closed: bool
+
+    @classmethod
+    def of(cls, puzzle: dict[str, Any]) -> "PuzzleStatus":
+        issue = puzzle.get("issue")
+        return cls(
+            alive=bool(puzzle.get("alive")),
+            issue=bool(issue),
+            closed=bool(issue and issue.get("closed")),
+        )
+
+    @classmethod
+    def unpacked(cls, flags: int) -> "PuzzleStatus":
+        return cls(bool(flags & ALIVE), bool(flags & ISSUE), bool(flags & CLOSED))
+
+    @property
+    def packed(self) -> int:
+        return self.alive * ALIVE | self.issue * ISSUE | self.closed * CLOSED
+
+    @property
+    def to_be_closed(self) -> bool:
+        return not self.alive and self.issue and not self.closed
+
+    @property
+    def to_be_opened(self) -> bool:
+        return self.alive and (not self.issue or self.closed)
+
+
+def dumps(
+    data: list[dict[str, Any]], compression: str = "none", sha: str = ""
+) -> bytes:
+    compression = resolved(compression)
+    fields = list(data[0]) if data else []
+    if not all(list(p) == fields for p in data):
+        fields = None
+    header = {
+        "compression": compression,
+        "count": len(data),
+        "sha": sha,
+        "deployed": datetime.now(tz=timezone.utc).isoformat(),
+        "fields": fields,
+    }
+    if compression == "none":
+        rows, index, offset = [], {}, 0
+        for p in data:
+            row = json.dumps(
+                list(p.values()) if fields is not None else p, separators=(",", ":")
+            ).encode()
+            index[p["id"]] = [offset, len(row), PuzzleStatus.of(p).packed]
+            rows.append(row)
+            offset += len(row) + 1
+        body = json.dumps(index, separators=(",", ":")).encode() + b"\n"
+        header.update(layout="indexed", index_bytes=len(body))
+        body += b"".join(row + b"\n" for row in rows)
+    else:
+        header["layout"] = "columns" if fields is not None else "records"
+        body = compressed(
+            json.dumps(
+                [list(p.values()) for p in data] if fields is not None else data,
+                separators=(",", ":"),
+            ).encode(),
+            compression,
+        )
+    return b"%s%d %s\n%s" % (MAGIC, VERSION, json.dumps(header).encode(), body)
+
+
+def loads(raw: bytes) -> list[dict[str, Any]]:
+    if not raw.startswith(MAGIC):
+        return json.loads(raw)
+    first, _, rest = raw.partition(b"\n")
+    header = parsed_header(first)
+    if header["layout"] == "indexed":
+        lines = rest[header["index_bytes"] :].rstrip(b"\n")
+        rows = json.loads(b"[%s]" % lines.replace(b"\n", b","))
+    else:
+        rows = json.loads(decompressed(rest, header["compression"]))
+    if header["fields"] is None:
+        return rows
+    return [dict(zip(header["fields"], row)) for row in rows]
+
+
+class StateView:
+    """
+    Read access to a state file without parsing the puzzles. Files in the
+    ``indexed`` layout are memory-mapped and only the header and the index
+    are decoded; any other file is loaded whole.
+    """
+
+    def __init__(self, path: Path):
+        self.path: Path = path
+
+    def __enter__(self) -> "StateView":
+        self._file = self.path.open("rb")
+        first = self._file.readline()
+        self.header: dict[str, Any] = (
+            parsed_header(first) if first.startswith(MAGIC) else {"version": 0}
+        )
+        self._map: mmap.mmap | None = None
+        self._puzzles: dict[str, dict[str, Any]] | None = None
+        if self.header.get("layout") == "indexed":
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            start = len(first)
+            self._rows: int = start + self.header["index_bytes"]
+            self._index: dict[str, list[int]] = json.loads(
+                self._map[start : self._rows]
+            )
+        else:
+            self._file.seek(0)
+            self._puzzles = {p["id"]: p for p in loads(self._file.read())}
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def statuses(self) -> dict[str, PuzzleStatus]:
+        if self._puzzles is not None:
+            return {id: PuzzleStatus.of(p) for id, p in self._puzzles.items()}
+        return {id: PuzzleStatus.unpacked(e[2]) for id, e in self._index.items()}
+
+    def puzzle(self, id: str) -> dict[str, Any] | None:
+        if self._puzzles is not None:
+            return self._puzzles.get(id)
+        if id not in self._index:
+            return None
+        offset, length, _ = self._index[id]
+        row = json.loads(self._map[self._rows + offset : self._rows + offset + length])
+        if self.header["fields"] is None:
+            return row
+        return dict(zip(self.header["fields"], row))
+
+
+def read_header(path: Path) -> dict[str, Any]:
+    """
+    The metadata of a state file. Reads only the header line, unless the
+    file is in the legacy format and has to be parsed whole to count.
+    """
+    with path.open("rb") as f:
+        first = f.readline()
+        if first.startswith(MAGIC):
+            return parsed_header(first)
+        legacy = json.loads(first + f.read())
+    return {"version": 0, "count": len(legacy), "sha": "", "deployed": None}
+
+
+def parsed_header(line: bytes) -> dict[str, Any]:
+    version, _, header = line[len(MAGIC) :].partition(b" ")
+    if int(version) > VERSION:
+        raise StateFormatError(f"State format version {int(version)} is not supported")
+    return {"version": int(version), **json.loads(header)}
+
+
+def resolved(compression: str) -> str:
+    """
+    The compression to write with: ``auto`` is zstd if the ``zstandard``
+    package is installed and gzip if not, while an explicit ``zstd``
+    without the package is a configuration error.
+    """
+    if compression not in COMPRESSIONS:
+        raise StateFormatError(f"Unknown state compression {compression!r}")
+    if compression in ("zstd", "auto"):
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            if compression == "zstd":
+                raise StateFormatError(
+                    "state_compression zstd needs the zstandard package,"
+                    " install onepdd with the zstd extra"
+                )
+            return "gzip"
+        return "zstd"
+    return compression
+
+
+def compressed(body: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    if compression == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return body
+
+
+def decompressed(body: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.decompress(body)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise StateFormatError("The state is zstd compressed, install zstandard")
+        return zstandard.ZstdDecompressor().decompress(body)
+    return body
@@ -1,3 +1,4 @@
+import copy
 import datetime
 import json
 from abc import ABC, abstractmethod
@@ -6,6 +7,14 @@ from typing import Any
 
 from pydantic import BaseModel
 
+from onepdd import state
+from onepdd.config import Config
+from onepdd.exc import OnePddError
+from onepdd.metrics import STORAGE_SECONDS
+from onepdd.offload import offloaded
+from onepdd.resp import RespConnection, RespPool, raised
+from onepdd.state import PuzzleStatus
+
 
 class Storage(ABC):
     @abstractmethod
@@ -13,26 +22,483 @@ class Storage(ABC):
         pass
 
     @abstractmethod
-    async def save(self, data: dict[str, Any]):
+    async def save(self, data: list[dict[str, Any]]):
         pass
 
+    async def statuses(self) -> dict[str, PuzzleStatus]:
+        """
+        Ticket status of every stored puzzle by id. Storages that can tell
+        it without loading every puzzle should override this.
+        """
+        return {p["id"]: PuzzleStatus.of(p) for p in await self.load()}
+
+    async def version(self) -> str | None:
+        """
+        A token that changes whenever the stored puzzles do, so that a
+        copy of them can be checked for staleness without loading them
+        again. None if the storage cannot tell.
+        """
+        return None
+
+
+def stamp(path: Path) -> str:
+    """
+    Modification time and size of the file, or nothing if it is missing.
+    """
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return ""
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
 
 class SimpleFsStorage(Storage):
     def __init__(
         self,
         path: Path,
+        compression: str = "none",
+        sha: str = "",
+    ):
+        self.path: Path = path
+        self.compression: str = compression
+        self.sha: str = sha
+
+    async def save(self, data: list[dict[str, Any]]):
+        await offloaded(self._save, data)
+
+    async def load(self) -> list[dict[str, Any]]:
+        return await offloaded(self._load)
+
+    async def statuses(self) -> dict[str, PuzzleStatus]:
+        return await offloaded(self._statuses)
+
+    async def version(self) -> str | None:
+        return await offloaded(stamp, self.path)
+
+    def _save(self, data: list[dict[str, Any]]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        tmp.write_bytes(state.dumps(data, self.compression, self.sha))
+        tmp.replace(self.path)
+
+    def _load(self) -> list[dict[str, Any]]:
+        if not self.path.exists():
+            return []
+        return state.loads(self.path.read_bytes())
+
+    def _statuses(self) -> dict[str, PuzzleStatus]:
+        if not self.path.exists():
+            return {}
+        with state.StateView(self.path) as view:
+            return view.statuses()
+
+    def header(self) -> dict[str, Any]:
+        return state.read_header(self.path)
+
+    @classmethod
+    def from_vcs(
+        cls,
+        base_dir: Path,
+        vcs: str,
+        repo: str,
+        compression: str = "none",
+        sha: str = "",
+    ) -> "SimpleFsStorage":
+        return SimpleFsStorage(base_dir / f"{vcs}-{repo}", compression, sha)
+
+
+class JournalStorage(Storage):
+    """
+    Puzzles of a repository as a snapshot plus a journal, in the ``path``
+    directory, of what happened to them since: added, died, ticket opened,
+    ticket closed. A save appends only the transitions since the last load
+    or save, one JSON line each, and a load replays the journal on top of
+    the snapshot. Every ``snapshot_every`` entries the state is written to
+    a new snapshot and the journal is set aside, never deleted, so all of
+    them together are the history of the repository. Until the first
+    snapshot, the state starts from the ``seed`` file, if there is one.
+    """
+
+    JOURNAL = "journal.jsonl"
+
+    def __init__(
+        self,
+        path: Path,
+        snapshot_every: int = 500,
+        compression: str = "none",
+        sha: str = "",
+        seed: Path | None = None,
     ):
         self.path: Path = path
+        self.snapshot_every: int = snapshot_every
+        self.compression: str = compression
+        self.sha: str = sha
+        self.seed: Path | None = seed
+        self._puzzles: dict[str, dict[str, Any]] | None = None
+        self._seq: int = 0
+        self._tail: int = 0
+
+    @classmethod
+    def from_vcs(
+        cls,
+        base_dir: Path,
+        vcs: str,
+        repo: str,
+        snapshot_every: int = 500,
+        compression: str = "none",
+        sha: str = "",
+    ) -> "JournalStorage":
+        return JournalStorage(
+            base_dir / f"{vcs}-{repo}.journal",
+            snapshot_every,
+            compression,
+            sha,
+            seed=base_dir / f"{vcs}-{repo}",
+        )
+
+    async def load(self) -> list[dict[str, Any]]:
+        return await offloaded(self._load)
+
+    async def save(self, data: list[dict[str, Any]]):
+        await offloaded(self._save, data)
+
+    async def history(self) -> list[dict[str, Any]]:
+        """
+        Every journal entry of the repository, oldest first.
+        """
+        return await offloaded(self._history)
+
+    async def version(self) -> str | None:
+        return await offloaded(self._version)
+
+    def _load(self) -> list[dict[str, Any]]:
+        self._replay()
+        return copy.deepcopy(list(self._puzzles.values()))
+
+    def _save(self, data: list[dict[str, Any]]):
+        if self._puzzles is None:
+            self._replay()
+        saved = {p["id"]: p for p in data}
+        entries = [
+            *(
+                entry
+                for id, puzzle in saved.items()
+                for entry in transitions(self._puzzles.get(id), puzzle)
+            ),
+            *({"op": "removed", "id": id} for id in self._puzzles if id not in saved),
+        ]
+        if not entries:
+            return
+        at = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
+        lines = []
+        for entry in entries:
+            self._seq += 1
+            lines.append(json.dumps({"seq": self._seq, "at": at, **entry}))
+        self.path.mkdir(parents=True, exist_ok=True)
+        with (self.path / self.JOURNAL).open("a") as f:
+            f.write("".join(f"{line}\n" for line in lines))
+        for line in lines:
+            applied(self._puzzles, json.loads(line))
+        self._tail += len(lines)
+        if self._tail >= self.snapshot_every:
+            self._snapshot()
+
+    def _replay(self):
+        snapshots = sorted(self.path.glob("snapshot-*"))
+        if snapshots:
+            seq = int(snapshots[-1].name.split("-")[1])
+            puzzles = state.loads(snapshots[-1].read_bytes())
+        else:
+            seq = 0
+            puzzles = (
+                state.loads(self.seed.read_bytes())
+                if self.seed is not None and self.seed.is_file()
+                else []
+            )
+        self._puzzles = {p["id"]: p for p in puzzles}
+        entries = self._entries(self.path / self.JOURNAL, repair=True)
+        for entry in entries:
+            if entry["seq"] > seq:
+                applied(self._puzzles, entry)
+                seq = entry["seq"]
+        self._seq, self._tail = seq, len(entries)
+
+    def _snapshot(self):
+        snapshot = self.path / f"snapshot-{self._seq:012d}"
+        tmp = self.path / f".{snapshot.name}.tmp"
+        tmp.write_bytes(
+            state.dumps(list(self._puzzles.values()), self.compression, self.sha)
+        )
+        tmp.replace(snapshot)
+        (self.path / self.JOURNAL).replace(
+            self.path / f"journal-{self._seq:012d}.jsonl"
+        )
+        for old in self.path.glob("snapshot-*"):
+            if old != snapshot:
+                old.unlink()
+        self._tail = 0
+
+    def _version(self) -> str:
+        snapshots = sorted(self.path.glob("snapshot-*"))
+        return ":".join(
+            [
+                snapshots[-1].name if snapshots else "",
+                stamp(self.path / self.JOURNAL),
+                stamp(self.seed) if self.seed is not None and not snapshots else "",
+            ]
+        )
+
+    def _history(self) -> list[dict[str, Any]]:
+        return [
+            entry
+            for journal in [
+                *sorted(self.path.glob("journal-*.jsonl")),
+                self.path / self.JOURNAL,
+            ]
+            for entry in self._entries(journal)
+        ]
 
-    async def save(self, data: dict[str, Any]):
-        self.path.write_text(json.dumps(data))
+    @staticmethod
+    def _entries(journal: Path, repair: bool = False) -> list[dict[str, Any]]:
+        """
+        The entries of the journal, without a last line cut short by a
+        crash in the middle of an append, which ``repair`` also cuts off
+        the file so the next append starts on a line of its own.
+        """
+        if not journal.exists():
+            return []
+        raw = journal.read_bytes()
+        whole = raw[: raw.rfind(b"\n") + 1]
+        if repair and len(whole) != len(raw):
+            with journal.open("r+b") as f:
+                f.truncate(len(whole))
+        return [json.loads(line) for line in whole.splitlines()]
+
+
+def transitions(
+    before: dict[str, Any] | None, after: dict[str, Any]
+) -> list[dict[str, Any]]:
+    """
+    Journal entries that take a puzzle from ``before`` to ``after``: the
+    state changes the deploy makes, or the whole puzzle for anything else.
+    """
+    if before is None:
+        return [{"op": "added", "id": after["id"], "puzzle": after}]
+    if before == after:
+        return []
+    entries = []
+    if before["alive"] and not after["alive"]:
+        entries.append({"op": "died", "id": after["id"]})
+    issue, was = after.get("issue"), before.get("issue")
+    if issue and issue != was:
+        if was and was["number"] == issue["number"] and issue.get("closed"):
+            entries.append(
+                {"op": "closed", "id": after["id"], "closed": issue["closed"]}
+            )
+        else:
+            entries.append({"op": "opened", "id": after["id"], "issue": issue})
+    replayed = {after["id"]: copy.deepcopy(before)}
+    for entry in entries:
+        applied(replayed, copy.deepcopy(entry))
+    if replayed[after["id"]] != after:
+        return [{"op": "changed", "id": after["id"], "puzzle": after}]
+    return entries
+
+
+def applied(puzzles: dict[str, dict[str, Any]], entry: dict[str, Any]):
+    op, id = entry["op"], entry["id"]
+    if op in ("added", "changed"):
+        puzzles[id] = entry["puzzle"]
+    elif op == "removed":
+        puzzles.pop(id, None)
+    elif op == "died":
+        puzzles[id]["alive"] = False
+    elif op == "opened":
+        puzzles[id]["issue"] = entry["issue"]
+    elif op == "closed":
+        puzzles[id]["issue"]["closed"] = entry["closed"]
+
+
+class StorageConflictError(OnePddError):
+    pass
+
+
+class RedisStorage(Storage):
+    """
+    Puzzles of a repository kept in one hash of a Redis-compatible store,
+    a field per puzzle plus a version counter. Saves write only the fields
+    that changed since the last load or save, and fail with
+    StorageConflictError if another node bumped the version in between.
+    """
+
+    VERSION = "version"
+    PREFIX = "puzzle:"
+
+    def __init__(self, pool: RespPool, key: str):
+        self.pool: RespPool = pool
+        self.key: str = key
+        self._version: int | None = None
+        self._fields: dict[str, str] = {}
+
+    @classmethod
+    def from_vcs(cls, pool: RespPool, vcs: str, repo: str) -> "RedisStorage":
+        return RedisStorage(pool, f"onepdd:{vcs}-{repo}")
+
+    @classmethod
+    async def load_many(
+        cls, pool: RespPool, keys: list[str]
+    ) -> dict[str, list[dict[str, Any]]]:
+        async with pool.connection() as connection:
+            replies = await connection.pipeline([("HGETALL", key) for key in keys])
+        return {
+            key: cls._decoded(cls._hash(raised(reply)))
+            for key, reply in zip(keys, replies)
+        }
 
     async def load(self) -> list[dict[str, Any]]:
-        return json.loads(self.path.read_text())
+        async with self.pool.connection() as connection:
+            fields = self._hash(raised(await connection.execute("HGETALL", self.key)))
+        self._remember(fields)
+        return self._decoded(fields)
+
+    async def version(self) -> str | None:
+        async with self.pool.connection() as connection:
+            reply = raised(await connection.execute("HGET", self.key, self.VERSION))
+        return reply or "0"
+
+    async def save(self, data: list[dict[str, Any]]):
+        fields = {
+            f"{self.PREFIX}{puzzle['id']}": json.dumps({"pos": pos, **puzzle})
+            for pos, puzzle in enumerate(data)
+        }
+        async with self.pool.connection() as connection:
+            watched = await connection.pipeline(
+                [("WATCH", self.key), ("HGETALL", self.key)]
+            )
+            current = self._hash(raised(watched[1]))
+            if self._version is None:
+                self._remember(current)
+            elif int(current.get(self.VERSION, 0)) != self._version:
+                await connection.execute("UNWATCH")
+                raise StorageConflictError(
+                    f"{self.key} was modified concurrently: "
+                    f"expected version {self._version}, got {current.get(self.VERSION)}"
+                )
+            await self._commit(connection, fields)
+        self._fields = fields
+        self._version += 1
+
+    async def _commit(self, connection: RespConnection, fields: dict[str, str]):
+        changed = [
+            item
+            for name, value in fields.items()
+            if self._fields.get(name) != value
+            for item in (name, value)
+        ]
+        removed = [name for name in self._fields if name not in fields]
+        replies = await connection.pipeline(
+            [
+                ("MULTI",),
+                *([("HSET", self.key, *changed)] if changed else []),
+                *([("HDEL", self.key, *removed)] if removed else []),
+                ("HINCRBY", self.key, self.VERSION, 1),
+                ("EXEC",),
+            ]
+        )
+        for reply in replies:
+            raised(reply)
+        if replies[-1] is None:
+            raise StorageConflictError(f"{self.key} was modified concurrently")
+
+    def _remember(self, fields: dict[str, str]):
+        self._version = int(fields.get(self.VERSION, 0))
+        self._fields = {k: v for k, v in fields.items() if k.startswith(self.PREFIX)}
+
+    @staticmethod
+    def _hash(reply: list[str]) -> dict[str, str]:
+        return dict(zip(reply[::2], reply[1::2]))
 
     @classmethod
-    def from_vcs(cls, base_dir: Path, vcs: str, repo: str) -> "SimpleFsStorage":
-        return SimpleFsStorage(base_dir / f"{vcs}-{repo}")
+    def _decoded(cls, fields: dict[str, str]) -> list[dict[str, Any]]:
+        puzzles = [
+            json.loads(value)
+            for name, value in fields.items()
+            if name.startswith(cls.PREFIX)
+        ]
+        puzzles.sort(key=lambda p: p.pop("pos"))
+        return puzzles
+
+
+class MeteredStorage(Storage):
+    def __init__(self, origin: Storage):
+        self.origin: Storage = origin
+
+    async def save(self, data: list[dict[str, Any]]):
+        with STORAGE_SECONDS.time(operation="save"):
+            await self.origin.save(data)
+
+    async def load(self) -> list[dict[str, Any]]:
+        with STORAGE_SECONDS.time(operation="load"):
+            return await self.origin.load()
+
+    async def statuses(self) -> dict[str, PuzzleStatus]:
+        with STORAGE_SECONDS.time(operation="statuses"):
+            return await self.origin.statuses()
+
+    async def version(self) -> str | None:
+        return await self.origin.version()
+
+
+class MemoryStorage(Storage):
+    """
+    Keeps what is saved in memory, never writing to the origin. Until the
+    first save, loads come from the origin, or are empty without one.
+    """
+
+    def __init__(self, origin: Storage | None = None):
+        self.origin: Storage | None = origin
+        self._data: list[dict[str, Any]] | None = None
+        self._saves: int = 0
+
+    async def save(self, data: list[dict[str, Any]]):
+        self._data = list(data)
+        self._saves += 1
+
+    async def load(self) -> list[dict[str, Any]]:
+        if self._data is not None:
+            return list(self._data)
+        return await self.origin.load() if self.origin else []
+
+    async def statuses(self) -> dict[str, PuzzleStatus]:
+        if self._data is None and self.origin:
+            return await self.origin.statuses()
+        return await super().statuses()
+
+    async def version(self) -> str | None:
+        if self._data is None:
+            return await self.origin.version() if self.origin else ""
+        return f"memory-{self._saves}"
+
+
+_pools: dict[str, RespPool] = {}
+
+
+def storage_for(config: Config, vcs: str, repo: str, sha: str = "") -> Storage:
+    if config.redis_url:
+        pool = _pools.setdefault(config.redis_url, RespPool(config.redis_url))
+        return RedisStorage.from_vcs(pool, vcs, repo)
+    if config.state_journal:
+        return JournalStorage.from_vcs(
+            config.storage,
+            vcs,
+            repo,
+            config.journal_snapshot_every,
+            config.state_compression,
+            sha,
+        )
+    return SimpleFsStorage.from_vcs(
+        config.storage, vcs, repo, config.state_compression, sha
+    )
 
 
 class StoredIssue(BaseModel):
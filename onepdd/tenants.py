@@ -0,0 +1,140 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
+from typing import AsyncIterator
+from urllib.parse import urlparse
+
+from onepdd.config import Tenant
+from onepdd.exc import OnePddError
+
+
+class UnknownTenantError(OnePddError):
+    pass
+
+
+class BudgetExceededError(OnePddError):
+    pass
+
+
+class TenantIndex:
+    """
+    Constant-time lookup of the tenant owning a repository: an explicitly
+    listed repo wins over its org, and the org wins over a host-wide tenant.
+    """
+
+    def __init__(self, tenants: list[Tenant]):
+        self._repos: dict[tuple[str, str, str], Tenant] = {}
+        self._orgs: dict[tuple[str, str, str], Tenant] = {}
+        self._hosts: dict[tuple[str, str], Tenant] = {}
+        for tenant in tenants:
+            host = hostname(tenant.host)
+            for repo in tenant.repos:
+                self._repos.setdefault((tenant.vcs, host, repo.lower()), tenant)
+            for org in tenant.orgs:
+                self._orgs.setdefault((tenant.vcs, host, org.lower()), tenant)
+            if not tenant.repos and not tenant.orgs:
+                self._hosts.setdefault((tenant.vcs, host), tenant)
+
+    def tenant(self, vcs: str, url: str, full_name: str) -> Tenant:
+        host = hostname(url)
+        full_name = full_name.lower()
+        tenant = (
+            self._repos.get((vcs, host, full_name))
+            or self._orgs.get((vcs, host, full_name.split("/")[0]))
+            or self._hosts.get((vcs, host))
+        )
+        if tenant is None:
+            raise UnknownTenantError(f"No tenant configured for {vcs} repo {url}")
+        return tenant
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.rate: float = per_minute / 60
+        self.capacity: float = float(per_minute)
+        self._tokens: float = float(per_minute)
+        self._updated: float = time.monotonic()
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PrioritySemaphore:
+    """
+    A semaphore that lets the cheapest waiter in first rather than the
+    oldest. Every second of waiting takes ``aging`` off a waiter's cost,
+    so expensive ones still get their turn.
+    """
+
+    def __init__(self, value: int, aging: float = 1.0):
+        self.aging: float = aging
+        self._value: int = value
+        self._waiters: list[tuple[float, int, asyncio.Future]] = []
+        self._order: itertools.count = itertools.count()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, cost: float = 0) -> AsyncIterator[None]:
+        await self.acquire(cost)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, cost: float = 0):
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        granted = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._waiters,
+            (cost + self.aging * time.monotonic(), next(self._order), granted),
+        )
+        try:
+            await granted
+        except asyncio.CancelledError:
+            if granted.done() and not granted.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            *_, granted = heapq.heappop(self._waiters)
+            if not granted.done():
+                granted.set_result(None)
+                return
+        self._value += 1
+
+
+class TenantLimits:
+    def __init__(self, tenant: Tenant, aging: float = 1.0):
+        self.tenant: Tenant = tenant
+        self.deploys: PrioritySemaphore = PrioritySemaphore(
+            tenant.budget.concurrency, aging
+        )
+        self.api: TokenBucket = TokenBucket(tenant.budget.api_calls_per_minute)
+
+    def check_disk(self, used: int):
+        budget = self.tenant.budget.disk_bytes
+        if budget is not None and used > budget:
+            raise BudgetExceededError(
+                f"Tenant {self.tenant.name} is over its disk budget: "
+                f"{used} bytes used, {budget} allowed"
+            )
+
+
+def hostname(url: str) -> str:
+    parsed = urlparse(url if "://" in url else f"ssh://{url}")
+    return (parsed.hostname or "").lower()
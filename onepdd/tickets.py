@@ -7,6 +7,7 @@ from starlette.templating import Jinja2Templates
 
 from onepdd.vcs import Vcs, Issue
 from onepdd.storage import StoredPuzzle
+from onepdd.tracing import span
 
 
 class Tickets(ABC):
@@ -22,23 +23,31 @@ class Tickets(ABC):
     async def notify(self, issue: Issue, message: str):
         pass
 
+    async def prefetch(self, puzzles: list[StoredPuzzle]):
+        """
+        Called with the puzzles whose tickets are about to be closed, so
+        their issues can be looked up in as few requests as possible.
+        """
+
 
 class TicketsSimple(Tickets):
     def __init__(self, vcs: Vcs, templates: Jinja2Templates):
         self.vcs: Vcs = vcs
         self.templates: Jinja2Templates = templates
+        self._issues: dict[str, Issue] = {}
 
     async def notify(self, issue: Issue, message: str):
         await self.vcs.add_comment(issue.number, f"@{issue.author.username} {message}")
 
     async def submit(self, puzzle: StoredPuzzle) -> Issue | None:
-        issue = await self.vcs.create_issue(self.title(puzzle), self.body(puzzle))
-        if self.users:
-            await self.vcs.add_comment(
-                issue.number,
-                " ".join([*self.users, "please pay attention to this new issue."]),
-            )
-        return issue
+        with span("tickets.submit", puzzle=puzzle.id):
+            issue = await self.vcs.create_issue(self.title(puzzle), self.body(puzzle))
+            if self.users:
+                await self.vcs.add_comment(
+                    issue.number,
+                    " ".join([*self.users, "please pay attention to this new issue."]),
+                )
+            return issue
 
     def title(self, puzzle: StoredPuzzle) -> str:
         yaml = self.vcs.repo.config
@@ -93,16 +102,26 @@ class TicketsSimple(Tickets):
             for name in config["alerts"][self.vcs.name.lower()]
         ]
 
+    async def prefetch(self, puzzles: list[StoredPuzzle]):
+        with span("tickets.prefetch", puzzles=len(puzzles)):
+            self._issues.update(
+                await self.vcs.issues([p.issue.number for p in puzzles])
+            )
+
     async def close(self, puzzle: StoredPuzzle) -> bool:
-        if (await self.vcs.issue(puzzle.issue.number)).closed:
+        with span("tickets.close", puzzle=puzzle.id, issue=puzzle.issue.number):
+            issue = self._issues.pop(puzzle.issue.number, None)
+            if issue is None:
+                issue = await self.vcs.issue(puzzle.issue.number)
+            if issue.closed:
+                return True
+            await self.vcs.close_with_comment(
+                puzzle.issue.number,
+                f"The puzzle `{puzzle.id}` has disappeared"
+                " from the source code, that's why I closed this issue."
+                + (f" //cc {' '.join(self.users)}" if self.users else ""),
+            )
             return True
-        await self.vcs.close_issue(puzzle.issue.number)
-        await self.vcs.add_comment(
-            puzzle.issue.number,
-            f"The puzzle `{puzzle.number}` has disappeared"
-            " from the source code, that's why I closed this issue."
-            + (f" //cc {' '.join(self.users)}" if self.users else ""),
-        )
 
 
 def truncated(s: str, length: int = 40, tail: str = "...") -> str:
@@ -0,0 +1,190 @@
+import contextlib
+import contextvars
+import dataclasses
+import json
+import re
+import secrets
+import sys
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterator, TextIO
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+@dataclasses.dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str | None = None
+    start_time_unix_nano: int = dataclasses.field(default_factory=time.time_ns)
+    end_time_unix_nano: int | None = None
+    attributes: dict[str, Any] = dataclasses.field(default_factory=dict)
+    status: str = "STATUS_CODE_UNSET"
+    status_message: str = ""
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, exc: BaseException):
+        self.status = "STATUS_CODE_ERROR"
+        self.status_message = f"{type(exc).__name__}: {exc}"
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def otlp(self) -> dict[str, Any]:
+        """
+        The span in the OTLP/JSON encoding, so the output can be fed
+        to any OpenTelemetry-aware tool.
+        """
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "kind": "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": str(self.start_time_unix_nano),
+            "endTimeUnixNano": str(self.end_time_unix_nano or time.time_ns()),
+            "attributes": [
+                {"key": key, "value": otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": self.status, "message": self.status_message},
+        }
+
+
+class SpanExporter(ABC):
+    @abstractmethod
+    def export(self, span: Span):
+        pass
+
+
+class StreamSpanExporter(SpanExporter):
+    def __init__(self, stream: TextIO, service: str = "onepdd"):
+        self.stream: TextIO = stream
+        self.service: str = service
+
+    def export(self, span: Span):
+        self.stream.write(
+            json.dumps({"resource": {"service.name": self.service}, **span.otlp()})
+            + "\n"
+        )
+        self.stream.flush()
+
+
+class FileSpanExporter(StreamSpanExporter):
+    def __init__(self, path: Path, service: str = "onepdd"):
+        super().__init__(path.open("a", buffering=1), service)
+
+
+class BackgroundSpanExporter(SpanExporter):
+    """
+    Hands finished spans to ``origin`` on a thread of its own, so that a
+    slow stdout or trace file never stalls the event loop. Spans are
+    exported in the order they finished.
+    """
+
+    def __init__(self, origin: SpanExporter):
+        self.origin: SpanExporter = origin
+        self._thread: ThreadPoolExecutor = ThreadPoolExecutor(
+            1, thread_name_prefix="onepdd-trace"
+        )
+
+    def export(self, span: Span):
+        self._thread.submit(self.origin.export, span)
+
+    def close(self):
+        """
+        Wait until every span handed over so far is exported.
+        """
+        self._thread.shutdown(wait=True)
+
+
+class Tracer:
+    def __init__(self, exporter: SpanExporter | None = None):
+        self.exporter: SpanExporter | None = exporter
+
+    @contextlib.contextmanager
+    def span(
+        self, name: str, parent: str | None = None, **attributes: Any
+    ) -> Iterator[Span]:
+        """
+        Start a child of the current span, or of the remote span given as
+        a W3C ``traceparent`` value, or a new trace if there is neither.
+        """
+        current = _current.get()
+        trace_id, parent_id = (
+            (current.trace_id, current.span_id) if current else (None, None)
+        )
+        if parent and (match := TRACEPARENT.match(parent)):
+            trace_id, parent_id = match.group(1), match.group(2)
+        span = Span(
+            name=name,
+            trace_id=trace_id or secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_span_id=parent_id,
+            attributes=dict(attributes),
+        )
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            _current.reset(token)
+            span.end_time_unix_nano = time.time_ns()
+            if self.exporter is not None:
+                self.exporter.export(span)
+
+
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "onepdd_span", default=None
+)
+_tracer: Tracer = Tracer()
+
+
+def configure(output: str | None):
+    """
+    Export finished spans to the given file, or to stdout for ``-``.
+    Tracing is a no-op when the output is not set.
+    """
+    global _tracer
+    if not output:
+        _tracer = Tracer()
+    elif output == "-":
+        _tracer = Tracer(BackgroundSpanExporter(StreamSpanExporter(sys.stdout)))
+    else:
+        _tracer = Tracer(BackgroundSpanExporter(FileSpanExporter(Path(output))))
+
+
+def tracer() -> Tracer:
+    return _tracer
+
+
+def span(name: str, parent: str | None = None, **attributes: Any):
+    return _tracer.span(name, parent, **attributes)
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def propagation_headers() -> dict[str, str]:
+    current = _current.get()
+    return {"traceparent": current.traceparent} if current else {}
+
+
+def otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
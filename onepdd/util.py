@@ -1,4 +1,6 @@
 import asyncio
+import os
+import signal
 
 from onepdd.exc import OnePddError
 
@@ -9,6 +11,7 @@ async def exec_cmd_shell(cmd: str) -> str:
         executable="/bin/bash",
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
     )
     try:
         stdout, stderr = await process.communicate()
@@ -20,6 +23,12 @@ async def exec_cmd_shell(cmd: str) -> str:
                 f"Exit code is {process.returncode} for: {cmd!r}. {decoded_stderr}"
             )
     except asyncio.CancelledError:
-        process.kill()
+        # the shell runs in its own process group, so this also kills
+        # whatever it started: git, gopdd
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
         raise
     return stdout.decode() if stdout else ""
@@ -1,8 +1,19 @@
+import contextlib
 import dataclasses
+import json
+import logging
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import AsyncIterator
 
+from aiohttp import ClientResponse, ClientSession
+
+from onepdd.exc import OnePddError
+from onepdd.metrics import VCS_SECONDS
 from onepdd.repo import GitRepo
+from onepdd.tenants import TokenBucket
+from onepdd.tracing import propagation_headers, span
+
+logger = logging.getLogger(__name__)
 
 
 @dataclasses.dataclass
@@ -19,10 +30,26 @@ class Issue:
     closed: bool
 
 
+class ForgeError(OnePddError):
+    """
+    A request the forge answered with an error. Server errors and rate
+    limiting pass; any other ``status`` refuses the request for good.
+    """
+
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status: int | None = status
+
+    @property
+    def transient(self) -> bool:
+        return self.status is not None and (self.status >= 500 or self.status == 429)
+
+
 class Vcs(ABC):
-    config: dict[str, Any]
     repo: GitRepo
     name: str
+    host: str
+    batch_size: int = 1
 
     @abstractmethod
     async def issue(self, issue_id: str) -> Issue:
@@ -43,3 +70,211 @@ class Vcs(ABC):
     @abstractmethod
     async def close_issue(self, issue_id: str):
         pass
+
+    async def issues(self, issue_ids: list[str]) -> dict[str, Issue]:
+        """
+        Several issues at once, up to ``batch_size`` of them per request.
+        Forges without a batch API read them one by one.
+        """
+        return {issue_id: await self.issue(issue_id) for issue_id in issue_ids}
+
+    async def close_with_comment(self, issue_id: str, msg: str):
+        await self.close_issue(issue_id)
+        await self.add_comment(issue_id, msg)
+
+
+@dataclasses.dataclass
+class Operation:
+    method: str
+    repo: str
+    issue: str = ""
+    title: str = ""
+    body: str = ""
+
+
+class DryRunVcs(Vcs):
+    """
+    Records the issues it would create, close or comment on instead of
+    sending anything to the forge. Reads still go to the origin, except
+    for the issues it only pretended to create.
+    """
+
+    def __init__(self, origin: Vcs, operations: list[Operation] | None = None):
+        self.origin: Vcs = origin
+        self.operations: list[Operation] = [] if operations is None else operations
+        self.repo = origin.repo
+        self.name = origin.name
+        self.host = origin.host
+        self.batch_size = origin.batch_size
+        self._created: dict[str, Issue] = {}
+
+    async def issue(self, issue_id: str) -> Issue:
+        if issue_id in self._created:
+            return self._created[issue_id]
+        return await self.origin.issue(issue_id)
+
+    async def issues(self, issue_ids: list[str]) -> dict[str, Issue]:
+        remote = [i for i in issue_ids if i not in self._created]
+        return {
+            **(await self.origin.issues(remote) if remote else {}),
+            **{i: self._created[i] for i in issue_ids if i in self._created},
+        }
+
+    def puzzle_link_for_commit(self, sha: str, file: str, start: str, stop: str) -> str:
+        return self.origin.puzzle_link_for_commit(sha, file, start, stop)
+
+    async def add_comment(self, issue_id: str, msg: str):
+        self._record(Operation("add_comment", self.repo.name, issue_id, body=msg))
+
+    async def create_issue(self, title: str, body: str) -> Issue | None:
+        number = f"dry-run-{len(self._created) + 1}"
+        self._created[number] = Issue(
+            author=IssueAuthor(id="", username=""),
+            href=f"{self.host}/{self.repo.name}/issues/{number}",
+            number=number,
+            closed=False,
+        )
+        self._record(Operation("create_issue", self.repo.name, number, title, body))
+        return self._created[number]
+
+    async def close_issue(self, issue_id: str):
+        if issue_id in self._created:
+            self._created[issue_id].closed = True
+        self._record(Operation("close_issue", self.repo.name, issue_id))
+
+    def _record(self, operation: Operation):
+        self.operations.append(operation)
+        logger.info("Dry run: %s", json.dumps(dataclasses.asdict(operation)))
+
+
+class MeteredVcs(Vcs):
+    def __init__(self, origin: Vcs):
+        self.origin: Vcs = origin
+        self.repo = origin.repo
+        self.name = origin.name
+        self.host = origin.host
+        self.batch_size = origin.batch_size
+
+    async def issue(self, issue_id: str) -> Issue:
+        with VCS_SECONDS.time(host=self.host, method="issue", status="ok") as labels:
+            try:
+                return await self.origin.issue(issue_id)
+            except Exception:
+                labels["status"] = "error"
+                raise
+
+    def puzzle_link_for_commit(self, sha: str, file: str, start: str, stop: str) -> str:
+        return self.origin.puzzle_link_for_commit(sha, file, start, stop)
+
+    async def add_comment(self, issue_id: str, msg: str):
+        with VCS_SECONDS.time(
+            host=self.host, method="add_comment", status="ok"
+        ) as labels:
+            try:
+                await self.origin.add_comment(issue_id, msg)
+            except Exception:
+                labels["status"] = "error"
+                raise
+
+    async def create_issue(self, title: str, body: str) -> Issue | None:
+        with VCS_SECONDS.time(
+            host=self.host, method="create_issue", status="ok"
+        ) as labels:
+            try:
+                return await self.origin.create_issue(title, body)
+            except Exception:
+                labels["status"] = "error"
+                raise
+
+    async def close_issue(self, issue_id: str):
+        with VCS_SECONDS.time(
+            host=self.host, method="close_issue", status="ok"
+        ) as labels:
+            try:
+                await self.origin.close_issue(issue_id)
+            except Exception:
+                labels["status"] = "error"
+                raise
+
+    async def issues(self, issue_ids: list[str]) -> dict[str, Issue]:
+        with VCS_SECONDS.time(host=self.host, method="issues", status="ok") as labels:
+            try:
+                return await self.origin.issues(issue_ids)
+            except Exception:
+                labels["status"] = "error"
+                raise
+
+    async def close_with_comment(self, issue_id: str, msg: str):
+        with VCS_SECONDS.time(
+            host=self.host, method="close_with_comment", status="ok"
+        ) as labels:
+            try:
+                await self.origin.close_with_comment(issue_id, msg)
+            except Exception:
+                labels["status"] = "error"
+                raise
+
+
+class RateLimitedVcs(Vcs):
+    """
+    Spends a token from the tenant's API budget before every forge call,
+    so one busy tenant cannot exhaust the forge's rate limit for the rest.
+    """
+
+    def __init__(self, origin: Vcs, bucket: TokenBucket):
+        self.origin: Vcs = origin
+        self.bucket: TokenBucket = bucket
+        self.repo = origin.repo
+        self.name = origin.name
+        self.host = origin.host
+        self.batch_size = origin.batch_size
+
+    async def issue(self, issue_id: str) -> Issue:
+        await self.bucket.acquire()
+        return await self.origin.issue(issue_id)
+
+    def puzzle_link_for_commit(self, sha: str, file: str, start: str, stop: str) -> str:
+        return self.origin.puzzle_link_for_commit(sha, file, start, stop)
+
+    async def add_comment(self, issue_id: str, msg: str):
+        await self.bucket.acquire()
+        await self.origin.add_comment(issue_id, msg)
+
+    async def create_issue(self, title: str, body: str) -> Issue | None:
+        await self.bucket.acquire()
+        return await self.origin.create_issue(title, body)
+
+    async def close_issue(self, issue_id: str):
+        await self.bucket.acquire()
+        await self.origin.close_issue(issue_id)
+
+    async def issues(self, issue_ids: list[str]) -> dict[str, Issue]:
+        for _ in range(0, len(issue_ids), self.origin.batch_size):
+            await self.bucket.acquire()
+        return await self.origin.issues(issue_ids)
+
+    async def close_with_comment(self, issue_id: str, msg: str):
+        for _ in range(1 if self.origin.batch_size > 1 else 2):
+            await self.bucket.acquire()
+        await self.origin.close_with_comment(issue_id, msg)
+
+
+@contextlib.asynccontextmanager
+async def traced_request(
+    cs: ClientSession,
+    name: str,
+    method: str,
+    url: str,
+    headers: dict[str, str] | None = None,
+    **kwargs,
+) -> AsyncIterator[ClientResponse]:
+    """
+    Send a forge API request inside its own span, passing the trace
+    context on to the forge via the ``traceparent`` header.
+    """
+    with span(name, **{"http.method": method}) as s:
+        async with cs.request(
+            method, url, headers={**(headers or {}), **propagation_headers()}, **kwargs
+        ) as resp:
+            s.set_attribute("http.status_code", resp.status)
+            yield resp
@@ -1,10 +1,45 @@
 import tempfile
 from pathlib import Path
+from typing import Any
 
 import pytest
 
+from benchmarks.synthetic import make_repo
+
+
+def puzzle(id: str = "1-abc", **fields: Any) -> dict[str, Any]:
+    """
+    A puzzle as the state stores it, with ``fields`` in place of the
+    defaults.
+    """
+    return {
+        "id": id,
+        "ticket": "1",
+        "estimate": 30,
+        "role": "DEV",
+        "lines": "1-2",
+        "body": "do it",
+        "file": "foo.py",
+        "author": "me",
+        "email": "me@example.com",
+        "time": "2024-01-01T00:00:00+00:00",
+        "alive": True,
+        "issue": None,
+        **fields,
+    }
+
+
+def issue(number: str, closed: str | None = None) -> dict[str, Any]:
+    return {"href": "", "number": number, "closed": closed}
+
 
 @pytest.fixture()
 def temporary_file():
     with tempfile.TemporaryDirectory() as path:
         yield Path(path) / "foo.json"
+
+
+@pytest.fixture()
+def local_repo_uri():
+    with tempfile.TemporaryDirectory() as path:
+        yield make_repo(Path(path) / "origin", files=5, puzzles=3).as_uri()
@@ -0,0 +1,102 @@
+import asyncio
+import collections
+from typing import Any
+
+
+class FakeRedis:
+    """
+    In-process RESP2 server implementing the hash and transaction
+    commands RedisStorage uses, including WATCH-based optimistic locking.
+    """
+
+    def __init__(self):
+        self.hashes: dict[str, dict[str, str]] = collections.defaultdict(dict)
+        self.revisions: collections.Counter[str] = collections.Counter()
+        self.commands: list[tuple[str, ...]] = []
+        self._server: asyncio.Server | None = None
+
+    async def __aenter__(self) -> "FakeRedis":
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._server.close()
+        await self._server.wait_closed()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}"
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        watched: dict[str, int] = {}
+        queued: list[list[str]] | None = None
+        while header := await reader.readline():
+            args = []
+            for _ in range(int(header[1:])):
+                length = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(length + 2))[:-2].decode())
+            name = args[0].upper()
+            self.commands.append(tuple(args))
+            if name == "MULTI":
+                queued, reply = [], "+OK"
+            elif name == "EXEC":
+                if any(self.revisions[k] != v for k, v in watched.items()):
+                    reply = None
+                else:
+                    reply = [self._apply(command) for command in queued]
+                queued, watched = None, {}
+            elif name == "WATCH":
+                watched.update({k: self.revisions[k] for k in args[1:]})
+                reply = "+OK"
+            elif name == "UNWATCH":
+                watched, reply = {}, "+OK"
+            elif queued is not None:
+                queued.append(args)
+                reply = "+QUEUED"
+            else:
+                reply = self._apply(args)
+            writer.write(encoded(reply))
+            await writer.drain()
+        writer.close()
+
+    def _apply(self, args: list[str]) -> Any:
+        name, key, rest = args[0].upper(), args[1] if len(args) > 1 else "", args[2:]
+        if name == "PING":
+            return "+PONG"
+        if name == "HGETALL":
+            return [item for pair in self.hashes.get(key, {}).items() for item in pair]
+        if name == "HGET":
+            return self.hashes.get(key, {}).get(rest[0])
+        if name == "HSET":
+            self.revisions[key] += 1
+            new = [f for f in rest[::2] if f not in self.hashes[key]]
+            self.hashes[key].update(zip(rest[::2], rest[1::2]))
+            return len(new)
+        if name == "HDEL":
+            self.revisions[key] += 1
+            return sum(self.hashes[key].pop(f, None) is not None for f in rest)
+        if name == "HINCRBY":
+            self.revisions[key] += 1
+            value = int(self.hashes[key].get(rest[0], 0)) + int(rest[1])
+            self.hashes[key][rest[0]] = str(value)
+            return value
+        if name == "DEL":
+            self.revisions[key] += 1
+            return int(self.hashes.pop(key, None) is not None)
+        return ValueError(f"ERR unknown command '{name}'")
+
+
+def encoded(reply: Any) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, ValueError):
+        return f"-{reply}\r\n".encode()
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, list):
+        return f"*{len(reply)}\r\n".encode() + b"".join(map(encoded, reply))
+    if reply.startswith("+"):
+        return f"{reply}\r\n".encode()
+    data = reply.encode()
+    return f"${len(data)}\r\n".encode() + data + b"\r\n"
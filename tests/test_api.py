@@ -0,0 +1,140 @@
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+from fastapi import HTTPException, Response
+from starlette.templating import Jinja2Templates
+
+from onepdd.api import PuzzlesApi
+from onepdd.config import Config, Tenant
+from onepdd.deploy import Deployer
+from onepdd.index import PuzzleIndex
+from onepdd.storage import storage_for
+from tests.conftest import issue, puzzle
+
+
+PUZZLES = [
+    puzzle(
+        f"{n}-abc",
+        ticket=str(n % 3),
+        role="DEV" if n % 2 else "ARC",
+        body=f"puzzle {n}",
+        file=f"src/{'core' if n < 5 else 'web'}/f{n}.py",
+        author="alice" if n < 7 else "bob",
+        time=f"2024-01-{n + 1:02d}T00:00:00+00:00",
+        alive=n % 4 != 0,
+        issue=issue(str(n)),
+    )
+    for n in range(10)
+]
+
+
+def ids(index: PuzzleIndex, found: list[int]) -> list[str]:
+    return [index.puzzles[pos]["id"].split("-")[0] for pos in found]
+
+
+def test_index_filters_combine():
+    index = PuzzleIndex(PUZZLES)
+    assert ids(index, index.query(author="alice", role="DEV")) == ["1", "3", "5"]
+    assert ids(index, index.query(file_prefix="src/core/", alive=False)) == ["0", "4"]
+    assert ids(index, index.query(ticket="1", author="bob")) == ["7"]
+    assert index.query(author="carol") == []
+
+
+def test_index_filters_by_age():
+    index = PuzzleIndex(PUZZLES)
+    day = datetime(2024, 1, 4, tzinfo=timezone.utc)
+    assert ids(index, index.query(older_than=day)) == ["0", "1", "2"]
+    assert ids(index, index.query(newer_than=day, author="alice")) == ["4", "5", "6"]
+    assert ids(index, index.query(older_than=day.replace(tzinfo=None))) == [
+        "0",
+        "1",
+        "2",
+    ]
+
+
+def test_index_pages_after_cursor():
+    index = PuzzleIndex(PUZZLES)
+    assert ids(index, index.query(alive=True, limit=3)) == ["1", "2", "3"]
+    assert ids(index, index.query(alive=True, after=3, limit=3)) == ["5", "6", "7"]
+    assert ids(index, index.query(after=7)) == ["8", "9"]
+
+
+@pytest.fixture
+def api(tmp_path):
+    deployer = Deployer(
+        Config(
+            id_rsa="",
+            storage=tmp_path,
+            tenants=[
+                Tenant(name="default", vcs="gitea", host="h", token="t", secret_key="s")
+            ],
+        ),
+        Jinja2Templates(Path(__file__).parent.parent / "templates"),
+        {"gitea": Mock()},
+    )
+    return PuzzlesApi(deployer, "tok")
+
+
+AUTH = "Bearer tok"
+
+
+async def test_api_pages_and_caches(api):
+    await api.deployer.storage(api.deployer.tenant("default"), "foo/bar").save(PUZZLES)
+    response = Response()
+    first = await api.handle(
+        "default", "foo", "bar", response, author="alice", limit=4, authorization=AUTH
+    )
+    assert len(first["puzzles"]) == 4
+    second = await api.handle(
+        "default",
+        "foo",
+        "bar",
+        Response(),
+        author="alice",
+        cursor=first["next"],
+        authorization=AUTH,
+    )
+    assert [p["body"] for p in second["puzzles"]] == [
+        "puzzle 4",
+        "puzzle 5",
+        "puzzle 6",
+    ]
+    assert second["next"] is None
+    cached = await api.handle(
+        "default",
+        "foo",
+        "bar",
+        Response(),
+        if_none_match=response.headers["ETag"],
+        authorization=AUTH,
+    )
+    assert cached.status_code == 304
+
+
+async def test_api_needs_the_token(api):
+    for authorization in (None, "Bearer wrong"):
+        with pytest.raises(HTTPException) as e:
+            await api.handle(
+                "default", "foo", "bar", Response(), authorization=authorization
+            )
+        assert e.value.status_code == 401
+
+
+async def test_api_sees_saves_of_other_nodes(api):
+    tenant = api.deployer.tenant("default")
+    await api.deployer.storage(tenant, "foo/bar").save(PUZZLES)
+    first = await api.handle("default", "foo", "bar", Response(), authorization=AUTH)
+    assert len(first["puzzles"]) == 10
+    other = storage_for(api.deployer.config, tenant.storage_prefix, "foo/bar")
+    await other.save(PUZZLES[:3])
+    second = await api.handle("default", "foo", "bar", Response(), authorization=AUTH)
+    assert len(second["puzzles"]) == 3
+
+
+async def test_index_cache_is_bounded(api):
+    api.deployer.indexes.size = 2
+    for repo in ("a", "b", "c"):
+        await api.handle("default", "foo", repo, Response(), authorization=AUTH)
+    assert list(api.deployer.indexes._puzzles) == ["default/foo/b", "default/foo/c"]
@@ -0,0 +1,64 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from onepdd.app import make_app
+from onepdd.config import Config, load_config
+
+
+@pytest.fixture
+def config_file(tmp_path: Path):
+    load_config.cache_clear()
+    file = tmp_path / "config.yaml"
+    file.write_text(
+        "id_rsa: ''\n"
+        f"storage_dir: {tmp_path}\n"
+        "gitea:\n"
+        "  token: from-file\n"
+        "  host: https://gitea.example.com\n"
+        "  secret_key: secret\n"
+    )
+    yield file
+    load_config.cache_clear()
+
+
+def test_importing_app_is_lazy():
+    modules = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import json, sys, onepdd.app; print(json.dumps(list(sys.modules)))",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    assert not {"fastapi", "yaml", "aiohttp", "jinja2", "onepdd.hooks.gitea"} & set(
+        json.loads(modules)
+    )
+
+
+def test_load_config_applies_environment(config_file, monkeypatch):
+    monkeypatch.setenv("ONEPDD_CONFIG", str(config_file))
+    monkeypatch.setenv("ONEPDD_GITEA__TOKEN", "from-env")
+    config = load_config()
+    assert config.gitea_token == "from-env"
+    assert config.gitea_host == "https://gitea.example.com"
+    assert config.storage == config_file.parent
+    assert load_config() is config
+
+
+def test_make_app_routes(tmp_path):
+    api = make_app(
+        Config(
+            id_rsa="",
+            storage=tmp_path,
+            gitea_token="token",
+            gitea_host="https://gitea.example.com",
+            gitea_secret_key="secret",
+        )
+    )
+    assert {"/hook/gitea", "/metrics"} <= {route.path for route in api.routes}
@@ -0,0 +1,154 @@
+import asyncio
+import dataclasses
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+from starlette.templating import Jinja2Templates
+
+from onepdd.config import Budget, Config, Tenant
+from onepdd.deploy import Deployer, DeployJob
+from onepdd.exc import OnePddError
+from onepdd.metrics import DEPLOYS_SKIPPED
+from onepdd.registry import KnownRepo, RepoRegistry
+from onepdd.repo import GitRepo
+from onepdd.storage import storage_for
+from onepdd.tenants import BudgetExceededError
+from tests.conftest import puzzle
+
+TENANT = Tenant(
+    name="default",
+    vcs="gitea",
+    host="https://git.acme.com",
+    token="token",
+    secret_key="secret",
+)
+
+
+@pytest.fixture
+async def deployer(tmp_path):
+    deployer = Deployer(
+        Config(id_rsa="", storage=tmp_path, tenants=[TENANT]),
+        Jinja2Templates(Path(__file__).parent.parent / "templates"),
+        {"gitea": Mock()},
+    )
+    yield deployer
+    await deployer.pipeline.close()
+
+
+async def test_deploy_skips_unchanged_head(deployer):
+    deployer.registry.record(
+        KnownRepo("default", "file:///nowhere", "foo/bar", sha="abc")
+    )
+    skipped = DEPLOYS_SKIPPED.value(reason="unchanged")
+    await deployer.deploy(DeployJob(TENANT, "file:///nowhere", "foo/bar", head="abc"))
+    assert DEPLOYS_SKIPPED.value(reason="unchanged") == skipped + 1
+    assert deployer.in_flight == 0
+
+
+async def test_deploy_clones_moved_head(deployer):
+    deployer.registry.record(
+        KnownRepo("default", "file:///nowhere", "foo/bar", sha="abc")
+    )
+    with pytest.raises(OnePddError, match="git clone"):
+        await deployer.deploy(
+            DeployJob(TENANT, "file:///nowhere", "foo/bar", head="def")
+        )
+
+
+async def test_deploy_probes_remote_without_webhook_head(
+    deployer, local_repo_uri, tmp_path, monkeypatch
+):
+    head = await GitRepo(uri=local_repo_uri, name="foo/bar").remote_head()
+    deployer.registry.record(KnownRepo("default", local_repo_uri, "foo/bar", sha=head))
+    deployer.config.id_rsa = "KEY"
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    (tmp_path / "home").mkdir()
+    job = DeployJob(TENANT, local_repo_uri, "foo/bar")
+    assert await deployer.unchanged(job)
+    assert job.head == head
+    assert (tmp_path / "home" / ".ssh" / "id_rsa").read_text() == "KEY"
+
+
+async def test_newer_push_supersedes_deploy_in_flight(deployer):
+    fetching, cancelled = asyncio.Event(), []
+
+    async def slow_fetch(run) -> bool:
+        fetching.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(run.job.head)
+            raise
+
+    async def fetch_nothing(run) -> bool:
+        return False
+
+    fetch = deployer.pipeline.stages[0]
+    fetch.handle = slow_fetch
+    superseded = DEPLOYS_SKIPPED.value(reason="superseded")
+    old = asyncio.create_task(
+        deployer.deploy(DeployJob(TENANT, "file:///nowhere", "foo/bar", head="a"))
+    )
+    await fetching.wait()
+    fetch.handle = fetch_nothing
+    await deployer.deploy(DeployJob(TENANT, "file:///nowhere", "foo/bar", head="b"))
+    await old
+    assert cancelled == ["a"]
+    assert DEPLOYS_SKIPPED.value(reason="superseded") == superseded + 1
+
+
+async def test_registry_survives_restart(deployer, tmp_path):
+    repo = KnownRepo("default", "file:///nowhere", "foo/bar", sha="abc")
+    deployer.registry.record(repo)
+    await deployer.registry.flush()
+    assert RepoRegistry(tmp_path / "repos.json").get("default", "foo/bar") == repo
+
+
+async def test_deploy_over_disk_budget_does_not_clone(deployer, tmp_path):
+    tenant = dataclasses.replace(TENANT, budget=Budget(disk_bytes=10))
+    deployer.registry.record(KnownRepo("default", "file:///nowhere", "foo/baz"))
+    (tmp_path / "gitea-foo").mkdir()
+    (tmp_path / "gitea-foo" / "baz").write_bytes(b"x" * 100)
+    with pytest.raises(BudgetExceededError, match="100 bytes used"):
+        await deployer.deploy(DeployJob(tenant, "file:///nowhere", "foo/bar"))
+
+
+async def test_push_of_commit_in_flight_waits_without_a_worker(deployer):
+    fetching, release, fetched = asyncio.Event(), asyncio.Event(), []
+
+    async def slow_fetch(run) -> bool:
+        fetched.append(run.job.head)
+        fetching.set()
+        await release.wait()
+        return False
+
+    deployer.pipeline.stages[0].handle = slow_fetch
+    duplicates = DEPLOYS_SKIPPED.value(reason="duplicate")
+    first = asyncio.create_task(
+        deployer.deploy(DeployJob(TENANT, "file:///nowhere", "foo/bar", head="a"))
+    )
+    await fetching.wait()
+    again = [
+        asyncio.create_task(
+            deployer.deploy(DeployJob(TENANT, "file:///nowhere", "foo/bar", head="a"))
+        )
+        for _ in range(5)
+    ]
+    await asyncio.sleep(0)
+    assert not any(task.done() for task in again)
+    release.set()
+    await asyncio.gather(first, *again)
+    assert fetched == ["a"]
+    assert DEPLOYS_SKIPPED.value(reason="duplicate") == duplicates + 5
+
+
+async def test_backfill_counts_repositories_that_never_moved(deployer, tmp_path):
+    deployer.registry.record(KnownRepo("default", "file:///nowhere", "foo/bar"))
+    deployer.registry.record(KnownRepo("gone", "file:///nowhere", "foo/baz"))
+    await storage_for(deployer.config, TENANT.storage_prefix, "foo/bar").save(
+        [puzzle()]
+    )
+    await deployer.backfill()
+    assert deployer.rollups.by("repo")["default/foo/bar"]["puzzles"] == 1
+    assert (tmp_path / "rollups.json").exists()
@@ -0,0 +1,98 @@
+import os
+
+from onepdd.config import Config, Tenant
+from onepdd.disk import DiskManager
+from onepdd.registry import KnownRepo, RepoRegistry
+from onepdd.repo import GitRepo
+from onepdd.storage import SimpleFsStorage
+from tests.conftest import issue, puzzle
+
+
+def manager(tmp_path, **options) -> DiskManager:
+    registry = RepoRegistry(tmp_path / "repos.json")
+    return DiskManager(
+        Config(id_rsa="", storage=tmp_path, **options),
+        registry,
+        lambda repo: SimpleFsStorage(tmp_path / "state" / repo.name),
+    )
+
+
+async def test_disk_archives_long_closed_puzzles(tmp_path):
+    disk = manager(tmp_path, archive_after_days=30)
+    repo = KnownRepo("default", "uri", "foo/bar")
+    disk.registry.record(repo)
+    storage = disk.storage(repo)
+    await storage.save(
+        [
+            puzzle("1-abc", alive=False, issue=issue("1", "2024-01-01T00:00:00+00:00")),
+            puzzle("2-abc", alive=False, issue=issue("2", "2024-03-20T00:00:00+00:00")),
+            puzzle("3-abc", issue=issue("3")),
+        ]
+    )
+    now = 1711929600  # 2024-04-01
+    assert await disk.archived(repo, now) == 1
+    assert [p["id"] for p in await storage.load()] == ["2-abc", "3-abc"]
+    assert (tmp_path / "archive" / "default" / "foo" / "bar.jsonl").read_text().count(
+        "1-abc"
+    ) == 1
+    assert await disk.archived(repo, now) == 0
+    assert (await disk.report())["archive_bytes"] > 0
+
+
+async def test_disk_evicts_idle_and_over_quota_clones(tmp_path, local_repo_uri):
+    cache = tmp_path / "clones"
+    disk = manager(tmp_path, clone_cache=cache, clone_cache_bytes=1)
+    async with disk.using(local_repo_uri), GitRepo(
+        uri=local_repo_uri, name="foo/bar", cache_dir=cache
+    ) as repo:
+        path = repo.path
+    idle = cache / "idle"
+    idle.mkdir()
+    os.utime(idle, (0, 0))
+    report = await disk.report()
+    assert report["clones_bytes"] > 0
+    await disk.collect(path.stat().st_mtime + 1)
+    assert not idle.exists()
+    assert not path.exists()
+
+
+async def test_disk_usage_adds_up_clones_and_state_of_the_tenant(
+    tmp_path, local_repo_uri
+):
+    cache = tmp_path / "clones"
+    disk = manager(tmp_path, clone_cache=cache)
+    disk.registry.record(KnownRepo("default", local_repo_uri, "foo/bar"))
+    disk.registry.record(KnownRepo("other", "uri", "foo/baz"))
+    tenant = Tenant(name="default", vcs="gitea", host="h", token="t", secret_key="s")
+    assert await disk.usage(tenant) == 0
+    (tmp_path / "gitea-foo").mkdir()
+    (tmp_path / "gitea-foo" / "bar").write_bytes(b"x" * 100)
+    assert await disk.usage(tenant) == 100
+    async with GitRepo(uri=local_repo_uri, name="foo/bar", cache_dir=cache) as repo:
+        clone = await repo.disk_usage()
+    assert await disk.usage(tenant) == 100 + clone
+
+
+async def test_disk_measures_clones_again_only_once_they_changed(
+    tmp_path, local_repo_uri, monkeypatch
+):
+    cache = tmp_path / "clones"
+    disk = manager(tmp_path, clone_cache=cache)
+    disk.registry.record(KnownRepo("default", local_repo_uri, "foo/bar"))
+    tenant = Tenant(name="default", vcs="gitea", host="h", token="t", secret_key="s")
+    async with GitRepo(uri=local_repo_uri, name="foo/bar", cache_dir=cache):
+        pass
+    measured = []
+
+    async def counted(path):
+        measured.append(path)
+        return 4096
+
+    monkeypatch.setattr("onepdd.disk.du", counted)
+    assert await disk.usage(tenant) == 4096
+    assert await disk.usage(tenant) == 4096
+    assert len(measured) == 1
+    async with disk.using(local_repo_uri):
+        pass
+    await disk.usage(tenant)
+    assert len(measured) == 2
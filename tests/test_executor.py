@@ -0,0 +1,54 @@
+import asyncio
+
+from onepdd.executor import SubprocessExecutor
+
+
+async def test_executor_admits_round_robin_across_repos():
+    executor = SubprocessExecutor(max_running=1, max_load=None, min_free_disk=0)
+    order = []
+    release = asyncio.Event()
+
+    async def run(repo: str, n: int):
+        async with executor.slot(repo, "clone"):
+            order.append(f"{repo}-{n}")
+            await release.wait()
+
+    first = asyncio.create_task(run("busy", 0))
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(run("busy", n)) for n in range(1, 4)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(run("quiet", 1)))
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(first, *tasks)
+    assert order == ["busy-0", "busy-1", "quiet-1", "busy-2", "busy-3"]
+    assert executor.running == 0
+
+
+async def test_executor_skips_cancelled_waiters():
+    executor = SubprocessExecutor(max_running=1, max_load=None, min_free_disk=0)
+    release = asyncio.Event()
+
+    async def run(repo: str):
+        async with executor.slot(repo, "scan"):
+            await release.wait()
+
+    first = asyncio.create_task(run("a"))
+    await asyncio.sleep(0)
+    cancelled = asyncio.create_task(run("b"))
+    waiting = asyncio.create_task(run("c"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    release.set()
+    await asyncio.gather(first, waiting)
+    assert cancelled.cancelled()
+    assert executor.running == 0
+
+
+async def test_executor_holds_back_when_disk_is_full(tmp_path):
+    executor = SubprocessExecutor(
+        max_running=4, max_load=None, min_free_disk=2**62, disk_path=str(tmp_path)
+    )
+    assert executor.admitting()
+    executor.running = 1
+    assert not executor.admitting()
@@ -0,0 +1,18 @@
+from onepdd.history import DeployHistory
+
+
+async def test_history_averages_and_persists(tmp_path):
+    history = DeployHistory(tmp_path / "history.json", weight=0.5)
+    history.record("t/big", fetch_seconds=10, scan_seconds=30, puzzles=100)
+    history.record("t/big", fetch_seconds=20, scan_seconds=50)
+    history.record("t/small", fetch_seconds=1, scan_seconds=1)
+    assert history.expected("t/big") == 55
+    assert history.get("t/big").deploys == 2
+    await history.flush()
+    restored = DeployHistory(tmp_path / "history.json")
+    assert restored.get("t/big") == history.get("t/big")
+    assert restored.expected("t/new") == (55 + 2) / 2
+
+
+def test_history_without_data_expects_nothing(tmp_path):
+    assert DeployHistory(tmp_path / "history.json").expected("t/new") == 0
@@ -0,0 +1,215 @@
+import hmac
+import json
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from aiohttp import ClientSession
+from fastapi import FastAPI
+
+from benchmarks.fake_forge import FakeForge, FakeIssue
+from benchmarks.load import post
+from onepdd.config import Tenant
+from onepdd.hooks.gitea import GiteaVcs, HookGitea
+from onepdd.hooks.github import (
+    GithubError,
+    GithubGraphqlVcs,
+    HookGithub,
+    github_vcs,
+)
+from onepdd.storage import StoredIssue, StoredPuzzle
+from onepdd.tenants import TenantIndex
+from onepdd.tickets import TicketsSimple
+
+
+@pytest.fixture
+async def forge():
+    async with FakeForge() as forge:
+        yield forge
+
+
+async def test_gitea_vcs_issue_lifecycle(forge):
+    repo = Mock()
+    repo.name = "foo/bar"
+    tenant = Tenant(
+        name="acme", vcs="gitea", host=forge.url, token="token", secret_key="secret"
+    )
+    async with ClientSession() as cs:
+        vcs = GiteaVcs(cs, repo, tenant)
+        issue = await vcs.create_issue("foo.py : 1-2 : do it", "body")
+        await vcs.add_comment(issue.number, "@someone look")
+        await vcs.close_issue(issue.number)
+        assert (await vcs.issue(issue.number)).closed
+    assert forge.issues["foo/bar"][int(issue.number)].comments == ["@someone look"]
+    assert forge.total_calls == 4
+
+
+def github_graphql(cs: ClientSession, forge: FakeForge) -> GithubGraphqlVcs:
+    repo = Mock()
+    repo.name = "foo/bar"
+    repo.config = {}
+    tenant = Tenant(
+        name="acme",
+        vcs="github",
+        host=forge.url,
+        token="token",
+        secret_key="secret",
+        api="graphql",
+    )
+    return github_vcs(cs, repo, tenant)
+
+
+async def test_github_graphql_issue_lifecycle(forge):
+    async with ClientSession() as cs:
+        vcs = github_graphql(cs, forge)
+        issue = await vcs.create_issue("foo.py : 1-2 : do it", "body")
+        await vcs.add_comment(issue.number, "@someone look")
+        await vcs.close_with_comment(issue.number, "closed it")
+        assert (await vcs.issue(issue.number)).closed
+    assert forge.issues["foo/bar"][int(issue.number)].comments == [
+        "@someone look",
+        "closed it",
+    ]
+    assert forge.calls == {
+        "graphql.Repository": 1,
+        "graphql.CreateIssue": 1,
+        "graphql.AddComment": 1,
+        "graphql.CloseWithComment": 1,
+        "graphql.Issues": 1,
+    }
+
+
+async def test_github_graphql_closes_tickets_in_few_requests(forge):
+    for n in range(1, 251):
+        forge.issues["foo/bar"][n] = FakeIssue(n, f"puzzle {n}", "body")
+    forge.issues["foo/bar"][7].state = "closed"
+    puzzles = [
+        StoredPuzzle(
+            id=f"{n}-abc",
+            ticket="1",
+            estimate=30,
+            role="DEV",
+            lines="1-2",
+            body="do it",
+            file="foo.py",
+            author="me",
+            email="me@example.com",
+            time="2024-01-01T00:00:00+00:00",
+            alive=False,
+            issue=StoredIssue(href="", number=str(n)),
+        )
+        for n in range(1, 251)
+    ]
+    async with ClientSession() as cs:
+        tickets = TicketsSimple(github_graphql(cs, forge), Mock())
+        await tickets.prefetch(puzzles)
+        assert all([await tickets.close(p) for p in puzzles])
+    assert forge.calls["graphql.Issues"] == 3
+    assert forge.calls["graphql.CloseWithComment"] == 249
+    assert all(i.state == "closed" for i in forge.issues["foo/bar"].values())
+    assert forge.issues["foo/bar"][7].comments == []
+
+
+async def test_github_graphql_reports_missing_issue(forge):
+    async with ClientSession() as cs:
+        with pytest.raises(GithubError):
+            await github_graphql(cs, forge).issue("42")
+
+
+@pytest.mark.parametrize(
+    "vcs, header, prefix",
+    [("gitea", "X-Gitea-Signature", ""), ("github", "X-Hub-Signature-256", "sha256=")],
+)
+async def test_hooks_check_the_signature_header_the_forge_sends(vcs, header, prefix):
+    tenant = Tenant(
+        name="acme", vcs=vcs, host="https://git.acme.com", token="t", secret_key="s"
+    )
+    deployer = Mock()
+    deployer.tenants = TenantIndex([tenant])
+    deployer.deploy = AsyncMock()
+    hook = (HookGitea if vcs == "gitea" else HookGithub)(deployer)
+    api = FastAPI()
+    api.add_api_route(f"/hook/{vcs}", hook.handle, methods=["POST"])
+    body = json.dumps(
+        {
+            "repository": {
+                "id": "1",
+                "name": "bar",
+                "full_name": "foo/bar",
+                "html_url": "https://git.acme.com/foo/bar",
+                "ssh_url": "git@git.acme.com:foo/bar.git",
+                "clone_url": "https://git.acme.com/foo/bar.git",
+                "default_branch": "master",
+            }
+        }
+    ).encode()
+    good = prefix + hmac.new(b"s", body, "sha256").hexdigest()
+    bad = prefix + hmac.new(b"wrong", body, "sha256").hexdigest()
+    assert (
+        await post(api, f"/hook/{vcs}", body, [(header.lower().encode(), bad.encode())])
+        == 401
+    )
+    assert await post(api, f"/hook/{vcs}", body, []) == 401
+    assert (
+        await post(
+            api, f"/hook/{vcs}", body, [(header.lower().encode(), good.encode())]
+        )
+        == 200
+    )
+    deployer.deploy.assert_awaited_once()
+
+
+async def test_github_fork_push_deploys_against_its_parent(forge):
+    tenant = Tenant(
+        name="acme",
+        vcs="github",
+        host="https://github.com",
+        token="t",
+        secret_key="s",
+        api_url=forge.url,
+    )
+    forge.forks["me/bar"] = "foo/bar"
+    deployer = Mock()
+    deployer.tenants = TenantIndex([tenant])
+    deployer.deploy = AsyncMock()
+    api = FastAPI()
+    api.add_api_route("/hook/github", HookGithub(deployer).handle, methods=["POST"])
+    body = json.dumps(
+        {
+            "ref": "refs/heads/main",
+            "before": "0" * 40,
+            "after": "a" * 40,
+            "repository": {
+                "id": 123456,
+                "node_id": "R_kgDOABCDEF",
+                "name": "bar",
+                "full_name": "me/bar",
+                "private": False,
+                "owner": {"name": "me", "login": "me", "id": 42},
+                "html_url": "https://github.com/me/bar",
+                "fork": True,
+                "url": "https://github.com/me/bar",
+                "ssh_url": "git@github.com:me/bar.git",
+                "clone_url": "https://github.com/me/bar.git",
+                "default_branch": "main",
+                "master_branch": "main",
+            },
+            "pusher": {"name": "me", "email": "me@example.com"},
+            "sender": {"login": "me", "id": 42},
+            "commits": [],
+        }
+    ).encode()
+    signature = "sha256=" + hmac.new(b"s", body, "sha256").hexdigest()
+    for _ in range(2):
+        assert (
+            await post(
+                api,
+                "/hook/github",
+                body,
+                [(b"x-hub-signature-256", signature.encode())],
+            )
+            == 200
+        )
+    job = deployer.deploy.await_args.args[0]
+    assert job.upstream == f"git@{forge.host}:foo/bar.git"
+    assert job.head == "a" * 40
+    assert forge.calls["repository"] == 1
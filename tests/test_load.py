@@ -0,0 +1,19 @@
+from benchmarks.load import percentiles, run
+
+
+async def test_pushes_pass_the_signature_check_of_both_hooks():
+    report = await run(["gitea", "github"], 1, 3, 2, rate=20, duration=0.2)
+    for hook in ("gitea", "github"):
+        assert report["hooks"][hook]["requests"] == 2
+        assert "401" not in report["hooks"][hook]["errors"]
+
+
+async def test_badly_signed_pushes_count_as_errors():
+    report = await run(["github"], 1, 3, 2, rate=20, duration=0.1, secret="wrong")
+    assert report["hooks"]["github"]["errors"] == {"401": 2}
+    assert report["hooks"]["github"]["error_rate"] == 1
+
+
+def test_percentiles():
+    latency = percentiles([i / 100 for i in range(101)])
+    assert (latency["p50"], latency["p99"], latency["max"]) == (0.5, 0.99, 1)
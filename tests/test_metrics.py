@@ -0,0 +1,68 @@
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from onepdd.metrics import Counter, Histogram, Registry, VCS_SECONDS
+from onepdd.vcs import MeteredVcs
+
+
+def test_counter_exposition():
+    registry = Registry()
+    counter = registry.register(Counter("onepdd_things", "Things counted.", ("repo",)))
+    counter.inc(repo="foo/bar")
+    counter.inc(2, repo="foo/bar")
+    counter.inc(repo='baz"qux')
+    assert registry.exposition() == (
+        "# HELP onepdd_things Things counted.\n"
+        "# TYPE onepdd_things counter\n"
+        'onepdd_things_total{repo="baz\\"qux"} 1\n'
+        'onepdd_things_total{repo="foo/bar"} 3\n'
+    )
+
+
+def test_histogram_exposition():
+    registry = Registry()
+    histogram = registry.register(
+        Histogram("onepdd_took_seconds", "Time taken.", ("op",), buckets=(0.5, 1))
+    )
+    histogram.observe(0.25, op="clone")
+    histogram.observe(1, op="clone")
+    histogram.observe(3.5, op="clone")
+    assert registry.exposition() == (
+        "# HELP onepdd_took_seconds Time taken.\n"
+        "# TYPE onepdd_took_seconds histogram\n"
+        'onepdd_took_seconds_bucket{op="clone",le="0.5"} 1\n'
+        'onepdd_took_seconds_bucket{op="clone",le="1"} 2\n'
+        'onepdd_took_seconds_bucket{op="clone",le="+Inf"} 3\n'
+        'onepdd_took_seconds_sum{op="clone"} 4.75\n'
+        'onepdd_took_seconds_count{op="clone"} 3\n'
+    )
+
+
+def test_histogram_rejects_unknown_labels():
+    with pytest.raises(ValueError):
+        Histogram("onepdd_x_seconds", "X.", ("op",)).observe(1, host="foo")
+
+
+async def test_metered_vcs_records_status():
+    origin = Mock(
+        host="https://metered.example.com",
+        close_issue=AsyncMock(side_effect=RuntimeError("boom")),
+        add_comment=AsyncMock(),
+    )
+    vcs = MeteredVcs(origin)
+    await vcs.add_comment("1", "hello")
+    with pytest.raises(RuntimeError):
+        await vcs.close_issue("1")
+    assert (
+        VCS_SECONDS.count(
+            host="https://metered.example.com", method="add_comment", status="ok"
+        )
+        == 1
+    )
+    assert (
+        VCS_SECONDS.count(
+            host="https://metered.example.com", method="close_issue", status="error"
+        )
+        == 1
+    )
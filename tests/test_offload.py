@@ -0,0 +1,15 @@
+import threading
+
+from onepdd.offload import Reaper, offloaded
+
+
+async def test_offloaded_runs_off_the_loop():
+    assert await offloaded(threading.current_thread) is not threading.current_thread()
+
+
+def test_reaper_removes_right_away(tmp_path):
+    clone = tmp_path / "clone"
+    (clone / "deep" / "tree").mkdir(parents=True)
+    (clone / "deep" / "tree" / "file").write_text("x")
+    Reaper(tmp_path / "trash").reap(clone)
+    assert not clone.exists()
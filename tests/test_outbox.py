@@ -0,0 +1,125 @@
+from pathlib import Path
+
+import pytest
+from aiohttp import ClientSession
+from starlette.templating import Jinja2Templates
+
+from benchmarks.fake_forge import FakeForge
+from onepdd.config import Config, Tenant
+from onepdd.deploy import Deployer
+from onepdd.hooks.gitea import GiteaVcs
+from onepdd.metrics import TICKETS_FAILED
+from onepdd.outbox import (
+    CircuitBreaker,
+    Drainer,
+    IsolatedTickets,
+    Outbox,
+    OutboxTickets,
+    Pending,
+)
+from onepdd.puzzles import Puzzles
+from onepdd.repo import GitRepo
+from onepdd.tickets import TicketsSimple
+from tests.conftest import issue, puzzle
+
+
+def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker(failures=2, cooldown=10)
+    breaker.failed(now=0)
+    assert breaker.allows(now=0)
+    breaker.failed(now=1)
+    assert not breaker.allows(now=5)
+    assert breaker.allows(now=11)
+    breaker.failed(now=11)
+    assert not breaker.allows(now=12)
+    breaker.succeeded()
+    assert breaker.allows(now=12) and not breaker.open
+
+
+@pytest.fixture
+async def forge():
+    async with FakeForge() as forge:
+        yield forge
+
+
+async def test_outbox_defers_tickets_until_forge_recovers(tmp_path, forge):
+    tenant = Tenant(
+        name="default", vcs="gitea", host=forge.url, token="t", secret_key="s"
+    )
+    deployer = Deployer(
+        Config(id_rsa="", storage=tmp_path, tenants=[tenant], breaker_failures=1),
+        Jinja2Templates(Path(__file__).parent.parent / "templates"),
+        {"gitea": GiteaVcs},
+    )
+    storage = deployer.storage(tenant, "foo/bar")
+    await storage.save([puzzle(f"{n}-abc") for n in range(3)])
+    repo = GitRepo(uri="file:///nowhere", name="foo/bar")
+    puzzles = Puzzles(repo, storage)
+    forge.down = True
+    async with ClientSession() as cs:
+        tickets = OutboxTickets(
+            TicketsSimple(GiteaVcs(cs, repo, tenant), deployer.templates),
+            deployer.outbox,
+            tenant,
+            repo,
+        )
+        await puzzles.expose(await puzzles.load(), tickets)
+        await puzzles.expose(await puzzles.load(), tickets)
+    assert forge.calls["unavailable"] == 1
+    assert len(Outbox(tmp_path / "outbox").pending()) == 3
+    assert await Drainer(deployer.outbox, deployer.redeliver).drain() == 0
+    forge.down = False
+    deployer.outbox.breaker(forge.url).succeeded()
+    assert await Drainer(deployer.outbox, deployer.redeliver).drain() == 3
+    assert all(p.issue for p in await puzzles.load())
+    assert len(forge.issues["foo/bar"]) == 3
+    assert deployer.outbox.pending() == []
+    assert list((tmp_path / "outbox").iterdir()) == []
+
+
+async def test_refused_ticket_fails_alone_without_opening_the_breaker(tmp_path, forge):
+    tenant = Tenant(
+        name="default", vcs="gitea", host=forge.url, token="t", secret_key="s"
+    )
+    deployer = Deployer(
+        Config(id_rsa="", storage=tmp_path, tenants=[tenant], breaker_failures=1),
+        Jinja2Templates(Path(__file__).parent.parent / "templates"),
+        {"gitea": GiteaVcs},
+    )
+    storage = deployer.storage(tenant, "foo/bar")
+    await storage.save(
+        [puzzle("0-abc", alive=False, issue=issue("404")), puzzle("1-abc")]
+    )
+    repo = GitRepo(uri="file:///nowhere", name="foo/bar")
+    puzzles = Puzzles(repo, storage)
+    failed = TICKETS_FAILED.value(operation="close")
+    async with ClientSession() as cs:
+        tickets = OutboxTickets(
+            IsolatedTickets(
+                TicketsSimple(GiteaVcs(cs, repo, tenant), deployer.templates), repo
+            ),
+            deployer.outbox,
+            tenant,
+            repo,
+        )
+        await puzzles.expose(await puzzles.load(), tickets)
+    assert TICKETS_FAILED.value(operation="close") == failed + 1
+    assert not deployer.outbox.breaker(forge.url).open
+    assert deployer.outbox.pending() == []
+    assert len(forge.issues["foo/bar"]) == 1
+    await deployer.outbox.add(
+        Pending(
+            "default",
+            forge.url,
+            repo.uri,
+            "foo/bar",
+            "master",
+            "",
+            {},
+            "close",
+            "0-abc",
+        )
+    )
+    assert await Drainer(deployer.outbox, deployer.redeliver).drain() == 1
+    assert TICKETS_FAILED.value(operation="close") == failed + 2
+    assert not deployer.outbox.breaker(forge.url).open
@@ -0,0 +1,138 @@
+import asyncio
+import io
+
+import pytest
+
+from onepdd.pipeline import ItemCancelledError, Pipeline, Stage
+from onepdd.tracing import StreamSpanExporter, Tracer
+
+
+async def test_items_overlap_across_stages():
+    second_fetched = asyncio.Event()
+
+    async def fetch(item: int) -> bool:
+        if item == 1:
+            second_fetched.set()
+        return True
+
+    async def publish(item: int) -> bool:
+        if item == 0:
+            await second_fetched.wait()
+        return True
+
+    pipeline = Pipeline([Stage("fetch", fetch), Stage("publish", publish)])
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(pipeline.run(0), pipeline.run(1)), timeout=1
+        )
+    finally:
+        await pipeline.close()
+
+
+async def test_stopped_and_failed_items_are_finished():
+    finished, published = [], []
+
+    async def scan(item: str) -> bool:
+        if item == "broken":
+            raise ValueError(item)
+        return item != "unchanged"
+
+    async def publish(item: str) -> bool:
+        published.append(item)
+        return True
+
+    async def finish(item: str):
+        finished.append(item)
+
+    pipeline = Pipeline([Stage("scan", scan), Stage("publish", publish)], finish)
+    try:
+        await pipeline.run("changed")
+        await pipeline.run("unchanged")
+        with pytest.raises(ValueError):
+            await pipeline.run("broken")
+    finally:
+        await pipeline.close()
+    assert published == ["changed"]
+    assert finished == ["changed", "unchanged", "broken"]
+
+
+async def test_cheapest_item_goes_first():
+    started, order = asyncio.Event(), []
+    gate = asyncio.Event()
+
+    async def fetch(item: int) -> bool:
+        started.set()
+        await gate.wait()
+        order.append(item)
+        return True
+
+    pipeline = Pipeline([Stage("fetch", fetch)], priority=lambda item: item)
+    try:
+        first = asyncio.create_task(pipeline.run(1000))
+        await started.wait()
+        rest = [asyncio.create_task(pipeline.run(cost)) for cost in (50, 1, 10)]
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(first, *rest)
+    finally:
+        await pipeline.close()
+    assert order == [1000, 1, 10, 50]
+
+
+async def test_cancel_stops_items_only_in_cancellable_stages():
+    fetching, saving, release = asyncio.Event(), asyncio.Event(), asyncio.Event()
+    cancelled = []
+
+    async def fetch(item: str) -> bool:
+        if item == "old":
+            fetching.set()
+            try:
+                await release.wait()
+            except asyncio.CancelledError:
+                cancelled.append(item)
+                raise
+        return True
+
+    async def save(item: str) -> bool:
+        saving.set()
+        await release.wait()
+        return True
+
+    pipeline = Pipeline([Stage("fetch", fetch, cancellable=True), Stage("save", save)])
+    try:
+        old = asyncio.create_task(pipeline.run("old"))
+        await fetching.wait()
+        assert pipeline.cancel("old")
+        with pytest.raises(ItemCancelledError):
+            await old
+        assert cancelled == ["old"]
+        new = asyncio.create_task(pipeline.run("new"))
+        await saving.wait()
+        assert not pipeline.cancel("new")
+        release.set()
+        await new
+    finally:
+        await pipeline.close()
+
+
+async def test_stages_work_in_the_trace_of_their_item():
+    tracer, parents = Tracer(StreamSpanExporter(io.StringIO())), {}
+
+    async def fetch(item: str) -> bool:
+        with tracer.span("git.clone") as s:
+            await asyncio.sleep(0)
+            parents[item] = (s.trace_id, s.parent_span_id)
+        return True
+
+    async def hook(item: str):
+        with tracer.span(f"hook.{item}") as root:
+            await pipeline.run(item)
+        return root.trace_id, root.span_id
+
+    pipeline = Pipeline([Stage("fetch", fetch), Stage("scan", fetch)])
+    try:
+        roots = await asyncio.gather(hook("a"), hook("b"))
+    finally:
+        await pipeline.close()
+    assert roots[0][0] != roots[1][0]
+    assert [parents["a"], parents["b"]] == list(roots)
@@ -0,0 +1,50 @@
+import asyncio
+import logging
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from onepdd.api import ProfileApi
+from onepdd.metrics import LOOP_STALLS
+from onepdd.profiling import LoopMonitor, sampled
+
+
+def blocking_for_a_while():
+    time.sleep(0.3)
+
+
+async def test_loop_monitor_logs_blocking_stack(caplog):
+    stalls = LOOP_STALLS.value()
+    monitor = asyncio.create_task(LoopMonitor(threshold=0.1, interval=0.01).run())
+    await asyncio.sleep(0.05)
+    with caplog.at_level(logging.WARNING, logger="onepdd.profiling"):
+        blocking_for_a_while()
+        await asyncio.sleep(0.05)
+    monitor.cancel()
+    assert LOOP_STALLS.value() == stalls + 1
+    assert "blocking_for_a_while" in caplog.text
+
+
+def test_sampled_folds_stacks():
+    done = threading.Event()
+    worker = threading.Thread(target=done.wait)
+    worker.start()
+    try:
+        folded = sampled(0.05, interval=0.01)
+    finally:
+        done.set()
+        worker.join()
+    assert any("threading.Event.wait" in line for line in folded.splitlines())
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in folded.splitlines())
+
+
+async def test_profile_needs_admin_token():
+    with pytest.raises(HTTPException) as e:
+        await ProfileApi(None).handle(0.01, "Bearer anything")
+    assert e.value.status_code == 401
+    with pytest.raises(HTTPException):
+        await ProfileApi("secret").handle(0.01, "Bearer wrong")
+    response = await ProfileApi("secret").handle(0.01, "Bearer secret")
+    assert "attachment" in response.headers["content-disposition"]
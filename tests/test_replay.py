@@ -0,0 +1,52 @@
+import pytest
+
+from benchmarks.replay import OfflineVcs, OfflineWriteError, RecordedRepo, replay
+
+
+def gopdd(n: int) -> dict:
+    return {
+        "id": f"{n}-abc",
+        "ticket": "1",
+        "estimate": 30,
+        "role": "DEV",
+        "lines": "1-2",
+        "body": f"puzzle {n}",
+        "file": "src/main.py",
+        "author": "alice",
+        "email": "alice@example.com",
+        "time": "2024-01-01T00:00:00+00:00",
+    }
+
+
+def push(puzzles: list[int]) -> dict:
+    return {
+        "hook": "gitea",
+        "payload": {
+            "repository": {
+                "id": "1",
+                "name": "bar",
+                "full_name": "foo/bar",
+                "html_url": "https://git.acme.com/foo/bar",
+                "ssh_url": "git@git.acme.com:foo/bar.git",
+                "clone_url": "https://git.acme.com/foo/bar.git",
+                "default_branch": "master",
+            },
+            "ref": "refs/heads/master",
+            "after": "abc",
+        },
+        "gopdd": [gopdd(n) for n in puzzles],
+    }
+
+
+async def test_replay_reports_operations_without_a_forge():
+    report = await replay([push([1, 2]), push([1, 2, 3])])
+    assert (report["pushes"], report["repos"]) == (2, 1)
+    assert report["operations"] == {"create_issue": 3}
+    assert report["log"][0]["title"].endswith("puzzle 1")
+
+
+async def test_offline_forge_refuses_writes():
+    vcs = OfflineVcs(RecordedRepo("foo/bar", []), "gitea")
+    assert not (await vcs.issue("1")).closed
+    with pytest.raises(OfflineWriteError, match="create_issue"):
+        await vcs.create_issue("title", "body")
@@ -1,6 +1,12 @@
+import asyncio
+import shlex
+from pathlib import Path
+
 import pytest
 
+from benchmarks.synthetic import make_repo
 from onepdd.repo import GitRepo, GopddPuzzle
+from onepdd.util import exec_cmd_shell
 
 
 @pytest.fixture()
@@ -219,3 +225,73 @@ async def test_repo_gets_deleted():
         assert repo.path.exists()
         path = repo.path
     assert not path.exists()
+
+
+async def test_local_repo_gets_deleted(local_repo_uri):
+    async with GitRepo(uri=local_repo_uri, name="bench/synthetic") as repo:
+        assert (repo.path / "pkg0" / "module_0.py").exists()
+        path = repo.path
+    assert not path.exists()
+
+
+async def test_remote_head_matches_clone(local_repo_uri):
+    async with GitRepo(uri=local_repo_uri, name="bench/synthetic") as repo:
+        assert await repo.remote_head() == await repo.revision()
+
+
+async def test_cached_clone_is_reused(local_repo_uri, tmp_path):
+    async with GitRepo(uri=local_repo_uri, name="a/b", cache_dir=tmp_path) as repo:
+        first = await repo.revision()
+    async with GitRepo(uri=local_repo_uri, name="a/b", cache_dir=tmp_path) as repo:
+        assert repo.path.exists()
+        assert await repo.revision() == first
+
+
+async def test_fork_borrows_objects_from_upstream_store(tmp_path):
+    upstream = make_repo(tmp_path / "upstream", files=200, puzzles=3)
+    fork = tmp_path / "fork"
+    await exec_cmd_shell(
+        f"git clone --quiet {upstream} {fork}"
+        f" && echo '# fork' >> {fork}/pkg0/module_0.py"
+        f" && git -C {fork} commit --quiet -am fork"
+    )
+    async with GitRepo(
+        uri=fork.as_uri(),
+        name="me/fork",
+        cache_dir=tmp_path / "borrowed",
+        object_store=tmp_path / "objects",
+        upstream=upstream.as_uri(),
+    ) as repo:
+        alternates = repo.path / ".git" / "objects" / "info" / "alternates"
+        assert alternates.read_text().strip() == str(repo.store / "objects")
+        assert "# fork" in (repo.path / "pkg0" / "module_0.py").read_text()
+        borrowed = await repo.disk_usage()
+    async with GitRepo(
+        uri=fork.as_uri(), name="me/fork", cache_dir=tmp_path / "alone"
+    ) as repo:
+        assert await repo.disk_usage() > borrowed
+
+
+async def test_cancelled_clone_leaves_nothing_to_pull(
+    local_repo_uri, tmp_path, monkeypatch
+):
+    started = asyncio.Event()
+
+    async def hanging_clone(cmd: str) -> str:
+        if not cmd.startswith("git clone"):
+            return await exec_cmd_shell(cmd)
+        (Path(shlex.split(cmd)[-1]) / ".git").mkdir(parents=True)
+        started.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr("onepdd.repo.exec_cmd_shell", hanging_clone)
+    repo = GitRepo(uri=local_repo_uri, name="a/b", cache_dir=tmp_path)
+    task = asyncio.create_task(repo.__aenter__())
+    await started.wait()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert not repo.path.exists()
+    assert not list(tmp_path.glob(f".{repo.id}.*"))
+    monkeypatch.undo()
+    async with GitRepo(uri=local_repo_uri, name="a/b", cache_dir=tmp_path) as repo:
+        assert await repo.revision()
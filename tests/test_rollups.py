@@ -0,0 +1,52 @@
+from onepdd.rollups import Rollups
+from tests.conftest import issue, puzzle
+
+
+def owned(author: str, role: str, estimate: int, closed: str | None = None) -> dict:
+    return puzzle(
+        author=author,
+        role=role,
+        estimate=estimate,
+        alive=closed is None,
+        issue=issue("1", closed) if closed else None,
+    )
+
+
+def test_rollups_replace_repo_contribution(tmp_path):
+    rollups = Rollups(tmp_path / "rollups.json")
+    rollups.update(
+        "default/foo/a", [owned("alice", "DEV", 30), owned("bob", "DEV", 15)]
+    )
+    rollups.update("default/foo/b", [owned("alice", "ARC", 60)])
+    assert rollups.by("author")["alice"]["estimate"] == 90
+    rollups.update(
+        "default/foo/a",
+        [owned("alice", "DEV", 30, closed="2024-01-01T01:30:00+00:00")],
+    )
+    by_author = rollups.by("author")
+    assert set(by_author) == {"alice"}
+    assert by_author["alice"]["puzzles"] == 2
+    assert by_author["alice"]["alive_estimate"] == 60
+    assert by_author["alice"]["latency"]["p50"] == 2 * 3600
+    assert rollups.by("role")["DEV"]["closed"] == 1
+    assert set(rollups.by("repo")) == {"default/foo/a", "default/foo/b"}
+
+
+async def test_rollups_survive_restart(tmp_path):
+    rollups = Rollups(tmp_path / "rollups.json")
+    rollups.update("default/foo/a", [owned("alice", "DEV", 30)])
+    await rollups.flush()
+    restarted = Rollups(tmp_path / "rollups.json")
+    assert restarted.by("repo") == rollups.by("repo")
+    restarted.update("default/foo/a", [])
+    assert restarted.by("author") == {}
+
+
+def test_rollups_take_naive_times_as_utc(tmp_path):
+    rollups = Rollups(tmp_path / "rollups.json")
+    naive = {
+        **owned("alice", "DEV", 30, closed="2024-01-01T02:00:00+00:00"),
+        "time": "2024-01-01T00:00:00",
+    }
+    rollups.update("default/foo/a", [naive])
+    assert rollups.by("author")["alice"]["latency"]["p50"] == 2 * 3600
@@ -0,0 +1,64 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from onepdd.registry import KnownRepo, RepoRegistry
+from onepdd.scheduler import ResyncScheduler, ls_remote
+
+
+@pytest.fixture
+def deployer(tmp_path):
+    deployer = Mock(in_flight=0, deploy=AsyncMock())
+    deployer.registry = RepoRegistry(tmp_path / "repos.json")
+    deployer.registry.record(KnownRepo("default", "uri-a", "foo/a", sha="aaa"))
+    deployer.registry.record(KnownRepo("default", "uri-b", "foo/b", sha="bbb"))
+    return deployer
+
+
+def scheduler(deployer, heads: dict[str, str]) -> ResyncScheduler:
+    async def probe(repo: KnownRepo) -> str:
+        return heads[repo.name]
+
+    resync = ResyncScheduler(deployer, interval=60, max_in_flight=2, probe=probe)
+    resync._started = 1000
+    return resync
+
+
+async def test_resync_deploys_changed_repos_once_per_interval(deployer):
+    resync = scheduler(deployer, {"foo/a": "aaa", "foo/b": "ccc"})
+    assert resync.due(1000) == []
+    assert await resync.cycle(1060)
+    await asyncio.sleep(0)
+    deployer.deploy.assert_awaited_once()
+    job = deployer.deploy.await_args.args[0]
+    assert (job.name, job.head) == ("foo/b", "ccc")
+    assert resync.due(1061) == []
+    assert {r.name for r in resync.due(1120)} == {"foo/a", "foo/b"}
+
+
+async def test_resync_backs_off_under_pressure(deployer):
+    deployer.in_flight = 2
+    resync = scheduler(deployer, {"foo/a": "xxx", "foo/b": "yyy"})
+    assert not await resync.cycle(1060)
+    deployer.deploy.assert_not_awaited()
+    assert len(resync.due(1060)) == 2
+
+
+def test_resync_staggers_repos(tmp_path):
+    deployer = Mock()
+    deployer.registry = RepoRegistry(tmp_path / "repos.json")
+    resync = ResyncScheduler(deployer, interval=3600)
+    slots = {
+        resync.slot(KnownRepo("default", "uri", f"org/repo-{i}"), 3600)
+        for i in range(100)
+    }
+    assert len(slots) > 90
+    assert max(slots) - min(slots) > 3000
+
+
+async def test_probe_sets_up_the_configured_key(local_repo_uri, tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    head = await ls_remote(KnownRepo("default", local_repo_uri, "foo/a"), "KEY")
+    assert len(head) == 40
+    assert (tmp_path / ".ssh" / "id_rsa").read_text() == "KEY"
@@ -0,0 +1,76 @@
+import json
+import sys
+
+import pytest
+
+from onepdd import state
+from onepdd.storage import SimpleFsStorage
+
+PUZZLES = [
+    {"id": f"{n}-abc", "body": "fix it " * 10, "alive": True, "issue": None}
+    for n in range(20)
+]
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip", "auto"])
+async def test_state_round_trips(temporary_file, compression):
+    storage = SimpleFsStorage(temporary_file, compression, sha="abc")
+    await storage.save(PUZZLES)
+    assert await storage.load() == PUZZLES
+    header = storage.header()
+    assert (header["version"], header["count"], header["sha"]) == (
+        state.VERSION,
+        20,
+        "abc",
+    )
+    assert header["deployed"]
+
+
+async def test_state_reads_legacy_json(temporary_file):
+    temporary_file.write_text(json.dumps(PUZZLES))
+    storage = SimpleFsStorage(temporary_file)
+    assert await storage.load() == PUZZLES
+    assert storage.header()["count"] == 20
+
+
+def test_state_keeps_uneven_records():
+    uneven = [{"id": "1"}, {"id": "2", "extra": True}]
+    assert state.loads(state.dumps(uneven)) == uneven
+
+
+def test_state_compresses():
+    assert len(state.dumps(PUZZLES, "gzip")) < len(json.dumps(PUZZLES)) / 4
+
+
+def test_state_rejects_newer_versions():
+    with pytest.raises(state.StateFormatError):
+        state.loads(b"ONEPDD/99 {}\n[]")
+
+
+async def test_state_view_reads_statuses_from_index(temporary_file):
+    puzzles = [
+        *PUZZLES[:2],
+        {"id": "x", "body": "b", "alive": False, "issue": {"closed": None}},
+    ]
+    await SimpleFsStorage(temporary_file).save(puzzles)
+    with state.StateView(temporary_file) as view:
+        assert view.header["layout"] == "indexed"
+        statuses = view.statuses()
+        assert statuses["x"].to_be_closed
+        assert statuses["0-abc"].to_be_opened
+        assert view.puzzle("1-abc") == PUZZLES[1]
+        assert view.puzzle("missing") is None
+
+
+async def test_state_view_reads_compressed_state(temporary_file):
+    await SimpleFsStorage(temporary_file, "gzip").save(PUZZLES)
+    assert set(await SimpleFsStorage(temporary_file).statuses()) == {
+        p["id"] for p in PUZZLES
+    }
+
+
+def test_zstd_without_zstandard_is_refused_upfront(monkeypatch):
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+    with pytest.raises(state.StateFormatError, match="zstd extra"):
+        state.resolved("zstd")
+    assert state.resolved("auto") == "gzip"
@@ -0,0 +1,143 @@
+from pathlib import Path
+
+import pytest
+
+from onepdd.resp import RespPool
+from onepdd.storage import (
+    JournalStorage,
+    RedisStorage,
+    SimpleFsStorage,
+    StorageConflictError,
+)
+from tests.conftest import issue, puzzle
+from tests.fake_redis import FakeRedis
+
+
+@pytest.fixture
+async def server():
+    async with FakeRedis() as server:
+        yield server
+
+
+@pytest.fixture
+async def pool(server):
+    pool = RespPool(server.url)
+    yield pool
+    await pool.close()
+
+
+async def test_redis_storage_roundtrip(pool):
+    storage = RedisStorage.from_vcs(pool, "gitea", "foo/bar")
+    assert await storage.load() == []
+    await storage.save([puzzle("2-b"), puzzle("1-a")])
+    assert await RedisStorage.from_vcs(pool, "gitea", "foo/bar").load() == [
+        puzzle("2-b"),
+        puzzle("1-a"),
+    ]
+
+
+async def test_redis_storage_writes_only_changes(pool, server):
+    storage = RedisStorage.from_vcs(pool, "gitea", "foo/bar")
+    await storage.load()
+    await storage.save([puzzle("1-a"), puzzle("2-b"), puzzle("3-c")])
+    server.commands.clear()
+    await storage.save([puzzle("1-a"), puzzle("2-b", alive=False)])
+    hset, hdel = [c for c in server.commands if c[0] in ("HSET", "HDEL")]
+    assert hset[:3] == ("HSET", "onepdd:gitea-foo/bar", "puzzle:2-b")
+    assert len(hset) == 4
+    assert hdel == ("HDEL", "onepdd:gitea-foo/bar", "puzzle:3-c")
+    assert server.hashes["onepdd:gitea-foo/bar"]["version"] == "2"
+
+
+async def test_redis_storage_detects_concurrent_save(pool):
+    first = RedisStorage.from_vcs(pool, "gitea", "foo/bar")
+    second = RedisStorage.from_vcs(pool, "gitea", "foo/bar")
+    await first.load()
+    await second.load()
+    await first.save([puzzle("1-a")])
+    with pytest.raises(StorageConflictError):
+        await second.save([puzzle("2-b")])
+    assert await second.load() == [puzzle("1-a")]
+    await second.save([puzzle("2-b")])
+
+
+async def test_redis_storage_load_many(pool):
+    await RedisStorage.from_vcs(pool, "gitea", "foo/bar").save([puzzle("1-a")])
+    await RedisStorage.from_vcs(pool, "gitea", "foo/baz").save([puzzle("2-b")])
+    assert await RedisStorage.load_many(
+        pool, ["onepdd:gitea-foo/bar", "onepdd:gitea-foo/baz", "onepdd:gitea-nope"]
+    ) == {
+        "onepdd:gitea-foo/bar": [puzzle("1-a")],
+        "onepdd:gitea-foo/baz": [puzzle("2-b")],
+        "onepdd:gitea-nope": [],
+    }
+
+
+async def test_journal_storage_appends_transitions(tmp_path: Path):
+    storage = JournalStorage(tmp_path / "foo")
+    await storage.save([puzzle("1-a"), puzzle("2-b")])
+    await storage.save([puzzle("1-a", issue=issue("7")), puzzle("2-b")])
+    await storage.save([puzzle("1-a", alive=False, issue=issue("7")), puzzle("2-b")])
+    closed = puzzle("1-a", alive=False, issue=issue("7", "2024-01-01T00:00:00+00:00"))
+    await storage.save([closed, puzzle("2-b")])
+    await storage.save([closed, {**puzzle("2-b"), "lines": "4-6"}])
+    assert [(e["op"], e["id"]) for e in await storage.history()] == [
+        ("added", "1-a"),
+        ("added", "2-b"),
+        ("opened", "1-a"),
+        ("died", "1-a"),
+        ("closed", "1-a"),
+        ("changed", "2-b"),
+    ]
+    assert await JournalStorage(tmp_path / "foo").load() == [
+        closed,
+        {**puzzle("2-b"), "lines": "4-6"},
+    ]
+
+
+async def test_journal_storage_snapshots_and_keeps_history(tmp_path: Path):
+    storage = JournalStorage(tmp_path / "foo", snapshot_every=3)
+    await storage.save([puzzle("1-a"), puzzle("2-b")])
+    await storage.save([puzzle("1-a"), puzzle("2-b"), puzzle("3-c")])
+    await storage.save([puzzle("1-a", alive=False), puzzle("3-c")])
+    assert sorted(f.name for f in (tmp_path / "foo").iterdir()) == [
+        "journal-000000000003.jsonl",
+        "journal.jsonl",
+        "snapshot-000000000003",
+    ]
+    assert await JournalStorage(tmp_path / "foo").load() == [
+        puzzle("1-a", alive=False),
+        puzzle("3-c"),
+    ]
+    assert [e["op"] for e in await storage.history()] == [
+        "added",
+        "added",
+        "added",
+        "died",
+        "removed",
+    ]
+
+
+async def test_journal_storage_survives_a_torn_append(tmp_path: Path):
+    storage = JournalStorage(tmp_path / "foo")
+    await storage.save([puzzle("1-a")])
+    with (tmp_path / "foo" / "journal.jsonl").open("a") as f:
+        f.write('{"seq": 2, "op": "di')
+    storage = JournalStorage(tmp_path / "foo")
+    assert await storage.load() == [puzzle("1-a")]
+    await storage.save([puzzle("1-a"), puzzle("2-b")])
+    assert await JournalStorage(tmp_path / "foo").load() == [
+        puzzle("1-a"),
+        puzzle("2-b"),
+    ]
+
+
+async def test_journal_storage_starts_from_existing_state(tmp_path: Path):
+    await SimpleFsStorage.from_vcs(tmp_path, "gitea", "foo/bar").save([puzzle("1-a")])
+    storage = JournalStorage.from_vcs(tmp_path, "gitea", "foo/bar")
+    await storage.save([puzzle("1-a"), puzzle("2-b")])
+    assert [e["id"] for e in await storage.history()] == ["2-b"]
+    assert await JournalStorage.from_vcs(tmp_path, "gitea", "foo/bar").load() == [
+        puzzle("1-a"),
+        puzzle("2-b"),
+    ]
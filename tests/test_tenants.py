@@ -0,0 +1,158 @@
+import asyncio
+import time
+
+import pytest
+
+from onepdd.config import Budget, Config, Tenant, load_config
+from onepdd.tenants import (
+    BudgetExceededError,
+    PrioritySemaphore,
+    TenantIndex,
+    TenantLimits,
+    TokenBucket,
+    UnknownTenantError,
+)
+
+
+def tenant(name: str, **kwargs) -> Tenant:
+    return Tenant(
+        **{
+            "name": name,
+            "vcs": "gitea",
+            "host": "https://git.acme.com",
+            "token": f"{name}-token",
+            "secret_key": f"{name}-secret",
+            **kwargs,
+        }
+    )
+
+
+def test_tenant_index_precedence():
+    index = TenantIndex(
+        [
+            tenant("host"),
+            tenant("org", orgs=["Acme"]),
+            tenant("repo", repos=["acme/special"]),
+            tenant("hub", vcs="github", host="https://github.com", orgs=["acme"]),
+        ]
+    )
+    url = "https://git.acme.com/acme/special"
+    assert index.tenant("gitea", url, "acme/special").name == "repo"
+    assert index.tenant("gitea", url, "acme/other").name == "org"
+    assert index.tenant("gitea", url, "someone/else").name == "host"
+    assert index.tenant("github", "https://github.com/acme/x", "acme/x").name == "hub"
+    with pytest.raises(UnknownTenantError):
+        index.tenant("github", "https://github.com/other/x", "other/x")
+
+
+def test_default_tenant_from_legacy_config(tmp_path):
+    config = Config(
+        id_rsa="",
+        storage=tmp_path,
+        gitea_token="token",
+        gitea_host="https://git.acme.com",
+        gitea_secret_key="secret",
+        tenants=[tenant("org", orgs=["acme"])],
+    )
+    index = TenantIndex(config.all_tenants)
+    assert index.tenant("gitea", "https://git.acme.com", "foo/bar").storage_prefix == (
+        "gitea"
+    )
+    assert index.tenant("gitea", "https://git.acme.com", "acme/bar").storage_prefix == (
+        "gitea-org"
+    )
+
+
+def test_load_config_tenants(tmp_path):
+    file = tmp_path / "config.yaml"
+    file.write_text(
+        f"storage_dir: {tmp_path}\n"
+        "tenants:\n"
+        "  - name: acme\n"
+        "    vcs: github\n"
+        "    host: https://github.com\n"
+        "    token: token\n"
+        "    secret_key: secret\n"
+        "    orgs: [acme]\n"
+        "    budget:\n"
+        "      concurrency: 2\n"
+        "      disk_bytes: 1000\n"
+    )
+    load_config.cache_clear()
+    try:
+        config = load_config(str(file))
+    finally:
+        load_config.cache_clear()
+    assert config.all_tenants == [
+        tenant(
+            "acme",
+            vcs="github",
+            host="https://github.com",
+            token="token",
+            secret_key="secret",
+            orgs=["acme"],
+            budget=Budget(concurrency=2, disk_bytes=1000),
+        )
+    ]
+
+
+async def test_token_bucket_waits_when_empty():
+    bucket = TokenBucket(per_minute=600)
+    for _ in range(600):
+        await bucket.acquire()
+    start = time.monotonic()
+    await bucket.acquire()
+    assert time.monotonic() - start >= 0.05
+
+
+def test_disk_budget():
+    limits = TenantLimits(tenant("acme", budget=Budget(disk_bytes=100)))
+    limits.check_disk(100)
+    with pytest.raises(BudgetExceededError):
+        limits.check_disk(101)
+
+
+async def test_priority_semaphore_lets_cheapest_in_first():
+    semaphore, order = PrioritySemaphore(1), []
+    await semaphore.acquire()
+
+    async def deploy(cost: float):
+        async with semaphore.slot(cost):
+            order.append(cost)
+
+    waiters = [asyncio.create_task(deploy(cost)) for cost in (50, 1, 10)]
+    await asyncio.sleep(0)
+    semaphore.release()
+    await asyncio.gather(*waiters)
+    assert order == [1, 10, 50]
+
+
+async def test_priority_semaphore_ages_expensive_waiters():
+    semaphore, order = PrioritySemaphore(1, aging=1000), []
+    await semaphore.acquire()
+
+    async def deploy(cost: float):
+        async with semaphore.slot(cost):
+            order.append(cost)
+
+    expensive = asyncio.create_task(deploy(100))
+    await asyncio.sleep(0.2)
+    cheap = asyncio.create_task(deploy(1))
+    await asyncio.sleep(0)
+    semaphore.release()
+    await asyncio.gather(expensive, cheap)
+    assert order == [100, 1]
+
+
+def test_graphql_url():
+    def tenant(host: str, api_url: str = "") -> Tenant:
+        return Tenant("t", "github", host, "token", "secret", api_url=api_url)
+
+    assert tenant("https://github.com").graphql_url == "https://api.github.com/graphql"
+    assert (
+        tenant("https://ghe.acme.com").graphql_url == "https://ghe.acme.com/api/graphql"
+    )
+    assert (
+        tenant("https://github.com", "https://proxy.acme.com/").graphql_url
+        == "https://proxy.acme.com/graphql"
+    )
@@ -0,0 +1,75 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+from onepdd.tracing import (
+    BackgroundSpanExporter,
+    StreamSpanExporter,
+    Tracer,
+    propagation_headers,
+)
+
+
+@pytest.fixture
+def output():
+    return io.StringIO()
+
+
+@pytest.fixture
+def tracer(output):
+    return Tracer(StreamSpanExporter(output))
+
+
+def exported(output: io.StringIO) -> list[dict]:
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+async def test_spans_propagate_through_awaits(tracer, output):
+    async def child(name: str):
+        with tracer.span(name):
+            await asyncio.sleep(0)
+
+    with tracer.span("hook.gitea", repo="foo/bar") as root:
+        await asyncio.gather(child("git.clone"), child("gopdd.scan"))
+    spans = {s["name"]: s for s in exported(output)}
+    assert set(spans) == {"hook.gitea", "git.clone", "gopdd.scan"}
+    assert {s["traceId"] for s in spans.values()} == {root.trace_id}
+    assert spans["git.clone"]["parentSpanId"] == root.span_id
+    assert spans["gopdd.scan"]["parentSpanId"] == root.span_id
+    assert spans["hook.gitea"]["parentSpanId"] == ""
+    assert spans["hook.gitea"]["attributes"] == [
+        {"key": "repo", "value": {"stringValue": "foo/bar"}}
+    ]
+
+
+def test_span_continues_remote_trace(tracer, output):
+    with tracer.span(
+        "hook.gitea", "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+    ) as s:
+        assert propagation_headers() == {
+            "traceparent": f"00-0af7651916cd43dd8448eb211c80319c-{s.span_id}-01"
+        }
+    assert exported(output)[0]["parentSpanId"] == "b7ad6b7169203331"
+    assert propagation_headers() == {}
+
+
+def test_span_records_error(tracer, output):
+    with pytest.raises(ValueError):
+        with tracer.span("storage.save"):
+            raise ValueError("disk is full")
+    assert exported(output)[0]["status"] == {
+        "code": "STATUS_CODE_ERROR",
+        "message": "ValueError: disk is full",
+    }
+
+
+def test_background_exporter_keeps_span_order(output):
+    exporter = BackgroundSpanExporter(StreamSpanExporter(output))
+    tracer = Tracer(exporter)
+    for n in range(50):
+        with tracer.span(f"span-{n}"):
+            pass
+    exporter.close()
+    assert [s["name"] for s in exported(output)] == [f"span-{n}" for n in range(50)]
@@ -0,0 +1,27 @@
+import asyncio
+import os
+from pathlib import Path
+
+from onepdd.util import exec_cmd_shell
+
+
+def alive(pid: int) -> bool:
+    stat = Path(f"/proc/{pid}/stat")
+    return stat.exists() and stat.read_text().split(")")[-1].split()[0] != "Z"
+
+
+async def test_cancel_kills_the_whole_command(tmp_path: Path):
+    pidfile = tmp_path / "pid"
+    task = asyncio.create_task(
+        exec_cmd_shell(f"cd / && (sleep 30 & echo $! > {pidfile}; wait)")
+    )
+    while not pidfile.exists() or not pidfile.read_text().strip():
+        await asyncio.sleep(0.01)
+    pid = int(pidfile.read_text())
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    for _ in range(50):
+        if not alive(pid):
+            break
+        await asyncio.sleep(0.05)
+    assert not alive(pid)